@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Bot API HTTP ulanishlari uchun benchmark.
+
+Lokal soxta Bot API serveri (har bir javob --latency soniya kechikadi)
+ishga tushiriladi va bir nechta so‘rov sozlamalari bilan parallel
+getChatMember so‘rovlari yuboriladi:
+ - HTTPXRequest() — python-telegram-bot standart obyekti (1 ta ulanish);
+ - ApplicationBuilder standarti (256 ta ulanish, keep-alive 5 soniya);
+ - bot.build_api_request() — bot ishlatadigan sozlangan obyekt.
+
+Har bir sozlama --rounds marta o‘lchanadi, raundlar orasida --idle soniya
+tanaffus qilinadi: keep-alive muddati qisqa bo‘lsa, har bir raund yangi
+ulanishlar ochadi (real Bot API’da bu TLS handshake degani).
+
+Ishga tushirish:
+    python bench_http.py --requests 2000 --concurrency 200 --latency 0.02
+    python bench_http.py --rounds 3 --idle 8
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qsl
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+import bot as botmod
+
+TOKEN = "123456:bench"
+
+
+# ---------------------------
+# Soxta Bot API serveri (HTTP/1.1, keep-alive)
+# ---------------------------
+
+class FakeBotAPI:
+    def __init__(self, latency: float, method_latency: Optional[Dict[str, float]] = None,
+                 member_status: str = "member"):
+        self.latency = latency
+        self.method_latency = method_latency or {}
+        self.member_status = member_status
+        self.connections = 0
+        self.requests = 0
+        self.calls: Dict[str, int] = {}
+        self.server = None
+        self._message_id = 0
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if method == "getChatMember":
+            return {
+                "status": self.member_status,
+                "user": {"id": int(params.get("user_id", 1)), "is_bot": False, "first_name": "u"},
+            }
+        if method == "getChatAdministrators":
+            return [{"status": "creator", "is_anonymous": False, "user": {"id": 1, "is_bot": False, "first_name": "admin"}}]
+        if method == "getChat":
+            return {"id": int(params.get("chat_id", -100)), "type": "channel", "title": "kanal"}
+        if method == "sendMessage":
+            self._message_id += 1
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 1)), "type": "supergroup"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                path = lines[0].split(" ")[1]
+                headers = {
+                    k.strip().lower(): v.strip()
+                    for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)
+                }
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if headers.get("content-type", "").startswith("application/json"):
+                    params = json.loads(body) if body else {}
+                else:
+                    params = dict(parse_qsl(body.decode()))
+
+                api_method = path.rsplit("/", 1)[-1]
+                self.requests += 1
+                self.calls[api_method] = self.calls.get(api_method, 0) + 1
+                await asyncio.sleep(self.method_latency.get(api_method, self.latency))
+
+                payload = json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(payload)).encode() + b"\r\n"
+                    b"\r\n" + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+# ---------------------------
+# O‘lchash
+# ---------------------------
+
+async def run_round(bot: Bot, total: int, concurrency: int):
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                await bot.get_chat_member(chat_id=-100, user_id=i)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - t0, latencies, errors
+
+
+async def run_case(name: str, request: HTTPXRequest, port: int, api: FakeBotAPI, args):
+    bot = Bot(TOKEN, base_url=f"http://127.0.0.1:{port}/bot", request=request)
+    await bot.initialize()
+    api.connections = 0
+
+    elapsed, latencies, errors = 0.0, [], 0
+    for r in range(args.rounds):
+        if r:
+            await asyncio.sleep(args.idle)
+        e, l, err = await run_round(bot, args.requests, args.concurrency)
+        elapsed += e
+        latencies += l
+        errors += err
+    await bot.shutdown()
+
+    total = args.requests * args.rounds
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000 if latencies else 0.0
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0
+    print(
+        f"{name:<40} {total / elapsed:9.0f} req/s  p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  "
+        f"yangi ulanishlar {api.connections:4d}  xatolar {errors}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--idle", type=float, default=0.0)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency)
+    port = await api.start()
+
+    cases = [
+        ("HTTPXRequest() (1 ulanish)", HTTPXRequest(pool_timeout=None)),
+        ("ApplicationBuilder standarti (256)", HTTPXRequest(connection_pool_size=256)),
+        (f"build_api_request() ({botmod.API_POOL_SIZE})", botmod.build_api_request()),
+    ]
+    for name, request in cases:
+        await run_case(name, request, port, api, args)
+
+    await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
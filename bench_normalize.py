@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Matnni normallashtirish uchun benchmark.
+
+Oddiy chat xabarlari (lotin va kirill o‘zbekcha) hamda niqoblangan
+reklamalar (o‘xshash harflar, ko‘rinmas belgilar, "t . me" bo‘shliqlari,
+matematik shriftlar) aralashmasi yaratiladi va har bir xabar uchun
+o‘lchanadi:
+ - normalize_text() — keshsiz (har xabar yangi);
+ - havola va kalit so‘z filtrlari birgalikda (LinkFilter + KeywordFilter),
+   normallashtirish bir marta bajarilishi bilan.
+
+Havola+kalit so‘z p99 qiymati --budget mikrosoniyadan oshsa yoki oddiy
+gaplardan (FALSE_POSITIVES) birortasi havola deb topilsa, skript 1 kodi
+bilan tugaydi (CI uchun).
+
+Ishga tushirish:
+    python bench_normalize.py --messages 20000 --budget 40
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+
+import moderation
+from storage import DEFAULT_BANNED_KEYWORDS
+
+PLAIN = [
+    "Assalomu alaykum, bugun dars soat nechida boshlanadi?",
+    "Ertaga uchrashamiz, manzilni yozib yuboring iltimos",
+    "Ассалому алайкум, бугун ҳаво жуда яхши экан",
+    "Rahmat, hammasi tushunarli bo‘ldi 👍",
+    "Kim o‘zbekiston.uz saytidagi yangilikni o‘qidi?",
+    "Narxi 5.5 ming so‘m, ertaga olib kelaman",
+]
+
+ADS = [
+    "Tez pul ishlash! t . me / pul_kanal ga qo‘shiling",
+    "саsіno bonus 100% — t.mе/kazino_uz",
+    "ka​zi​no va stavka, faqat bugun",
+    "𝐅𝐑𝐄𝐄 𝐅𝐎𝐋𝐋𝐎𝐖𝐄𝐑𝐒 ｔ.ｍｅ/ｆｏｌｌｏｗ",
+    "Реклама: kazino [.] com saytiga kiring",
+    "t dot me/earn_money — work from home",
+]
+
+# Havola emas: gap oxiridagi nuqta va kirillcha matn (o‘xshash harflar)
+FALSE_POSITIVES = [
+    "Kecha keldim. Online dars bo‘ladimi?",
+    "Zo‘r. Pro darajada",
+    "Salom. Info kerak",
+    "Men bugun keldim. Uz tilida yozing",
+    "Привет.Как дела",
+    "Ура.Ок",
+]
+
+KEYWORDS = DEFAULT_BANNED_KEYWORDS + ["kazino", "stavka", "реклама"]
+
+
+def make_messages(n: int, ad_ratio: float, rnd: random.Random):
+    msgs = []
+    for i in range(n):
+        base = rnd.choice(ADS if rnd.random() < ad_ratio else PLAIN)
+        # Har xabar noyob — kesh natijani buzmasligi uchun
+        msgs.append(f"{base} #{i}")
+    return msgs
+
+
+def measure(fn, items):
+    samples = []
+    t0 = time.perf_counter()
+    for x in items:
+        s = time.perf_counter()
+        fn(x)
+        samples.append(time.perf_counter() - s)
+    elapsed = time.perf_counter() - t0
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1e6
+    return len(items) / elapsed, statistics.median(samples) * 1e6, p99
+
+
+def report(case: str, result):
+    ops, p50, p99 = result
+    print(f"{case:<34} {ops:10.0f} xabar/s  p50 {p50:6.1f} µs  p99 {p99:6.1f} µs")
+
+
+def filters_check(text: str):
+    moderation.contains_url(text) or moderation.contains_tme_link(text)
+    moderation.contains_banned_keyword(text, KEYWORDS)
+
+
+def clear_caches():
+    moderation.normalize_text.cache_clear()
+    moderation.normalize_link_text.cache_clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--ad-ratio", type=float, default=0.2)
+    parser.add_argument("--budget", type=float, default=40.0, help="havola+kalit so‘z p99, µs")
+    args = parser.parse_args()
+
+    msgs = make_messages(args.messages, args.ad_ratio, random.Random(1))
+    caught = sum(1 for t in msgs if moderation.contains_tme_link(t) or moderation.contains_url(t)
+                 or moderation.contains_banned_keyword(t, KEYWORDS))
+    clear_caches()
+
+    report("normalize_text (keshsiz)", measure(moderation.normalize_text.__wrapped__, msgs))
+    clear_caches()
+    result = measure(filters_check, msgs)
+    report("havola + kalit so‘z filtrlari", result)
+    print(f"Aniqlangan: {caught} / {len(msgs)} (reklama ulushi {args.ad_ratio:.0%})")
+
+    wrong = [t for t in FALSE_POSITIVES if moderation.contains_url(t) or moderation.contains_tme_link(t)]
+    for t in wrong:
+        print(f"❌ Havola deb topildi: {t!r}")
+    if wrong:
+        sys.exit(1)
+    if result[2] > args.budget:
+        print(f"❌ p99 {result[2]:.1f} µs > byudjet {args.budget:.1f} µs")
+        sys.exit(1)
+    print(f"✅ p99 byudjet ichida ({args.budget:.1f} µs)")
+
+
+if __name__ == "__main__":
+    main()
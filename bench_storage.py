@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Saqlash dvigatellari uchun benchmark.
+
+Har bir dvigatel (SQLite, xotira, lmdb — o‘rnatilgan bo‘lsa) vaqtinchalik
+katalogda ochiladi va ikki xil yuklama o‘lchanadi:
+ - har bir xabar uchun guruh sozlamalarini o‘qish (load_group_settings);
+ - pending join yozuvlarini qo‘shish va o‘chirish (save/delete_join_message).
+
+Ishga tushirish:
+    python bench_storage.py --groups 1000 --reads 50000 --writes 5000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+import bot as botmod
+from storage import DB, LMDBStorage, MemoryStorage
+
+
+def engines(tmp: str):
+    yield "sqlite", lambda: DB(os.path.join(tmp, "bench.db"))
+    yield "memory", MemoryStorage
+    try:
+        import lmdb  # noqa: F401
+    except ImportError:
+        print("lmdb o‘rnatilmagan — o‘tkazib yuborildi (pip install lmdb)")
+        return
+    yield "lmdb", lambda: LMDBStorage(os.path.join(tmp, "bench.lmdb"))
+
+
+def measure(fn, n: int):
+    samples = []
+    t0 = time.perf_counter()
+    for i in range(n):
+        s = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - s)
+    elapsed = time.perf_counter() - t0
+    samples.sort()
+    return n / elapsed, statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99) - 1] * 1e6
+
+
+def report(name: str, case: str, result):
+    ops, p50, p99 = result
+    print(f"{name:<8} {case:<26} {ops:10.0f} op/s  p50 {p50:7.1f} µs  p99 {p99:7.1f} µs")
+
+
+def run(name: str, storage, args):
+    botmod.db = storage
+    rnd = random.Random(1)
+
+    group_ids = [-1000000000000 - i for i in range(args.groups)]
+    for gid in group_ids:
+        storage.set_required_channels(gid, [str(-1001000000000 - gid % 7)])
+        storage.set_banned_keywords(gid, ["kazino", "stavka", "reklama"])
+
+    reads = [rnd.choice(group_ids) for _ in range(args.reads)]
+    report(name, "sozlamalarni o‘qish", measure(lambda i: botmod.load_group_settings(reads[i]), args.reads))
+
+    writes = [(rnd.randrange(1, 10**9), rnd.choice(group_ids)) for _ in range(args.writes)]
+    report(
+        name, "pending yozish",
+        measure(lambda i: storage.save_join_message(writes[i][0], writes[i][1], writes[i][1], i), args.writes),
+    )
+    report(
+        name, "pending o‘chirish",
+        measure(lambda i: storage.delete_join_messages(writes[i][0], writes[i][1]), args.writes),
+    )
+    storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=1000)
+    parser.add_argument("--reads", type=int, default=50000)
+    parser.add_argument("--writes", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in engines(tmp):
+            run(name, factory(), args)
+
+
+if __name__ == "__main__":
+    main()
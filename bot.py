@@ -9,40 +9,101 @@ Xususiyatlar:
  - Administratorlar bundan mustasno.
  - Barcha sozlamalar SQLite bazasida saqlanadi.
  - Administrator buyruqlari orqali sozlanadi.
+
+Modullar:
+ - storage.py    — saqlash dvigatellari (SQLite, xotira, LMDB) va keshlar.
+ - moderation.py — moderatsiya filtrlari, klassifikator va filtrlar zanjiri.
+ - tracing.py    — yangilanishlar jurnali, audit jurnali va trace’lar.
+ - sharding.py   — bir nechta bot, ko‘p jarayonli rejim va webhook.
+ - bot.py        — buyruqlar, handler’lar, Telegram API va ishga tushirish.
 """
 
 import asyncio
+import contextvars
+import gzip
+import json
 import logging
+import logging.handlers
+import queue
 import re
-import sqlite3
-from typing import List, Optional, Tuple
+import signal
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple, Union
 
 from telegram import __version__ as TG_VER
 
 try:
     from telegram import (
+        Bot,
         BotCommand,
+        Chat,
         ChatMember,
         InlineKeyboardButton,
         InlineKeyboardMarkup,
+        Message,
         Update,
+        User,
         constants,
     )
-    from telegram.error import TelegramError
+    from telegram.error import BadRequest, Forbidden, TelegramError
+    from telegram.request import HTTPXRequest
     from telegram.ext import (
         ApplicationBuilder,
         CommandHandler,
         ContextTypes,
         MessageHandler,
+        TypeHandler,
         ChatMemberHandler,
         CallbackQueryHandler,
         filters,
     )
+    import httpx
 except Exception as e:
     raise RuntimeError(
         "Ushbu skript python-telegram-bot v20+ talab qiladi. O‘rnatish: pip install python-telegram-bot --upgrade"
     ) from e
 
+import moderation
+import sharding
+import tracing
+from moderation import (
+    FLOOD_PENALTY,
+    MEDIA_BLOCKLIST_MAX,
+    BlockedMediaFilter,
+    ClassifierFilter,
+    FilterPipeline,
+    FloodFilter,
+    KeywordFilter,
+    LinkFilter,
+    ModerationFilter,
+    SpamFingerprintFilter,
+    Verdict,
+    blocked_media,
+    flood_detector,
+    media_keys,
+)
+from sharding import PerBot, current_bot, owns_chat, token_bot_id
+from storage import (
+    DEFAULT_BANNED_KEYWORDS,
+    RECHECK_SCHEDULE,
+    SharedTTLCache,
+    TTLCache,
+    db,
+    shared_cache,
+)
+from tracing import (
+    audit_flush_job,
+    current_span,
+    current_traces,
+    journal_flush_job,
+    journal_update_handler,
+    trace_finish_handler,
+    trace_flush_job,
+    trace_span,
+    trace_start_handler,
+)
+
 
 # ---------------------------
 # Asosiy sozlamalar
@@ -51,21 +112,115 @@ except Exception as e:
 import os
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
 
+# Shu jarayonda ishlaydigan qo‘shimcha botlar (brendlangan nusxalar) tokenlari,
+# "," bilan ajratilgan. Ular BOT_TOKEN bilan bitta event loop va bitta
+# bazani bo‘lishadi (ma’lumotlar bot ID si bo‘yicha alohida).
+BOT_EXTRA_TOKENS = [t.strip() for t in os.environ.get("BOT_EXTRA_TOKENS", "").split(",") if t.strip()]
 
-GLOBAL_ADMINS = []  # global adminlar ro‘yxati (ixtiyoriy)
+# global adminlar ro‘yxati (ixtiyoriy) — barcha guruhlarga ta’sir qiluvchi
+# buyruqlar (/blockmedia, /unblockmedia) faqat ular uchun
+GLOBAL_ADMINS = [int(x) for x in os.environ.get("BOT_GLOBAL_ADMINS", "").split(",") if x.strip()]
 
-DEFAULT_BANNED_KEYWORDS = [
-    "promo", "promotion", "discount", "bet", "casino", "followers",
-    "free followers", "giveaway", "click here", "subscribe",
-    "earn", "work from home"
-]
+# Pending join xabarlari (a’zo bo‘lmaganlarga ogohlantirishlar)
+PENDING_SWEEP_INTERVAL = 300   # muddati o‘tganlarni tozalash oralig‘i, soniya
+PENDING_SWEEP_BATCH = 1000     # bitta o‘tishda ko‘pi bilan shuncha yozuv
+PENDING_DELETE_CONCURRENCY = 10
 
-DEFAULT_ENFORCE_MEMBERSHIP = True
-DEFAULT_ENFORCE_ADBLOCK = True
+# Kutilayotgan foydalanuvchini qayta tekshirish (oraliqlar — RECHECK_SCHEDULE, storage.py)
+RECHECK_BATCH = 500            # bitta o‘tishda ko‘pi bilan shuncha (user, guruh)
 
-DB_PATH = "bot_settings.db"
 LOG_LEVEL = logging.INFO
 
+# Kanal ma’lumotlari (nomi, username, havola) shuncha vaqtdan keyin qayta tekshiriladi
+CHANNEL_REVALIDATE_AGE = 6 * 3600  # soniya
+CHANNEL_REVALIDATE_INTERVAL = 600  # fon tekshiruvi oralig‘i, soniya
+CHANNEL_RESOLVE_CONCURRENCY = 5    # bir vaqtda nechta get_chat so‘rovi
+
+# Adminlar ro‘yxati va a’zolik natijalari keshi
+ADMIN_CACHE_TTL = 300          # soniya
+MEMBERSHIP_CACHE_TTL = 300     # a’zo bo‘lsa, soniya
+NOT_MEMBER_CACHE_TTL = 30      # a’zo bo‘lmasa, soniya
+
+# Paketli moderatsiya
+BATCH_MAX_SIZE = 100           # getUpdates limitiga teng
+BATCH_MAX_DELAY = 0.2          # soniya
+
+# Flood detektorini tozalash (detektor — moderation.py)
+FLOOD_SWEEP_INTERVAL = 60      # tozalash oralig‘i, soniya
+
+# Yuklama ostida degraded rejim
+LOAD_CHECK_INTERVAL = 1.0      # tekshiruv oralig‘i, soniya
+DEGRADED_QUEUE_DEPTH = 500     # navbatdagi yangilanishlar soni
+DEGRADED_LOOP_LAG = 0.5        # event loop kechikishi, soniya
+DEGRADED_RECOVER_AFTER = 30    # shuncha vaqt tinch bo‘lsa — normal rejim
+DEGRADED_DEFERRED_MAX = 10_000 # keyinroq tekshiriladigan a’zoliklar
+DEGRADED_ADMIN_WARM = 5        # fonda bir vaqtda olinadigan admin ro‘yxatlari
+
+# Bot API HTTP ulanishlari (oddiy so‘rovlar uchun)
+API_POOL_SIZE = 128            # bir vaqtdagi ulanishlar
+API_KEEPALIVE = 64             # ochiq saqlanadigan ulanishlar
+API_KEEPALIVE_EXPIRY = 60.0    # bo‘sh ulanish shuncha soniya saqlanadi
+API_HTTP_VERSION = "1.1"       # "2" — HTTP/2 (httpx[http2] kerak)
+API_CONNECT_TIMEOUT = 5.0
+API_READ_TIMEOUT = 10.0
+API_WRITE_TIMEOUT = 10.0
+API_POOL_TIMEOUT = 3.0         # bo‘sh ulanishni kutish
+# Metod bo‘yicha read timeout (qolganlari API_READ_TIMEOUT)
+API_METHOD_TIMEOUTS = {
+    "getChatMember": 3.0,
+    "getChatAdministrators": 5.0,
+    "deleteMessage": 5.0,
+    "sendMessage": 10.0,
+}
+
+# DM navbati
+DM_OUTBOX_DELAY = 5            # birinchi DM oldidan guruhlarni yig‘ish, soniya
+DM_OUTBOX_WINDOW = 3600        # foydalanuvchiga shu oraliqda ko‘pi bilan bitta DM
+DM_OUTBOX_FLUSH_INTERVAL = 2   # navbatni tekshirish oralig‘i, soniya
+DM_OUTBOX_CONCURRENCY = 10
+DM_UNREACHABLE_TTL = 24 * 3600 # DM qabul qilmaydiganlar shuncha vaqt eslab qolinadi
+
+# get_chat_member uchun muddat (deadline) va hedging
+MEMBERSHIP_DEADLINE = 2.0      # bitta tekshiruv uchun umumiy muddat, soniya
+MEMBERSHIP_HEDGE = True        # sekin javobda ikkinchi so‘rov yuborish
+MEMBERSHIP_HEDGE_MIN_DELAY = 0.1
+MEMBERSHIP_LATENCY_SAMPLES = 256
+
+# Keshlarni qayta ishga tushirishlar orasida saqlash
+SNAPSHOT_PATH = "bot_cache.snapshot.gz"
+SNAPSHOT_INTERVAL = 300        # davriy saqlash (kutilmagan to‘xtash uchun), soniya
+
+# Ishga tushganda keshlarni oldindan to‘ldirish
+PREWARM_CONCURRENCY = 4        # bir vaqtda nechta so‘rov
+PREWARM_RATE = 20              # soniyasiga ko‘pi bilan shuncha so‘rov
+PREWARM_LOG_INTERVAL = 10      # progress log oralig‘i, soniya
+
+# Ko‘p jarayonli (sharding) rejim — BOT_WORKERS > 1 bo‘lsa
+BLOCKED_MEDIA_REFRESH_INTERVAL = 30
+
+# Jarayonlararo umumiy keshni tozalash (kesh — storage.py)
+SHARED_CACHE_PURGE_INTERVAL = 60
+
+# Yangilanishlar jurnali (ishlab chiqarish trafigini qayta o‘ynatish uchun)
+JOURNAL_FLUSH_INTERVAL = 2     # diskka yozish oralig‘i, soniya
+
+# Moderatsiya audit jurnali (o‘chirishlar, ogohlantirishlar, a’zolik tasdig‘i)
+AUDIT_FLUSH_INTERVAL = 1
+AUDIT_DEFAULT_HOURS = 24       # /auditlog standart oralig‘i
+
+# Yangilanishlar trace’i (OTLP/JSON): katalog yoki http://127.0.0.1:4318/v1/traces
+TRACE_FLUSH_INTERVAL = 2
+
+# Guruh statistikasi (/stats)
+STATS_FLUSH_INTERVAL = 60      # soatlik hisoblagichlarni SQLite’ga yozish oralig‘i, soniya
+STATS_MINUTES = 60             # xotirada saqlanadigan daqiqalik bo‘laklar
+STATS_RETENTION_HOURS = 30 * 24
+STATS_TOP_GROUPS = 10
+
+# getUpdates uchun alohida ulanish (long polling boshqa so‘rovlarni band qilmaydi)
+GET_UPDATES_POOL_SIZE = 1
+GET_UPDATES_READ_TIMEOUT = 15.0
+
 
 # ---------------------------
 # Logging
@@ -77,210 +232,119 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Har soniyadagi vazifalar (load_monitor_job, audit_flush_job) uchun APScheduler
+# har ishga tushishda INFO yozadi — log to‘lib ketmasligi uchun faqat ogohlantirishlar.
+# Modul darajasida: sharding ishchilari va replay.py ham shu sozlamani oladi.
+logging.getLogger("apscheduler").setLevel(logging.WARNING)
 
-# ---------------------------
-# Ma’lumotlar bazasi (SQLite)
-# ---------------------------
-# Jadval: groups
-#   - group_id: integer (PRIMARY KEY)
-#   - required_channels: majburiy kanallar ("," bilan ajratilgan)
-#   - banned_keywords: taqiqlangan so‘zlar
-#   - enforce_membership: a’zolik tekshiruvi (0/1)
-#   - enforce_adblock: reklamani bloklash (0/1)
-#   - join_button_text: tugma matni
-#   - override_message: maxsus matn (ixtiyoriy)
-#
-# Jadval: pending_join_msgs
-#   - user_id: foydalanuvchi ID
-#   - group_id: guruh ID
-#   - chat_id: xabar qaysi chatga yuborilgan
-#   - message_id: yuborilgan xabar ID
-#
-# Ushbu jadval join-subscribtion xabarlari keyin o‘chirilishi uchun kerak.
-
-class DB:
-    def __init__(self, db_path=DB_PATH):
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self._init_db()
-
-    def _init_db(self):
-        c = self.conn.cursor()
-
-        # Guruh sozlamalari jadvali
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS groups (
-                group_id INTEGER PRIMARY KEY,
-                required_channels TEXT,
-                banned_keywords TEXT,
-                enforce_membership INTEGER DEFAULT 1,
-                enforce_adblock INTEGER DEFAULT 1,
-                join_button_text TEXT DEFAULT 'Kanalga a’zo bo‘ling',
-                override_message TEXT DEFAULT 'Iltimos, majburiy kanalga a’zo bo‘ling.'
-            )
-        """)
-
-        # Pending join xabarlari (keyin o‘chiriladigan)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS pending_join_msgs (
-                user_id INTEGER,
-                group_id INTEGER,
-                chat_id INTEGER,
-                message_id INTEGER
-            )
-        """)
+# Log yozish (stdout/fayl) event loop’ni to‘xtatmasligi uchun alohida oqimda.
+# Faqat bot ishga tushganda (main, sharding ishchisi) yoqiladi — bot.py ni
+# import qilgan testlar va skriptlarning log sozlamalari o‘zgarmaydi.
+_log_listener: Optional[logging.handlers.QueueListener] = None
 
-        self.conn.commit()
 
-    # --- Guruh sozlamalari funksiyalari ---
-
-    def get_group(self, group_id: int) -> Optional[dict]:
-        c = self.conn.cursor()
-        c.execute("""
-            SELECT required_channels, banned_keywords, enforce_membership,
-                   enforce_adblock, join_button_text, override_message
-            FROM groups
-            WHERE group_id = ?
-        """, (group_id,))
-        row = c.fetchone()
+def start_log_listener():
+    global _log_listener
+    if _log_listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(log_queue, *logging.root.handlers, respect_handler_level=True)
+    logging.root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    _log_listener.start()
 
-        if not row:
-            return None
 
-        return {
-            "required_channels": row[0] or "",
-            "banned_keywords": row[1] or "",
-            "enforce_membership": bool(row[2]),
-            "enforce_adblock": bool(row[3]),
-            "join_button_text": row[4] or "Kanalga a’zo bo‘ling",
-            "override_message": row[5] or "",
-        }
-
-    def ensure_group(self, group_id: int):
-        if self.get_group(group_id) is None:
-            c = self.conn.cursor()
-            c.execute("""
-                INSERT INTO groups (group_id, required_channels, banned_keywords,
-                    enforce_membership, enforce_adblock)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                group_id,
-                "",
-                ",".join(DEFAULT_BANNED_KEYWORDS),
-                1 if DEFAULT_ENFORCE_MEMBERSHIP else 0,
-                1 if DEFAULT_ENFORCE_ADBLOCK else 0,
-            ))
-            self.conn.commit()
-
-    def set_required_channels(self, group_id: int, channels: List[str]):
-        self.ensure_group(group_id)
-        c = self.conn.cursor()
-        c.execute(
-            "UPDATE groups SET required_channels = ? WHERE group_id = ?",
-            (",".join(channels), group_id)
-        )
-        self.conn.commit()
-
-    def get_required_channels(self, group_id: int) -> List[str]:
-        g = self.get_group(group_id)
-        if not g or not g["required_channels"]:
-            return []
-        return [s.strip() for s in g["required_channels"].split(",") if s.strip()]
-
-    def set_banned_keywords(self, group_id: int, keywords: List[str]):
-        self.ensure_group(group_id)
-        c = self.conn.cursor()
-        c.execute("""
-            UPDATE groups SET banned_keywords = ?
-            WHERE group_id = ?
-        """, (",".join(keywords), group_id))
-        self.conn.commit()
-
-    def get_banned_keywords(self, group_id: int) -> List[str]:
-        g = self.get_group(group_id)
-        if not g or not g["banned_keywords"]:
-            return DEFAULT_BANNED_KEYWORDS.copy()
-        return [s.strip() for s in g["banned_keywords"].split(",") if s.strip()]
-
-    def set_enforce_membership(self, group_id: int, value: bool):
-        self.ensure_group(group_id)
-        c = self.conn.cursor()
-        c.execute("""
-            UPDATE groups SET enforce_membership = ?
-            WHERE group_id = ?
-        """, (1 if value else 0, group_id))
-        self.conn.commit()
-
-    def set_enforce_adblock(self, group_id: int, value: bool):
-        self.ensure_group(group_id)
-        c = self.conn.cursor()
-        c.execute("""
-            UPDATE groups SET enforce_adblock = ?
-            WHERE group_id = ?
-        """, (1 if value else 0, group_id))
-        self.conn.commit()
-
-    # --- Pending join xabarlarini boshqarish ---
-
-    def save_join_message(self, user_id: int, group_id: int, chat_id: int, message_id: int):
-        c = self.conn.cursor()
-        c.execute("""
-            INSERT INTO pending_join_msgs (user_id, group_id, chat_id, message_id)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, group_id, chat_id, message_id))
-        self.conn.commit()
-
-    def get_join_messages(self, user_id: int, group_id: int) -> List[Tuple[int, int]]:
-        c = self.conn.cursor()
-        c.execute("""
-            SELECT chat_id, message_id FROM pending_join_msgs
-            WHERE user_id = ? AND group_id = ?
-        """, (user_id, group_id))
-        return [(r[0], r[1]) for r in c.fetchall()]
-
-    def delete_join_messages(self, user_id: int, group_id: int):
-        c = self.conn.cursor()
-        c.execute("""
-            DELETE FROM pending_join_msgs
-            WHERE user_id = ? AND group_id = ?
-        """, (user_id, group_id))
-        self.conn.commit()
-
-    def get_pending_groups_for_user(self, user_id: int) -> List[int]:
-        c = self.conn.cursor()
-        c.execute("""
-            SELECT DISTINCT group_id FROM pending_join_msgs
-            WHERE user_id = ?
-        """, (user_id,))
-        return [r[0] for r in c.fetchall()]
-
-
-db = DB(DB_PATH)
+def stop_log_listener():
+    """Navbatdagi loglarni yozib chiqadi va asl handlerlarni qaytaradi."""
+    global _log_listener
+    if _log_listener is None:
+        return
+    logging.root.handlers = list(_log_listener.handlers)
+    _log_listener.stop()
+    _log_listener = None
 
 
 # ---------------------------
-# Foydali funksiyalar
+# Bot API HTTP ulanishlari
 # ---------------------------
+# Standart HTTPXRequest bo‘sh ulanishlarni 5 soniyadan keyin yopadi va
+# barcha metodlar uchun bitta timeout ishlatadi. Bu yerda ulanishlar
+# soni, keep-alive, HTTP versiyasi va metod bo‘yicha timeout sozlanadi;
+# getUpdates esa alohida so‘rov obyektidan foydalanadi.
+
+class TunedHTTPXRequest(HTTPXRequest):
+    __slots__ = ("_method_timeouts",)
+
+    def __init__(
+        self,
+        connection_pool_size: int,
+        keepalive: int,
+        keepalive_expiry: float,
+        method_timeouts: Optional[Dict[str, float]] = None,
+        **kwargs,
+    ):
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+        self._method_timeouts = method_timeouts or {}
+        self._client_kwargs["limits"] = httpx.Limits(
+            max_connections=connection_pool_size,
+            max_keepalive_connections=keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client = self._build_client()
+
+    async def do_request(self, url: str, method: str, request_data=None,
+                         read_timeout=HTTPXRequest.DEFAULT_NONE, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        if isinstance(read_timeout, type(HTTPXRequest.DEFAULT_NONE)):
+            if api_method in self._method_timeouts:
+                read_timeout = self._method_timeouts[api_method]
+        group_stats.incr("api_calls")
+        if not tracing.update_journal.enabled and current_traces.get() is None:
+            return await super().do_request(url, method, request_data, read_timeout=read_timeout, **kwargs)
+
+        t0 = time.monotonic()
+        with trace_span("bot_api." + api_method) as span:
+            try:
+                code, payload = await super().do_request(url, method, request_data, read_timeout=read_timeout, **kwargs)
+            except Exception:
+                if tracing.update_journal.enabled:
+                    tracing.update_journal.record_api(api_method, time.monotonic() - t0, None)
+                raise
+            span.set("http.status_code", code)
+        if tracing.update_journal.enabled:
+            tracing.update_journal.record_api(api_method, time.monotonic() - t0, code)
+        return code, payload
+
+
+def build_api_request() -> HTTPXRequest:
+    return TunedHTTPXRequest(
+        connection_pool_size=API_POOL_SIZE,
+        keepalive=API_KEEPALIVE,
+        keepalive_expiry=API_KEEPALIVE_EXPIRY,
+        method_timeouts=API_METHOD_TIMEOUTS,
+        http_version=API_HTTP_VERSION,
+        connect_timeout=API_CONNECT_TIMEOUT,
+        read_timeout=API_READ_TIMEOUT,
+        write_timeout=API_WRITE_TIMEOUT,
+        pool_timeout=API_POOL_TIMEOUT,
+    )
 
-URL_REGEX = re.compile(
-    r"(https?://[^\s]+)|"
-    r"(www\.[^\s]+)|"
-    r"(t\.me/[^\s]+)|"
-    r"([^\s]+\.[a-z]{2,})",
-    re.IGNORECASE,
-)
 
-def contains_url(text: str) -> bool:
-    return bool(URL_REGEX.search(text))
+def build_get_updates_request() -> HTTPXRequest:
+    return TunedHTTPXRequest(
+        connection_pool_size=GET_UPDATES_POOL_SIZE,
+        keepalive=GET_UPDATES_POOL_SIZE,
+        keepalive_expiry=API_KEEPALIVE_EXPIRY,
+        http_version=API_HTTP_VERSION,
+        connect_timeout=API_CONNECT_TIMEOUT,
+        read_timeout=GET_UPDATES_READ_TIMEOUT,
+        write_timeout=API_WRITE_TIMEOUT,
+        pool_timeout=API_POOL_TIMEOUT,
+    )
 
-def contains_tme_link(text: str) -> bool:
-    return "t.me/" in text.lower()
 
-def contains_banned_keyword(text: str, banned_keywords: List[str]) -> Optional[str]:
-    text_l = text.lower()
-    for kw in banned_keywords:
-        if kw.lower() in text_l:
-            return kw
-    return None
+# ---------------------------
+# Foydali funksiyalar
+# ---------------------------
 
 async def is_user_admin_or_owner(bot, chat_id: int, user_id: int) -> bool:
     try:
@@ -289,17 +353,273 @@ async def is_user_admin_or_owner(bot, chat_id: int, user_id: int) -> bool:
     except TelegramError:
         return False
 
-async def user_is_member_of_channel(bot, user_id: int, channel_ident: str) -> Optional[bool]:
+# ---------------------------
+# get_chat_member: muddat va hedging
+# ---------------------------
+# Bitta sekin get_chat_member butun partiyani ushlab turmasligi uchun har
+# bir tekshiruv MEMBERSHIP_DEADLINE bilan cheklanadi. Javob oxirgi
+# so‘rovlarning p95 kechikishidan uzoqroq kutilsa, xuddi shunday ikkinchi
+# so‘rov yuboriladi va qaysi biri birinchi kelsa, o‘sha olinadi. Natija
+# noma’lum bo‘lsa (xato yoki muddat o‘tdi) None qaytadi — uni qanday
+# talqin qilish guruhning fail-open/fail-closed siyosatiga bog‘liq.
+
+class LatencyTracker:
+    def __init__(self, size: int = MEMBERSHIP_LATENCY_SAMPLES):
+        self._samples: deque = deque(maxlen=size)
+        self._p95: Optional[float] = None
+        self._since_update = 0
+        self.calls = 0
+        self.hedged = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+        self._since_update += 1
+        # p95 har 32 ta namunada bir marta qayta hisoblanadi
+        if self._since_update >= 32 or self._p95 is None and len(self._samples) >= 20:
+            ordered = sorted(self._samples)
+            self._p95 = ordered[int(len(ordered) * 0.95) - 1]
+            self._since_update = 0
+
+    @property
+    def p95(self) -> Optional[float]:
+        return self._p95
+
+
+membership_latency = LatencyTracker()
+
+
+async def _hedged(factory, hedge_after: Optional[float]):
+    first = asyncio.ensure_future(factory())
+    tasks = [first]
+    try:
+        if hedge_after is None:
+            return await first
+
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return first.result()
+
+        membership_latency.hedged += 1
+        tasks.append(asyncio.ensure_future(factory()))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        # Ikkalasi ham xato bilan tugadi
+        return first.result()
+    finally:
+        # Javob olindi yoki chaqiruvchi bekor qildi (wait_for muddati) —
+        # tugamagan so‘rovlar kuzatuvsiz qolmaydi
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def user_is_member_of_channel(bot, user_id: int, channel_ident: Union[int, str]) -> Optional[bool]:
+    hedge_after = None
+    if MEMBERSHIP_HEDGE and membership_latency.p95 is not None:
+        hedge_after = max(membership_latency.p95, MEMBERSHIP_HEDGE_MIN_DELAY)
+
+    membership_latency.calls += 1
+    t0 = time.monotonic()
     try:
-        member = await bot.get_chat_member(chat_id=channel_ident, user_id=user_id)
-        return member.status in (
-            ChatMember.OWNER,
-            ChatMember.ADMINISTRATOR,
-            ChatMember.MEMBER,
-            ChatMember.RESTRICTED,
+        member = await asyncio.wait_for(
+            _hedged(lambda: bot.get_chat_member(chat_id=channel_ident, user_id=user_id), hedge_after),
+            timeout=MEMBERSHIP_DEADLINE,
         )
+    except asyncio.TimeoutError:
+        membership_latency.timeouts += 1
+        logger.debug(f"get_chat_member muddati o‘tdi: {channel_ident}, {user_id}")
+        return None
     except TelegramError:
+        membership_latency.errors += 1
+        return None
+
+    membership_latency.add(time.monotonic() - t0)
+    return member.status in (
+        ChatMember.OWNER,
+        ChatMember.ADMINISTRATOR,
+        ChatMember.MEMBER,
+        ChatMember.RESTRICTED,
+    )
+
+# ---------------------------
+# Keshlar (adminlar, a’zolik)
+# ---------------------------
+
+admin_cache = SharedTTLCache(                      # chat_id -> frozenset(user_id)
+    ADMIN_CACHE_TTL, "admins", shared_cache, encode=sorted, decode=frozenset
+)
+membership_cache = SharedTTLCache(                 # (kanal, user_id) -> bool
+    MEMBERSHIP_CACHE_TTL, "member", shared_cache
+)
+
+
+async def shared_cache_purge_job(context: ContextTypes.DEFAULT_TYPE):
+    removed = shared_cache.purge()
+    if removed:
+        logger.debug(f"Umumiy keshdan {removed} ta eskirgan yozuv o‘chirildi")
+
+
+async def get_chat_admin_ids(bot, chat_id: int) -> frozenset:
+    admins = admin_cache.get(chat_id)
+    if admins is not None:
+        group_stats.incr("cache_hits")
+        return admins
+    group_stats.incr("cache_misses")
+    return await fetch_chat_admin_ids(bot, chat_id)
+
+
+async def fetch_chat_admin_ids(bot, chat_id: int) -> frozenset:
+    try:
+        members = await bot.get_chat_administrators(chat_id)
+    except TelegramError:
+        return frozenset()
+
+    admins = frozenset(m.user.id for m in members)
+    admin_cache.set(chat_id, admins)
+    return admins
+
+
+def remember_membership(user_id: int, target: Union[int, str], res: Optional[bool]):
+    if res is None:
+        return
+    membership_cache.set(
+        (target, user_id), res,
+        ttl=MEMBERSHIP_CACHE_TTL if res else NOT_MEMBER_CACHE_TTL
+    )
+
+
+async def is_member_cached(bot, user_id: int, target: Union[int, str]) -> Optional[bool]:
+    res = membership_cache.get((target, user_id))
+    if res is not None:
+        group_stats.incr("cache_hits")
+        return res
+    group_stats.incr("cache_misses")
+    res = await user_is_member_of_channel(bot, user_id, target)
+    remember_membership(user_id, target, res)
+    return res
+
+
+def get_not_member_channels_from_cache(user_id: int, targets: list) -> Optional[list]:
+    results = [membership_cache.get((t, user_id)) for t in targets]
+    misses = sum(1 for r in results if r is None)
+    group_stats.incr("cache_hits", len(results) - misses)
+    if misses:
+        group_stats.incr("cache_misses", misses)
         return None
+    return [t for t, r in zip(targets, results) if not r]
+
+
+async def get_not_member_channels(bot, user_id: int, targets: list, fail_open: bool = True) -> list:
+    results = await asyncio.gather(*(is_member_cached(bot, user_id, t) for t in targets))
+    # None — natija noma’lum (xato yoki muddat o‘tdi)
+    return [t for t, r in zip(targets, results) if r is False or (r is None and not fail_open)]
+
+
+# ---------------------------
+# Taqiqlangan media (bazadan o‘qish)
+# ---------------------------
+# Ro‘yxat (blocked_media) va tekshiruv moderation.py da; bu yerda ro‘yxat
+# bazadan to‘ldiriladi va boshqa ishchilar o‘zgartirganlari bilan yangilanadi.
+
+_blocked_media_loaded_at = 0
+_blocked_media_unblock_seen = None
+
+# Sharding: yangi taqiqlar bazadan added_at bo‘yicha o‘qiladi, bekor
+# qilinganlarini esa shu umumiy kesh kaliti bildiradi (oxirgi bekor qilish
+# vaqti) — o‘zgargan bo‘lsa, ro‘yxat to‘liq qayta o‘qiladi.
+MEDIA_UNBLOCK_KEY = "media:unblocked"
+MEDIA_UNBLOCK_TTL = 30 * 24 * 3600
+
+
+def refresh_blocked_media():
+    global _blocked_media_loaded_at, _blocked_media_unblock_seen
+    if shared_cache is not None:
+        found = shared_cache.peek(MEDIA_UNBLOCK_KEY)
+        stamp = found[0] if found else None
+        if stamp != _blocked_media_unblock_seen:
+            _blocked_media_unblock_seen = stamp
+            blocked_media.clear()
+            _blocked_media_loaded_at = 0
+    now = int(time.time())
+    for key in db.get_blocked_media_since(_blocked_media_loaded_at, MEDIA_BLOCKLIST_MAX):
+        blocked_media.add(key)
+    _blocked_media_loaded_at = now
+
+
+async def blocked_media_refresh_job(context: ContextTypes.DEFAULT_TYPE):
+    refresh_blocked_media()
+
+
+# ---------------------------
+# Kanallarni raqamli ID ga aylantirish
+# ---------------------------
+
+CHANNEL_ID_REGEX = re.compile(r"^-?\d+$")
+
+def parse_channel_target(ident: str) -> Union[int, str]:
+    """Raqamli ID bo‘lsa int, aks holda @username ko‘rinishida qaytaradi."""
+    ident = ident.strip()
+    if CHANNEL_ID_REGEX.match(ident):
+        return int(ident)
+    if ident.startswith("https://t.me/") or ident.startswith("t.me/"):
+        ident = "@" + ident.rstrip("/").rsplit("/", 1)[-1]
+    if not ident.startswith("@"):
+        ident = "@" + ident
+    return ident
+
+def get_channel_targets(group_id: int) -> List[Union[int, str]]:
+    return [parse_channel_target(s) for s in db.get_required_channels(group_id)]
+
+async def resolve_channel(bot, ident: Union[int, str]) -> Optional[dict]:
+    try:
+        ch = await bot.get_chat(ident)
+    except TelegramError as e:
+        logger.warning(f"Kanal aniqlanmadi ({ident}): {e}")
+        return None
+
+    invite_link = ch.invite_link or ""
+    if not invite_link and ch.username:
+        invite_link = f"https://t.me/{ch.username}"
+
+    return {
+        "chat_id": ch.id,
+        "ident": str(ident),
+        "title": ch.title or "",
+        "username": ch.username or "",
+        "invite_link": invite_link,
+    }
+
+async def resolve_channels(bot, idents: List[Union[int, str]]) -> List[Optional[dict]]:
+    sem = asyncio.Semaphore(CHANNEL_RESOLVE_CONCURRENCY)
+
+    async def _one(ident):
+        async with sem:
+            return await resolve_channel(bot, ident)
+
+    return await asyncio.gather(*(_one(i) for i in idents))
+
+def channel_join_url(target: Union[int, str], info: Optional[dict]) -> Optional[str]:
+    if info:
+        if info["invite_link"]:
+            return info["invite_link"]
+        if info["username"]:
+            return f"https://t.me/{info['username']}"
+    if isinstance(target, str):
+        return f"https://t.me/{target.replace('@', '')}"
+    return None
+
+def channel_label(target: Union[int, str], info: Optional[dict]) -> str:
+    if not info:
+        return str(target)
+    if info["username"]:
+        return f"{info['title']} (@{info['username']})"
+    return info["title"] or str(target)
 
 def mention_html(user):
     if user.username:
@@ -317,6 +637,9 @@ async def start_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Reklama, havolalar va taqiqlangan so‘zlarni avtomatik aniqlab bloklaydi.\n\n"
         "Botni guruhga administrator sifatida qo‘shing va buyruqlar orqali sozlashingiz mumkin."
     )
+    # Endi foydalanuvchiga DM yuborish mumkin
+    if update.effective_chat.type == "private":
+        dm_outbox.unreachable.pop(update.effective_user.id)
     await update.message.reply_text(text)
 
 
@@ -334,7 +657,18 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/disable_membership — A’zolik tekshiruvini o‘chirish.\n\n"
         "/enable_adblock — Reklama filtrini yoqish.\n"
         "/disable_adblock — Reklama filtrini o‘chirish.\n\n"
+        "/setfailpolicy open|closed — Telegram a’zolikni aniqlay olmasa xabarni qoldirish yoki o‘chirish.\n\n"
+        "/setadthreshold 0.9|off — Reklama klassifikatori chegarasi (model yuklangan bo‘lsa).\n\n"
         "/listsettings — Ushbu guruhdagi barcha joriy sozlamalarni ko‘rsatish.\n\n"
+        "/blockmedia — Javob berilgan xabardagi media yoki forward manbasini barcha guruhlarda taqiqlash"
+        " (faqat global adminlar).\n"
+        "/unblockmedia — Taqiqni bekor qilish (xabarga javob sifatida, faqat global adminlar).\n\n"
+        "/filters — Moderatsiya filtrlari va ularning holati.\n"
+        "/enable_filter nom — Filtrni yoqish.\n"
+        "/disable_filter nom — Filtrni o‘chirish.\n\n"
+        "/botstatus — Bot yuklamasi va ish rejimi.\n"
+        "/auditlog [soat] — Guruhdagi moderatsiya amallari xulosasi (standart 24 soat).\n"
+        "/stats — Guruh statistikasi: xabarlar, o‘chirishlar, API so‘rovlari, kesh.\n\n"
         "Barcha buyruqlarni faqat guruh administratorlari bajarishi mumkin."
     )
     await update.message.reply_text(text)
@@ -386,13 +720,26 @@ async def setchannel_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     raw = " ".join(context.args)
-    channels = [c.strip() for c in raw.split(",") if c.strip()]
+    idents = [parse_channel_target(c) for c in raw.split(",") if c.strip()]
+
+    # Har bir kanalni bir marta get_chat orqali raqamli ID ga aylantiramiz
+    resolved = await resolve_channels(context.bot, idents)
+    failed = [str(i) for i, r in zip(idents, resolved) if r is None]
+
+    if failed:
+        await update.message.reply_text(
+            "❌ Quyidagi kanallar topilmadi yoki bot ularni ko‘ra olmaydi:\n" +
+            "\n".join(failed) +
+            "\n\nBotni kanalga administrator sifatida qo‘shing va qaytadan urinib ko‘ring."
+        )
+        return
 
-    db.set_required_channels(chat.id, channels)
+    db.save_channels(resolved)
+    db.set_required_channels(chat.id, [str(r["chat_id"]) for r in resolved])
 
     await update.message.reply_text(
         "✅ Majburiy kanallar muvaffaqiyatli o‘rnatildi:\n" +
-        "\n".join(channels)
+        "\n".join(channel_label(r["chat_id"], r) for r in resolved)
     )
 
 
@@ -491,6 +838,65 @@ async def disable_adblock_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
 
 
+# ---------------------------
+# /setfailpolicy — a’zolik aniqlanmasa nima qilish
+# ---------------------------
+async def setfailpolicy_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await admin_required(update):
+        await update.message.reply_text("❌ Faqat administratorlar uchun.")
+        return
+
+    arg = (context.args[0].lower() if context.args else "")
+    if arg not in ("open", "closed"):
+        await update.message.reply_text(
+            "Iltimos, siyosatni kiriting.\n"
+            "Masalan: /setfailpolicy open — Telegram javob bermasa xabar qoldiriladi\n"
+            "/setfailpolicy closed — Telegram javob bermasa xabar o‘chiriladi"
+        )
+        return
+
+    chat = update.effective_chat
+    db.set_membership_fail_open(chat.id, arg == "open")
+
+    await update.message.reply_text(
+        "✅ A’zolik aniqlanmaganda xabarlar " +
+        ("qoldiriladi." if arg == "open" else "o‘chiriladi.")
+    )
+
+
+# ---------------------------
+# /setadthreshold — reklama klassifikatori chegarasi
+# ---------------------------
+async def setadthreshold_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await admin_required(update):
+        await update.message.reply_text("❌ Faqat administratorlar uchun.")
+        return
+
+    arg = (context.args[0].lower() if context.args else "")
+    try:
+        value = 0.0 if arg == "off" else float(arg)
+    except ValueError:
+        value = -1.0
+    if not 0.0 <= value < 1.0:
+        await update.message.reply_text(
+            "Iltimos, 0 va 1 orasidagi chegarani kiriting.\n"
+            "Masalan: /setadthreshold 0.9 — ehtimoli 90% dan yuqori xabarlar o‘chiriladi\n"
+            "/setadthreshold off — klassifikatorni o‘chirish"
+        )
+        return
+
+    chat = update.effective_chat
+    db.set_classifier_threshold(chat.id, value)
+
+    if not value:
+        await update.message.reply_text("✅ Reklama klassifikatori o‘chirildi.")
+        return
+    text = f"✅ Reklama ehtimoli {value:.0%} va undan yuqori xabarlar o‘chiriladi."
+    if not moderation.ad_classifier.loaded:
+        text += "\nℹ️ Hozircha model yuklanmagan (NumPy yoki BOT_CLASSIFIER fayli yo‘q)."
+    await update.message.reply_text(text)
+
+
 # ---------------------------
 # /listsettings — Guruh sozlamalarini ko‘rsatish
 # ---------------------------
@@ -508,100 +914,340 @@ async def listsettings_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    targets = get_channel_targets(chat.id)
+    infos = db.get_channels([t for t in targets if isinstance(t, int)])
+    channels_text = ", ".join(channel_label(t, infos.get(t)) for t in targets)
+
     text = (
         "📌 *Guruh sozlamalari:*\n\n"
-        f"*Majburiy kanallar:* {g['required_channels'] or '—'}\n"
+        f"*Majburiy kanallar:* {channels_text or '—'}\n"
         f"*Taqiqlangan so‘zlar:* {g['banned_keywords']}\n"
         f"*A’zolik tekshiruvi:* {'Yoqilgan' if g['enforce_membership'] else 'O‘chirilgan'}\n"
         f"*Reklama filtri:* {'Yoqilgan' if g['enforce_adblock'] else 'O‘chirilgan'}\n"
+        f"*A’zolik aniqlanmasa:* {'xabar qoldiriladi' if g['membership_fail_open'] else 'xabar o‘chiriladi'}\n"
+        f"*Reklama klassifikatori:* {format(g['classifier_threshold'], '.2f') if g.get('classifier_threshold') else 'O‘chirilgan'}\n"
     )
 
     await update.message.reply_text(text, parse_mode="Markdown")
-# -----------------------------------------
-# A’zolik tekshiruvi va reklama filtri
-# -----------------------------------------
+# ---------------------------
+# /blockmedia /unblockmedia — javob berilgan xabar bo‘yicha
+# ---------------------------
+async def blockmedia_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Taqiq barcha guruhlarga ta’sir qiladi — guruh admini yetarli emas
+    if update.effective_user.id not in GLOBAL_ADMINS:
+        await update.message.reply_text("❌ Faqat global administratorlar uchun.")
+        return
 
-async def membership_and_adblock_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.message:
+    target = update.message.reply_to_message
+    keys = media_keys(target) if target else []
+    if not keys:
+        await update.message.reply_text(
+            "Iltimos, ushbu buyruqni media yoki forward qilingan xabarga javob sifatida yuboring."
+        )
         return
 
-    msg = update.message
-    chat = msg.chat
-    user = msg.from_user
+    db.add_blocked_media(keys, update.effective_user.id)
+    for k in keys:
+        blocked_media.add(k)
 
-    # Guruhda ishlaydi
-    if chat.type not in ("group", "supergroup"):
+    await safe_delete(context.bot, target.chat_id, target.message_id)
+    await update.message.reply_text("✅ Media barcha guruhlarda taqiqlandi.")
+
+
+async def unblockmedia_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Taqiq barcha guruhlarga ta’sir qiladi — guruh admini yetarli emas
+    if update.effective_user.id not in GLOBAL_ADMINS:
+        await update.message.reply_text("❌ Faqat global administratorlar uchun.")
         return
 
-    # Guruh sozlamalarini olish
-    db.ensure_group(chat.id)
-    g = db.get_group(chat.id)
+    target = update.message.reply_to_message
+    keys = media_keys(target) if target else []
+    if not keys:
+        await update.message.reply_text(
+            "Iltimos, ushbu buyruqni media yoki forward qilingan xabarga javob sifatida yuboring."
+        )
+        return
+
+    db.remove_blocked_media(keys)
+    for k in keys:
+        blocked_media.discard(k)
+    if shared_cache is not None:
+        # Boshqa ishchilar ro‘yxatni qayta o‘qiydi
+        shared_cache.set(MEDIA_UNBLOCK_KEY, time.time(), MEDIA_UNBLOCK_TTL)
+
+    await update.message.reply_text("✅ Taqiq bekor qilindi.")
+
 
-    required_channels = db.get_required_channels(chat.id)
-    banned_keywords = db.get_banned_keywords(chat.id)
+# ---------------------------
+# Moderatsiya filtrlari zanjiri
+# ---------------------------
+# Lokal filtrlar va zanjirning o‘zi moderation.py da. A’zolik filtri va
+# adminlar ro‘yxati tarmoq, keshlar va yuklama holatiga bog‘liq — shu yerda.
+
+class MembershipFilter(ModerationFilter):
+    name = "membership"
+    label = "Majburiy kanallarga a’zolik"
+    cost = 100
+    needs_network = True
+    needs_admins = True
+    group_flag = "enforce_membership"
+
+    def enabled(self, g):
+        return super().enabled(g) and bool(g["channel_targets"])
+
+    async def check_batch(self, bot, chat, g, msgs):
+        # Har bir noyob foydalanuvchi uchun bir marta
+        users = {m.from_user.id: m.from_user for m in msgs}
+        user_ids = list(users)
+        targets = g["channel_targets"]
+
+        if load_monitor.degraded:
+            # Faqat keshdan; noma’lumlari keyinroq tekshiriladi, hozircha — guruh siyosati bo‘yicha
+            missing = {}
+            for uid in user_ids:
+                chs = get_not_member_channels_from_cache(uid, targets)
+                if chs is None:
+                    load_monitor.defer_membership(users[uid], chat)
+                    chs = [] if g["membership_fail_open"] else list(targets)
+                missing[uid] = chs
+        else:
+            not_member = await asyncio.gather(*(
+                get_not_member_channels(bot, uid, targets, g["membership_fail_open"])
+                for uid in user_ids
+            ))
+            missing = dict(zip(user_ids, not_member))
+        return [
+            Verdict("membership", missing[m.from_user.id]) if missing[m.from_user.id] else None
+            for m in msgs
+        ]
+
+
+async def pipeline_admin_ids(bot, chat, g: dict) -> Tuple[frozenset, bool]:
+    """Zanjir uchun adminlar: (ro‘yxat, needs_admins filtrlari ishlaydimi)."""
+    if not load_monitor.degraded:
+        return await get_chat_admin_ids(bot, chat.id), True
+    # Tarmoq kutilmaydi — faqat keshdan; yo‘q bo‘lsa ro‘yxat fonda olinadi
+    admins = admin_cache.get(chat.id)
+    if admins is not None:
+        return admins, True
+    group_stats.incr("cache_misses")
+    load_monitor.warm_admins(bot, chat.id)
+    # fail-open: lokal verdiktlar qoladi (degraded rejimda ogohlantirishsiz o‘chiriladi),
+    # a’zolik va spam izlari esa admin bo‘lishi mumkin bo‘lganlar uchun tekshirilmaydi
+    return frozenset(), not g["membership_fail_open"]
+
+
+moderation_pipeline = FilterPipeline([
+    FloodFilter(),
+    BlockedMediaFilter(),
+    SpamFingerprintFilter(),
+    LinkFilter(),
+    KeywordFilter(),
+    ClassifierFilter(),
+    MembershipFilter(),
+], pipeline_admin_ids)
 
-    enforce_membership = g["enforce_membership"]
-    enforce_adblock = g["enforce_adblock"]
 
-    # Adminlar mustasno
-    if await is_user_admin_or_owner(context.bot, chat.id, user.id):
+# ---------------------------
+# /filters /enable_filter /disable_filter
+# ---------------------------
+async def filters_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await admin_required(update):
+        await update.message.reply_text("❌ Faqat administratorlar uchun.")
         return
 
-    # Reklama filtri — URL, t.me, so‘zlar
-    if enforce_adblock:
-        text = msg.text or msg.caption or ""
+    g = load_group_settings(update.effective_chat.id)
+    lines = ["📌 Filtrlar (bajarilish tartibida):\n"]
 
-        if contains_url(text) or contains_tme_link(text):
-            try:
-                await msg.delete()
-            except:
-                pass
+    for f in moderation_pipeline.filters:
+        status = "✅" if f.enabled(g) else "🚫"
+        avg_us = f.total_time / f.calls * 1e6 if f.calls else 0.0
+        lines.append(f"{status} {f.name} — {f.label} ({f.calls} ta, o‘rtacha {avg_us:.0f} µs)")
 
-            await chat.send_message(
-                f"❗ Hurmatli foydalanuvchi {mention_html(user)}, guruhda reklama yoki havola yuborish taqiqlangan.",
-                parse_mode=constants.ParseMode.HTML
-            )
-            return
+    await update.message.reply_text("\n".join(lines))
 
-        bad_kw = contains_banned_keyword(text, banned_keywords)
-        if bad_kw:
-            try:
-                await msg.delete()
-            except:
-                pass
 
-            await chat.send_message(
-                f"❗ Hurmatli foydalanuvchi {mention_html(user)}, xabaringizda taqiqlangan so‘z aniqlandi: <b>{bad_kw}</b>.",
-                parse_mode=constants.ParseMode.HTML
-            )
-            return
+async def _set_filter_enabled(update: Update, context: ContextTypes.DEFAULT_TYPE, value: bool):
+    if not await admin_required(update):
+        await update.message.reply_text("❌ Faqat administratorlar uchun.")
+        return
 
-    # A’zolik tekshiruvini o‘chirgan bo‘lsa — qaytamiz
-    if not enforce_membership or not required_channels:
+    names = [a.strip(", ") for a in context.args or [] if a.strip(", ")]
+    unknown = [n for n in names if n not in moderation_pipeline.by_name]
+    if not names or unknown:
+        await update.message.reply_text(
+            "Iltimos, filtr nomini kiriting: " + ", ".join(moderation_pipeline.by_name)
+        )
         return
 
-    # Foydalanuvchi majburiy kanallarga a’zo bo‘lganligini tekshirish
-    not_member_channels = []
+    chat = update.effective_chat
+    disabled = set(load_group_settings(chat.id)["disabled_filters"])
+    if value:
+        disabled -= set(names)
+    else:
+        disabled |= set(names)
+    db.set_disabled_filters(chat.id, sorted(disabled))
+
+    await update.message.reply_text(
+        ("✅ Filtr yoqildi: " if value else "🚫 Filtr o‘chirildi: ") + ", ".join(names)
+    )
+
+
+async def enable_filter_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _set_filter_enabled(update, context, True)
+
+
+async def disable_filter_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _set_filter_enabled(update, context, False)
+
+
+# -----------------------------------------
+# A’zolik tekshiruvi va reklama filtri
+# -----------------------------------------
+# getUpdates bir so‘rovda 100 tagacha yangilanish qaytaradi. Har bir xabarni
+# alohida tekshirish o‘rniga handler xabarni navbatga qo‘yadi, navbat esa
+# so‘rov partiyasi tugagach (update_queue bo‘shaganda) yoki BATCH_MAX_DELAY
+# o‘tgach bir yo‘la qayta ishlanadi:
+#   - guruh sozlamalari har bir chat uchun bir marta o‘qiladi;
+#   - adminlar ro‘yxati chat uchun bir marta olinadi;
+#   - a’zolik har bir noyob foydalanuvchi uchun bir marta tekshiriladi;
+#   - o‘chirishlar parallel yuboriladi, ogohlantirish esa foydalanuvchiga
+#     bitta (sabab bo‘yicha birlashtirilgan) xabar bo‘ladi.
+
+def load_group_settings(group_id: int) -> dict:
+    g = db.get_group(group_id)
+    if g is None:
+        db.ensure_group(group_id)
+        g = db.get_group(group_id)
+
+    kws = [s.strip() for s in g["banned_keywords"].split(",") if s.strip()]
+    g["banned_keywords_list"] = kws or DEFAULT_BANNED_KEYWORDS.copy()
+    g["channel_targets"] = [
+        parse_channel_target(s) for s in g["required_channels"].split(",") if s.strip()
+    ]
+    g["disabled_filters"] = frozenset(
+        s.strip() for s in g["disabled_filters"].split(",") if s.strip()
+    )
+    # lmdb/xotiradagi eski yozuvlarda maydon bo‘lmasligi mumkin
+    g["classifier_threshold"] = float(g.get("classifier_threshold") or 0.0)
+    return g
+
 
-    for ch in required_channels:
-        res = await user_is_member_of_channel(context.bot, user.id, ch)
-        if not res:
-            not_member_channels.append(ch)
+async def safe_delete(bot, chat_id: int, message_id: int) -> bool:
+    try:
+        return await bot.delete_message(chat_id=chat_id, message_id=message_id)
+    except TelegramError:
+        return False
 
-    if not not_member_channels:
-        return  # hammasiga a’zo bo‘lgan
 
-    # ❗ Foydalanuvchi a’zo emas — xabarni o‘chirish
+async def moderate_chat_batch(bot, chat, msgs: List[Message]):
+    traces = tracing.tracer.take(msgs)
+    if not traces:
+        current_traces.set(None)  # handlerdan meros qolgan trace — allaqachon tugagan
+        return await _moderate_chat_batch(bot, chat, msgs)
+    # Partiya spanlari undagi har bir xabar trace’iga yoziladi
+    current_traces.set(traces)
+    current_span.set(None)
     try:
-        await msg.delete()
-    except:
-        pass
+        with trace_span("moderate", **{"chat.id": chat.id, "batch.size": len(msgs)}):
+            await _moderate_chat_batch(bot, chat, msgs)
+    finally:
+        for trace in traces:
+            tracing.tracer.finish(trace)
+
+
+async def _moderate_chat_batch(bot, chat, msgs: List[Message]):
+    current_group.set(chat.id)
+    group_stats.incr("messages", len(msgs))
+    with trace_span("settings.load"):
+        g = load_group_settings(chat.id)
+
+    msgs = [m for m in msgs if m.from_user]
+    verdicts = await moderation_pipeline.run(bot, chat, g, msgs)
+    if not verdicts:
+        return
+
+    # user_id -> {"user": User, "links": bool, "keywords": set}
+    ad_warnings: Dict[int, dict] = {}
+    flood_warnings: Dict[int, User] = {}
+    missing_by_user: Dict[int, Tuple[User, list]] = {}
+
+    for msg, v in verdicts:
+        user = msg.from_user
+
+        if v.reason == "flood":
+            if v.detail:
+                flood_warnings[user.id] = user
+        elif v.reason in ("media", "link", "classifier"):
+            w = ad_warnings.setdefault(user.id, {"user": user, "links": False, "keywords": set()})
+            w["links"] = True
+        elif v.reason == "keyword":
+            w = ad_warnings.setdefault(user.id, {"user": user, "links": False, "keywords": set()})
+            w["keywords"].add(v.detail)
+        elif v.reason == "membership":
+            missing_by_user.setdefault(user.id, (user, v.detail))
+        # "spam" — ogohlantirishsiz o‘chiriladi
+
+    # ❗ Xabarlarni bir yo‘la o‘chirish
+    deleted = await asyncio.gather(*(safe_delete(bot, m.chat_id, m.message_id) for m, _ in verdicts))
+
+    now = time.time()
+    for (m, v), ok in zip(verdicts, deleted):
+        sent_at = (m.edit_date or m.date).timestamp()
+        tracing.audit_log.record(
+            "delete", chat.id, m.from_user.id, v.reason, v.detail,
+            ms=(now - sent_at) * 1000, ok=ok, msg=m.message_id
+        )
+        group_stats.incr("deleted:" + v.reason)
 
+    # Degraded rejimda ogohlantirish va DM yuborilmaydi
+    if load_monitor.degraded:
+        return
+
+    # Ogohlantirishlar — foydalanuvchiga bittadan
+    warnings = (
+        [("flood", u.id, send_flood_warning(bot, chat, u)) for u in flood_warnings.values()]
+        + [("ad", w["user"].id, send_ad_warning(bot, chat, w)) for w in ad_warnings.values()]
+        + [("membership", u.id, send_join_warning(bot, chat, g, u, chs)) for u, chs in missing_by_user.values()]
+    )
+    results = await asyncio.gather(*(coro for _, _, coro in warnings), return_exceptions=True)
+    for (reason, user_id, _), r in zip(warnings, results):
+        tracing.audit_log.record("warn", chat.id, user_id, reason, ok=not isinstance(r, Exception))
+    group_stats.incr("warnings", sum(1 for r in results if not isinstance(r, Exception)))
+
+
+async def send_flood_warning(bot, chat, user):
+    await bot.send_message(
+        chat_id=chat.id,
+        text=f"❗ Hurmatli foydalanuvchi {mention_html(user)}, juda tez xabar yubormoqdasiz. "
+             f"Xabarlaringiz {FLOOD_PENALTY} soniya davomida o‘chiriladi.",
+        parse_mode=constants.ParseMode.HTML
+    )
+
+
+async def send_ad_warning(bot, chat, w: dict):
+    user = w["user"]
+    if w["links"]:
+        text = f"❗ Hurmatli foydalanuvchi {mention_html(user)}, guruhda reklama yoki havola yuborish taqiqlangan."
+    else:
+        kws = ", ".join(sorted(w["keywords"]))
+        text = f"❗ Hurmatli foydalanuvchi {mention_html(user)}, xabaringizda taqiqlangan so‘z aniqlandi: <b>{kws}</b>."
+
+    await bot.send_message(
+        chat_id=chat.id,
+        text=text,
+        parse_mode=constants.ParseMode.HTML
+    )
+
+
+async def send_join_warning(bot, chat, g: dict, user, not_member_channels: list):
     # JOIN TUGMA
-    buttons = [
-        [InlineKeyboardButton(g["join_button_text"], url=f"https://t.me/{c.replace('@', '')}")]
-        for c in not_member_channels
-    ]
+    infos = db.get_channels([c for c in not_member_channels if isinstance(c, int)])
+    buttons = []
+    for c in not_member_channels:
+        url = channel_join_url(c, infos.get(c))
+        if url:
+            buttons.append([InlineKeyboardButton(g["join_button_text"], url=url)])
     kb = InlineKeyboardMarkup(buttons)
 
     notify_text = (
@@ -610,7 +1256,7 @@ async def membership_and_adblock_handler(update: Update, context: ContextTypes.D
         f"A’zo bo‘lgach, bu ogohlantirish xabari avtomatik o‘chiriladi."
     )
 
-    sent = await context.bot.send_message(
+    sent = await bot.send_message(
         chat_id=chat.id,
         text=notify_text,
         reply_markup=kb,
@@ -619,81 +1265,1066 @@ async def membership_and_adblock_handler(update: Update, context: ContextTypes.D
 
     db.save_join_message(user.id, chat.id, chat.id, sent.message_id)
 
-    # DM orqali ogohlantirish
-    dm_text = (
-        "Hurmatli foydalanuvchi,\n\n"
-        "Siz guruhda xabar yuborishdan oldin majburiy kanallarga a’zo bo‘lishingiz kerak.\n"
-        "Iltimos, guruhdagi havolalar orqali kanalga a’zo bo‘ling."
+    # DM orqali ogohlantirish — navbat orqali, guruhlar bo‘yicha birlashtiriladi
+    dm_outbox.enqueue(user.id, chat, [(g["join_button_text"], b[0].url) for b in buttons])
+
+
+async def moderate_batch(bot, msgs: List[Message]):
+    by_chat: Dict[int, List[Message]] = {}
+    for m in msgs:
+        by_chat.setdefault(m.chat_id, []).append(m)
+
+    results = await asyncio.gather(
+        *(moderate_chat_batch(bot, ms[0].chat, ms) for ms in by_chat.values()),
+        return_exceptions=True,
     )
+    for r in results:
+        if isinstance(r, Exception):
+            logger.error(f"Xatolik (moderate_batch): {r}")
 
-    try:
-        dm_sent = await context.bot.send_message(
-            chat_id=user.id,
-            text=dm_text
+
+class ModerationBatcher:
+    def __init__(self):
+        self._pending: List[Message] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, application, msg: Message):
+        self._pending.append(msg)
+
+        # So‘rov partiyasi tugadi (navbat bo‘sh) yoki partiya to‘ldi — darhol
+        if len(self._pending) >= BATCH_MAX_SIZE or application.update_queue.qsize() == 0:
+            self._flush_soon(application, 0)
+        else:
+            self._flush_soon(application, BATCH_MAX_DELAY)
+
+    def _flush_soon(self, application, delay: float):
+        if self._timer is not None:
+            if delay > 0:
+                return  # allaqachon rejalashtirilgan
+            self._timer.cancel()
+            self._timer = None
+
+        if delay <= 0:
+            self._flush(application)
+        else:
+            self._timer = asyncio.get_running_loop().call_later(delay, self._flush, application)
+
+    def _flush(self, application):
+        self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            application.create_task(moderate_batch(application.bot, batch))
+
+
+moderation_batcher = PerBot(ModerationBatcher)
+
+
+async def membership_and_adblock_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Yangi va tahrirlangan xabarlar (tahrir orqali havola qo‘shish mumkin)
+    msg = update.message or update.edited_message
+    if not msg:
+        return
+
+    # Guruhda ishlaydi
+    if msg.chat.type not in ("group", "supergroup"):
+        return
+
+    # Trace partiyaga o‘tadi (add() partiyani darhol yuborishi mumkin)
+    tracing.tracer.defer(msg)
+    moderation_batcher.add(context.application, msg)
+
+
+# -----------------------------------------
+# DM navbati (outbox)
+# -----------------------------------------
+# Bir nechta guruhimizda yozgan a’zo bo‘lmagan foydalanuvchi har bir
+# guruhdan alohida DM olmasligi uchun DM’lar navbatga yig‘iladi va
+# DM_OUTBOX_WINDOW ichida foydalanuvchiga ko‘pi bilan bitta, barcha kutilayotgan
+# guruhlarni sanab o‘tuvchi xabar yuboriladi. Botga /start bosmagan yoki
+# botni bloklagan foydalanuvchilar DM_UNREACHABLE_TTL davomida eslab
+# qolinadi va ularga yuborish umuman urinilmaydi.
+#
+# Sharding rejimida foydalanuvchining guruhlari turli ishchilarda bo‘lishi
+# mumkin. Shuning uchun yuborishdan oldin umumiy keshda "dm:<bot>:<user>"
+# kaliti DM_OUTBOX_WINDOW ga atomar egallanadi: boshqa ishchi egallagan
+# bo‘lsa, guruhlar oyna tugaguncha navbatda qoladi (bitta jarayondagidek).
+# DM qabul qilmaydiganlar ro‘yxati ham umumiy.
+
+class DMOutbox:
+    def __init__(self):
+        # user_id -> {"not_before": float, "groups": {chat_id: (nom, [(tugma, url)])}}
+        self._pending: Dict[int, dict] = {}
+        self._last_sent = TTLCache(DM_OUTBOX_WINDOW)
+        bot_id = current_bot.get()
+        self._claim_prefix = f"dm:{bot_id}:"
+        self.unreachable = SharedTTLCache(
+            DM_UNREACHABLE_TTL, f"unreachable@{bot_id}" if bot_id else "unreachable", shared_cache
+        )
+        self.sent = 0
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def enqueue(self, user_id: int, chat, buttons: List[Tuple[str, str]]):
+        if self.unreachable.get(user_id):
+            self.skipped += 1
+            return
+
+        entry = self._pending.get(user_id)
+        if entry is None:
+            not_before = time.monotonic() + DM_OUTBOX_DELAY
+            last = self._last_sent.get(user_id)
+            if last is not None:
+                not_before = max(not_before, last + DM_OUTBOX_WINDOW)
+            entry = self._pending[user_id] = {"not_before": not_before, "groups": {}}
+
+        entry["groups"][chat.id] = (chat.title or str(chat.id), buttons)
+
+    def take_due(self) -> List[Tuple[int, dict]]:
+        now = time.monotonic()
+        due = [uid for uid, e in self._pending.items() if e["not_before"] <= now]
+        if shared_cache is None:
+            return [(uid, self._pending.pop(uid)["groups"]) for uid in due]
+        result = []
+        for uid in due:
+            if shared_cache.claim(self._claim_prefix + str(uid), DM_OUTBOX_WINDOW):
+                result.append((uid, self._pending.pop(uid)["groups"]))
+                continue
+            # Boshqa ishchi yaqinda DM yuborgan — oyna tugagach
+            found = shared_cache.peek(self._claim_prefix + str(uid))
+            self._pending[uid]["not_before"] = now + (found[1] if found else DM_OUTBOX_DELAY)
+        return result
+
+    def _release(self, user_id: int):
+        if shared_cache is not None:
+            shared_cache.delete(self._claim_prefix + str(user_id))
+
+    async def send(self, bot, user_id: int, groups: dict):
+        lines = "\n".join(f"• {title}" for title, _ in groups.values())
+        dm_text = (
+            "Hurmatli foydalanuvchi,\n\n"
+            "Siz quyidagi guruhlarda xabar yuborishdan oldin majburiy kanallarga a’zo bo‘lishingiz kerak:\n"
+            f"{lines}\n\n"
+            "Iltimos, quyidagi havolalar orqali kanallarga a’zo bo‘ling."
+        )
+
+        # Bir xil kanal bir nechta guruhda talab qilinsa — bitta tugma
+        seen = set()
+        rows = []
+        for _, buttons in groups.values():
+            for text, url in buttons:
+                if url not in seen:
+                    seen.add(url)
+                    rows.append([InlineKeyboardButton(text, url=url)])
+
+        try:
+            dm_sent = await bot.send_message(
+                chat_id=user_id,
+                text=dm_text,
+                reply_markup=InlineKeyboardMarkup(rows) if rows else None,
+            )
+        except Forbidden:
+            self.unreachable.set(user_id, True)
+            return
+        except BadRequest as e:
+            if "chat not found" in str(e).lower():
+                self.unreachable.set(user_id, True)
+            else:
+                self._release(user_id)
+            return
+        except TelegramError as e:
+            logger.warning(f"DM yuborilmadi ({user_id}): {e}")
+            self._release(user_id)
+            return
+
+        self.sent += 1
+        self._last_sent.set(user_id, time.monotonic())
+        for group_id in groups:
+            db.save_join_message(user_id, group_id, user_id, dm_sent.message_id)
+
+
+dm_outbox = PerBot(DMOutbox)
+
+
+async def dm_outbox_job(context: ContextTypes.DEFAULT_TYPE):
+    due = dm_outbox.take_due()
+    if not due:
+        return
+
+    sem = asyncio.Semaphore(DM_OUTBOX_CONCURRENCY)
+
+    async def _one(user_id, groups):
+        async with sem:
+            await dm_outbox.send(context.bot, user_id, groups)
+
+    await asyncio.gather(*(_one(u, g) for u, g in due), return_exceptions=True)
+
+
+# -----------------------------------------
+# Yuklama nazorati (degraded rejim)
+# -----------------------------------------
+# Reyd paytida yangilanishlar navbati o‘sib, moderatsiya daqiqalab orqada
+# qolishi mumkin — bu biroz yumshoqroq moderatsiyadan yomonroq. Navbat
+# chuqurligi yoki event loop kechikishi chegaradan oshsa, bot barcha
+# guruhlarni degraded rejimga o‘tkazadi:
+#   - faqat lokal filtrlar (havola, so‘zlar, flood, media, spam) ishlaydi;
+#   - ogohlantirishlar va DM yuborilmaydi, xabarlar jimgina o‘chiriladi;
+#   - a’zolik faqat keshdan olinadi, keshda yo‘q foydalanuvchilar keyinroq
+#     (rejim normal holatga qaytganda) tekshiriladi;
+#   - adminlar ro‘yxati ham faqat keshdan; keshda bo‘lmasa guruh siyosati
+#     bo‘yicha: fail-open — xabarlar qoldiriladi, fail-closed — o‘chiriladi.
+# Yuklama DEGRADED_RECOVER_AFTER davomida past bo‘lsa, rejim o‘z-o‘zidan
+# normal holatga qaytadi.
+
+class LoadMonitor:
+    def __init__(self):
+        self.degraded = False
+        self.queue_depth = 0
+        self.loop_lag = 0.0
+        self.switches = 0
+        self._calm_since: Optional[float] = None
+        # (user_id, group_id) -> (User, Chat); keyinroq tekshiriladigan a’zoliklar
+        self._deferred: "OrderedDict[Tuple[int, int], Tuple[User, Chat]]" = OrderedDict()
+        # chat_id -> fonda adminlar ro‘yxatini olayotgan vazifa
+        self._warming: Dict[int, asyncio.Task] = {}
+
+    @property
+    def mode(self) -> int:
+        """Metrika: 0 — normal, 1 — degraded."""
+        return 1 if self.degraded else 0
+
+    def defer_membership(self, user: User, chat: Chat):
+        self._deferred[(user.id, chat.id)] = (user, chat)
+        while len(self._deferred) > DEGRADED_DEFERRED_MAX:
+            self._deferred.popitem(last=False)
+
+    def warm_admins(self, bot, chat_id: int):
+        """Keshda yo‘q adminlar ro‘yxatini fonda oladi (bir vaqtda DEGRADED_ADMIN_WARM tadan)."""
+        if chat_id in self._warming or len(self._warming) >= DEGRADED_ADMIN_WARM:
+            return
+        task = asyncio.get_running_loop().create_task(fetch_chat_admin_ids(bot, chat_id))
+        self._warming[chat_id] = task
+        task.add_done_callback(lambda _: self._warming.pop(chat_id, None))
+
+    def update(self, queue_depth: int, loop_lag: float) -> Optional[bool]:
+        """Rejim o‘zgarsa yangi holatni qaytaradi, aks holda None."""
+        self.queue_depth = queue_depth
+        self.loop_lag = loop_lag
+        now = time.monotonic()
+
+        if not self.degraded:
+            if queue_depth >= DEGRADED_QUEUE_DEPTH or loop_lag >= DEGRADED_LOOP_LAG:
+                self.degraded = True
+                self.switches += 1
+                self._calm_since = None
+                return True
+            return None
+
+        calm = queue_depth <= DEGRADED_QUEUE_DEPTH // 4 and loop_lag <= DEGRADED_LOOP_LAG / 4
+        if not calm:
+            self._calm_since = None
+            return None
+        if self._calm_since is None:
+            self._calm_since = now
+        if now - self._calm_since >= DEGRADED_RECOVER_AFTER:
+            self.degraded = False
+            self.switches += 1
+            return False
+        return None
+
+    async def resolve_deferred(self, bot):
+        """A’zo bo‘lmaganlar odatdagidek ogohlantiriladi va qayta tekshiruvga tushadi."""
+        sem = asyncio.Semaphore(CHANNEL_RESOLVE_CONCURRENCY)
+
+        async def _one(user, chat):
+            current_group.set(chat.id)
+            g = load_group_settings(chat.id)
+            if not moderation_pipeline.by_name["membership"].enabled(g):
+                return
+            async with sem:
+                chs = await get_not_member_channels(bot, user.id, g["channel_targets"], g["membership_fail_open"])
+            # Allaqachon ogohlantirilgan bo‘lsa — qayta tekshiruv o‘zi kuzatadi
+            if not chs or db.get_join_messages(user.id, chat.id):
+                return
+            ok = True
+            try:
+                await send_join_warning(bot, chat, g, user, chs)
+            except TelegramError:
+                ok = False
+            tracing.audit_log.record("warn", chat.id, user.id, "membership", ok=ok)
+            if ok:
+                group_stats.incr("warnings")
+
+        while self._deferred and not self.degraded:
+            chunk = []
+            while self._deferred and len(chunk) < 50:
+                chunk.append(self._deferred.popitem(last=False)[1])
+            await asyncio.gather(*(_one(u, c) for u, c in chunk), return_exceptions=True)
+
+
+load_monitor = PerBot(LoadMonitor)
+
+
+async def load_monitor_job(context: ContextTypes.DEFAULT_TYPE):
+    application = context.application
+
+    # Event loop kechikishi: tayyor turgan callback’lar navbati qancha uzun
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    await asyncio.sleep(0)
+    lag = loop.time() - t0
+
+    depth = application.update_queue.qsize() + len(moderation_batcher)
+    changed = load_monitor.update(depth, lag)
+
+    if changed is True:
+        logger.warning(
+            f"Degraded rejim YOQILDI: navbat={depth}, loop kechikishi={lag * 1000:.0f} ms"
+        )
+    elif changed is False:
+        logger.warning(
+            f"Degraded rejim o‘chirildi: navbat={depth}, loop kechikishi={lag * 1000:.0f} ms"
+        )
+        application.create_task(load_monitor.resolve_deferred(application.bot))
+
+
+# ---------------------------
+# /botstatus — yuklama holati
+# ---------------------------
+async def botstatus_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await admin_required(update):
+        await update.message.reply_text("❌ Faqat administratorlar uchun.")
+        return
+
+    text = (
+        "📊 Bot holati:\n\n"
+        f"Rejim: {'degraded' if load_monitor.degraded else 'normal'} ({load_monitor.mode})\n"
+        f"Navbatdagi yangilanishlar: {load_monitor.queue_depth}\n"
+        f"Event loop kechikishi: {load_monitor.loop_lag * 1000:.1f} ms\n"
+        f"Rejim almashishlari: {load_monitor.switches}\n\n"
+        f"get_chat_member: {membership_latency.calls} ta, "
+        f"p95 {(membership_latency.p95 or 0) * 1000:.0f} ms, "
+        f"hedged {membership_latency.hedged}, muddati o‘tgan {membership_latency.timeouts}, "
+        f"xato {membership_latency.errors}"
+    )
+    if shared_cache is not None:
+        text += f"\nUmumiy kesh: {shared_cache.hits} ta topildi, {shared_cache.misses} ta topilmadi"
+    if moderation.ad_classifier.loaded:
+        text += f"\nReklama klassifikatori: {os.path.basename(moderation.ad_classifier.path)} (2**{moderation.ad_classifier.bits})"
+    if tracing.tracer.enabled:
+        text += (
+            f"\nTrace: {tracing.tracer.started} ta, yozilgan {tracing.tracer.exported} "
+            f"(sekin {tracing.tracer.slow}), tashlangan {tracing.tracer.exporter.dropped}"
         )
-        db.save_join_message(user.id, chat.id, user.id, dm_sent.message_id)
-    except:
-        pass
+    await update.message.reply_text(text)
+
+
+# -----------------------------------------
+# Guruh statistikasi (/stats)
+# -----------------------------------------
+# Hisoblagichlar xotirada: har bir guruh uchun oxirgi STATS_MINUTES
+# daqiqalik bo‘laklar va hali yozilmagan soatlik qo‘shimchalar. Event loop
+# bitta oqim — qulf kerak emas. Soatlik qo‘shimchalar STATS_FLUSH_INTERVAL
+# da bir marta SQLite’ga qo‘shiladi (upsert), har bir hodisada emas.
+#
+# Qaysi guruh uchun ishlanayotgani current_group orqali uzatiladi:
+# moderate_chat_batch uni o‘rnatadi, ichidagi barcha Bot API chaqiruvlari
+# va kesh so‘rovlari (gather vazifalari ham) shu guruhga yoziladi.
+
+current_group: contextvars.ContextVar = contextvars.ContextVar("current_group", default=None)
+
+
+class GroupStats:
+    def __init__(self):
+        self._minutes: Dict[int, deque] = {}               # guruh -> deque[(daqiqa, {kalit: soni})]
+        self._pending: Dict[Tuple[int, int], dict] = {}   # (guruh, soat) -> {kalit: soni}
+        self._pruned_hour = 0
+
+    def incr(self, key: str, n: int = 1, chat_id: Optional[int] = None):
+        if chat_id is None:
+            chat_id = current_group.get()
+            if chat_id is None:
+                return
+        minute = int(time.time() // 60)
+
+        ring = self._minutes.get(chat_id)
+        if ring is None:
+            ring = self._minutes[chat_id] = deque(maxlen=STATS_MINUTES)
+        if not ring or ring[-1][0] != minute:
+            ring.append((minute, {}))
+        counters = ring[-1][1]
+        counters[key] = counters.get(key, 0) + n
+
+        pending = self._pending.get((chat_id, minute // 60))
+        if pending is None:
+            pending = self._pending[(chat_id, minute // 60)] = {}
+        pending[key] = pending.get(key, 0) + n
+
+    def recent(self, chat_id: int, minutes: int = STATS_MINUTES) -> Dict[str, int]:
+        since = int(time.time() // 60) - minutes + 1
+        total: Dict[str, int] = {}
+        for minute, counters in self._minutes.get(chat_id, ()):
+            if minute >= since:
+                for k, v in counters.items():
+                    total[k] = total.get(k, 0) + v
+        return total
+
+    def hours(self, chat_id: int, hours: int) -> Dict[str, int]:
+        since_hour = int(time.time() // 3600) - hours + 1
+        total = db.get_group_stats(chat_id, since_hour)
+        for (gid, hour), counters in self._pending.items():
+            if gid == chat_id and hour >= since_hour:
+                for k, v in counters.items():
+                    total[k] = total.get(k, 0) + v
+        return total
+
+    def flush(self):
+        if self._pending:
+            rows = [
+                (gid, hour, k, v)
+                for (gid, hour), counters in self._pending.items()
+                for k, v in counters.items()
+            ]
+            # Xato dvigatelga bog‘liq (sqlite3.Error, lmdb.Error, OSError) —
+            # hisoblagichlar yo‘qolmaydi, keyingi flush’da qayta yoziladi
+            try:
+                db.add_group_stats(rows)
+            except Exception as e:
+                logger.error(f"Statistika saqlanmadi, keyinroq qayta urinib ko‘riladi: {e}")
+            else:
+                self._pending = {}
+
+        # Jim guruhlarning daqiqalik bo‘laklari
+        cutoff = int(time.time() // 60) - STATS_MINUTES
+        for gid in [g for g, ring in self._minutes.items() if ring[-1][0] <= cutoff]:
+            del self._minutes[gid]
+
+        hour = int(time.time() // 3600)
+        if hour != self._pruned_hour:
+            try:
+                db.delete_group_stats_before(hour - STATS_RETENTION_HOURS)
+            except Exception as e:
+                logger.error(f"Eski statistika o‘chirilmadi: {e}")
+            else:
+                self._pruned_hour = hour
+
+
+group_stats = PerBot(GroupStats)
+
+
+async def stats_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    group_stats.flush()
+
+
+STATS_REASON_LABELS = {
+    "flood": "flood",
+    "media": "taqiqlangan media",
+    "spam": "takroriy spam",
+    "link": "havola",
+    "keyword": "taqiqlangan so‘z",
+    "membership": "a’zo emas",
+    "classifier": "reklama klassifikatori",
+}
+
+
+def _format_stats(c: Dict[str, int]) -> List[str]:
+    deleted = sorted(
+        ((k.split(":", 1)[1], v) for k, v in c.items() if k.startswith("deleted:")),
+        key=lambda x: -x[1],
+    )
+    lookups = c.get("cache_hits", 0) + c.get("cache_misses", 0)
+    lines = [
+        f"Xabarlar: {c.get('messages', 0)}",
+        f"O‘chirilgan: {sum(v for _, v in deleted)}",
+    ]
+    lines += [f"  • {STATS_REASON_LABELS.get(r, r)}: {v}" for r, v in deleted]
+    lines += [
+        f"Ogohlantirishlar: {c.get('warnings', 0)}",
+        f"Bot API so‘rovlari: {c.get('api_calls', 0)}",
+        f"Kesh: {c.get('cache_hits', 0) / lookups * 100:.0f}% topildi ({lookups} ta so‘rov)" if lookups
+        else "Kesh: so‘rovlar yo‘q",
+    ]
+    return lines
+
+
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat = update.effective_chat
+
+    # Shaxsiy chatda — global adminlar uchun eng "qimmat" guruhlar
+    if chat.type == "private":
+        if update.effective_user.id not in GLOBAL_ADMINS:
+            await update.message.reply_text("❌ Faqat global administratorlar uchun.")
+            return
+        group_stats.flush()
+        top = db.get_top_groups("api_calls", int(time.time() // 3600) - 23, STATS_TOP_GROUPS)
+        if not top:
+            await update.message.reply_text("📈 Oxirgi 24 soatda statistika yo‘q.")
+            return
+        lines = ["📈 Bot API so‘rovlari bo‘yicha guruhlar (24 soat):\n"]
+        lines += [f"{i}. {gid}: {total}" for i, (gid, total) in enumerate(top, 1)]
+        await update.message.reply_text("\n".join(lines))
+        return
+
+    if not await admin_required(update):
+        await update.message.reply_text("❌ Faqat administratorlar uchun.")
+        return
+
+    text = "\n".join(
+        ["📈 Guruh statistikasi\n", f"⏱ Oxirgi {STATS_MINUTES} daqiqa:"]
+        + _format_stats(group_stats.recent(chat.id))
+        + ["", "📅 Oxirgi 24 soat:"]
+        + _format_stats(group_stats.hours(chat.id, 24))
+    )
+    await update.message.reply_text(text)
+
+
 # -----------------------------------------
 # A’zolikni fon rejimida tekshiruvchi funksiya
 # (Har 5 soniyada bir marta tekshiradi)
 # -----------------------------------------
+# Har bir chaqiruv — bitta o‘tish. Job queue oldingi o‘tish tugamaguncha
+# yangisini boshlamaydi.
+#
+# Faqat vaqti kelgan (user, guruh) juftliklari tekshiriladi: bir necha
+# daqiqada qo‘shilmaganlar odatda umuman qo‘shilmaydi, shuning uchun har
+# muvaffaqiyatsiz tekshiruvdan keyin oraliq RECHECK_SCHEDULE bo‘yicha
+# uzayadi. Foydalanuvchi faolligi (xabar, tugma, chat_member) jadvalni
+# boshidan boshlaydi. Keyingi tekshiruv vaqti bazada — qayta ishga
+# tushganda ham saqlanadi.
+
+class RecheckScheduler:
+    def __init__(self):
+        self._touched: set = set()
+
+    def __len__(self):
+        return len(self._touched)
+
+    def touch(self, user_id: int):
+        # Handler yo‘lida faqat xotira — bazaga keyingi o‘tishda bir yo‘la yoziladi
+        self._touched.add(user_id)
+
+    def flush(self, now: int) -> int:
+        if not self._touched:
+            return 0
+        users, self._touched = list(self._touched), set()
+        return db.reset_rechecks(users, now)
+
+    @staticmethod
+    def backoff(user_id: int, group_id: int, step: int, now: int):
+        step = min(step + 1, len(RECHECK_SCHEDULE) - 1)
+        db.set_recheck(user_id, group_id, step, now + RECHECK_SCHEDULE[step])
+
+
+recheck_scheduler = PerBot(RecheckScheduler)
+
+
+async def recheck_activity_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if user and not user.is_bot:
+        recheck_scheduler.touch(user.id)
+    # Kanalga qo‘shilgan foydalanuvchi (admin qo‘shgan bo‘lsa ham)
+    if update.chat_member:
+        recheck_scheduler.touch(update.chat_member.new_chat_member.user.id)
+
+
+def due_owned_rechecks(now: int) -> List[Tuple[int, int, int]]:
+    # Boshqa ishchi jarayonlarga tegishli guruhlar o‘tkazib yuboriladi — ular
+    # partiyani egallab, shu jarayon navbatini to‘xtatib qo‘ymasligi uchun sahifalanadi
+    owned, offset = [], 0
+    while len(owned) < RECHECK_BATCH:
+        rows = db.get_due_rechecks(now, RECHECK_BATCH, offset)
+        owned += [r for r in rows if owns_chat(r[1])]
+        if len(rows) < RECHECK_BATCH:
+            break
+        offset += len(rows)
+    return owned[:RECHECK_BATCH]
+
 
 async def background_membership_checker(application):
     bot = application.bot
 
-    while True:
-        await asyncio.sleep(5)  # 5 soniya kutish
+    try:
+        now = int(time.time())
+        recheck_scheduler.flush(now)
+
+        for user_id, group_id, step in due_owned_rechecks(now):
+            current_group.set(group_id)
+
+            required_channels = get_channel_targets(group_id)
+            if not required_channels:
+                recheck_scheduler.backoff(user_id, group_id, step, now)
+                continue
+
+            # Foydalanuvchi hamma kanallarga a'zo bo‘lganmi?
+            fully_joined = True
+            for ch in required_channels:
+                # Shu yoki boshqa jarayon yaqinda a’zo deb topgan bo‘lsa — so‘rov shart emas
+                res = membership_cache.get((ch, user_id))
+                if res is not True:
+                    res = await user_is_member_of_channel(bot, user_id, ch)
+                    remember_membership(user_id, ch, res)
+                if not res:
+                    fully_joined = False
+                    break
+
+            if not fully_joined:
+                # hali ham a’zo emas — keyingi tekshiruv kechroq
+                recheck_scheduler.backoff(user_id, group_id, step, now)
+                continue
+
+            # ❗ A’zo bo‘lgan — endi xabarlarni o‘chiramiz
+            join_msgs = db.get_join_messages(user_id, group_id)
+
+            for chat_id, message_id in join_msgs:
+                # Birlashtirilgan DM boshqa guruhlar uchun ham kutilayotgan bo‘lsa — qoldiramiz
+                if db.count_join_message_refs(chat_id, message_id) > 1:
+                    continue
+                try:
+                    await bot.delete_message(chat_id=chat_id, message_id=message_id)
+                except:
+                    pass
+
+            # Ma’lumotlar bazasidan tozalash
+            db.delete_join_messages(user_id, group_id)
+            tracing.audit_log.record("resolved", group_id, user_id, "membership")
+
+    except Exception as e:
+        logger.error(f"Xatolik (background_membership_checker): {e}")
+
+
+async def membership_check_job(context: ContextTypes.DEFAULT_TYPE):
+    await background_membership_checker(context.application)
+
+
+# -----------------------------------------
+# Muddati o‘tgan ogohlantirishlarni tozalash
+# -----------------------------------------
+# Foydalanuvchi kanalga hech qachon qo‘shilmasa, yozuv abadiy qolib
+# ketmasligi uchun har bir yozuvning muddati (expires_at) bor. Muddati
+# o‘tganlar partiya bilan olinadi, ogohlantirish xabarlari parallel
+# o‘chiriladi, so‘ng bo‘shagan sahifalar faylga qaytariladi.
+
+async def expire_join_messages(bot) -> int:
+    rows = db.pop_expired_join_messages(int(time.time()), PENDING_SWEEP_BATCH)
+    if not rows:
+        return 0
+
+    # Birlashtirilgan DM hali boshqa guruh uchun kutilayotgan bo‘lsa — qoldiramiz
+    targets = {
+        (chat_id, message_id) for _, _, chat_id, message_id in rows
+        if db.count_join_message_refs(chat_id, message_id) == 0
+    }
+    sem = asyncio.Semaphore(PENDING_DELETE_CONCURRENCY)
+
+    async def _one(chat_id: int, message_id: int):
+        async with sem:
+            await safe_delete(bot, chat_id, message_id)
+
+    await asyncio.gather(*(_one(c, m) for c, m in targets))
+
+    for user_id, group_id, _, _ in rows:
+        tracing.audit_log.record("expired", group_id, user_id, "membership")
+    db.compact()
+    return len(rows)
+
+
+async def expire_join_messages_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        n = await expire_join_messages(context.bot)
+        while n == PENDING_SWEEP_BATCH:
+            n = await expire_join_messages(context.bot)
+    except Exception as e:
+        logger.error(f"Xatolik (expire_join_messages): {e}")
+
+
+async def my_chat_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Bot guruhdan chiqarilganda — o‘sha guruhning kutilayotgan yozuvlarini o‘chirish."""
+    change = update.my_chat_member
+    if change.new_chat_member.status not in (ChatMember.LEFT, ChatMember.BANNED):
+        return
+    removed = db.delete_group_join_messages(change.chat.id)
+    if removed:
+        logger.info(f"Guruh {change.chat.id}: bot chiqarildi, {removed} ta kutilayotgan yozuv o‘chirildi")
+
+
+# -----------------------------------------
+# Kanallarni davriy qayta tekshirish
+# -----------------------------------------
+# Eskirgan kanallar (nomi, username yoki havolasi o‘zgargan bo‘lishi mumkin)
+# va hali raqamli ID ga aylantirilmagan eski @username yozuvlari bir
+# yo‘la get_chat orqali yangilanadi.
+
+async def refresh_channels(bot):
+    try:
+        # 1) Eskirgan kanallar — raqamli ID orqali
+        stale = db.get_stale_channels(CHANNEL_REVALIDATE_AGE)
+        if stale:
+            resolved = await resolve_channels(bot, stale)
+            fresh = []
+            for chat_id, r in zip(stale, resolved):
+                if r is None:
+                    logger.warning(f"Kanal {chat_id} mavjud emas yoki bot undan chiqarilgan")
+                    continue
+                known = db.get_channels([chat_id]).get(chat_id)
+                if known:
+                    r["ident"] = known["ident"]
+                fresh.append(r)
+            if fresh:
+                db.save_channels(fresh)
+
+        # 2) Hali aniqlanmagan eski yozuvlar (@kanal1)
+        legacy = {}
+        for group_id, channels in db.get_all_required_channels().items():
+            for ch in channels:
+                target = parse_channel_target(ch)
+                if isinstance(target, str):
+                    legacy.setdefault(target, []).append(group_id)
+
+        if legacy:
+            idents = list(legacy)
+            resolved = await resolve_channels(bot, idents)
+            mapping = {i: r for i, r in zip(idents, resolved) if r is not None}
+            db.save_channels(list(mapping.values()))
+
+            for group_id in {g for groups in legacy.values() for g in groups}:
+                new_channels = []
+                for ch in db.get_required_channels(group_id):
+                    r = mapping.get(parse_channel_target(ch))
+                    new_channels.append(str(r["chat_id"]) if r else ch)
+                db.set_required_channels(group_id, new_channels)
+
+        if stale or legacy:
+            logger.info(f"Kanallar qayta tekshirildi: {len(stale)} ta eskirgan, {len(legacy)} ta eski yozuv")
+
+    except Exception as e:
+        logger.error(f"Xatolik (refresh_channels): {e}")
+
+
+async def revalidate_channels_job(context: ContextTypes.DEFAULT_TYPE):
+    await refresh_channels(context.bot)
+
+
+# -----------------------------------------
+# Flood detektorini tozalash
+# -----------------------------------------
+
+async def flood_sweep_job(context: ContextTypes.DEFAULT_TYPE):
+    evicted = flood_detector.sweep()
+    if evicted:
+        logger.debug(f"Flood detektori: {evicted} ta jim foydalanuvchi unutildi, {len(flood_detector)} ta qoldi")
+
+
+# -----------------------------------------
+# Keshlar snapshot’i (warm start)
+# -----------------------------------------
+# Har deploy/restartdan keyin bo‘sh keshlar Telegram’ga admin va a’zolik
+# so‘rovlari oqimini yuboradi. To‘xtash paytida (va davriy ravishda)
+# adminlar ro‘yxati, a’zolik natijalari va DM qabul qilmaydiganlar qolgan
+# TTL bilan gzip JSON faylga yoziladi, ishga tushganda qayta yuklanadi.
+# Aniqlangan kanal ID lari allaqachon channels jadvalida saqlanadi.
+# Qo‘shimcha botlar faylida faqat o‘z DM ro‘yxati — umumiy keshlar
+# asosiy bot faylida.
+
+SNAPSHOT_VERSION = 1
+
+
+def build_snapshot() -> dict:
+    shared = not current_bot.get()
+    return {
+        "v": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "admins": [
+            [chat_id, round(ttl, 1), sorted(ids)]
+            for chat_id, ids, ttl in admin_cache.items_with_ttl()
+        ] if shared else [],
+        "membership": [
+            [target, user_id, round(ttl, 1), 1 if res else 0]
+            for (target, user_id), res, ttl in membership_cache.items_with_ttl()
+        ] if shared else [],
+        "dm_unreachable": [
+            [user_id, round(ttl, 1)]
+            for user_id, _, ttl in dm_outbox.unreachable.items_with_ttl()
+        ],
+    }
+
+
+def restore_snapshot(data: dict) -> Tuple[int, int]:
+    if data.get("v") != SNAPSHOT_VERSION:
+        return 0, 0
+
+    # Fayl yozilgandan beri o‘tgan vaqt qolgan TTL dan ayiriladi
+    age = max(0.0, time.time() - data.get("saved_at", 0))
+
+    admins = 0
+    for chat_id, ttl, ids in data.get("admins", []):
+        if ttl > age:
+            admin_cache.set(chat_id, frozenset(ids), ttl=ttl - age)
+            admins += 1
+
+    members = 0
+    for target, user_id, ttl, res in data.get("membership", []):
+        if ttl > age:
+            membership_cache.set((target, user_id), bool(res), ttl=ttl - age)
+            members += 1
+
+    for user_id, ttl in data.get("dm_unreachable", []):
+        if ttl > age:
+            dm_outbox.unreachable.set(user_id, True, ttl=ttl - age)
+
+    return admins, members
+
+
+def _write_snapshot_file(path: str, data: dict):
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+async def save_snapshot(path: str = SNAPSHOT_PATH):
+    data = build_snapshot()
+    try:
+        # Fayl yozish event loop’ni to‘xtatmasligi uchun alohida oqimda
+        await asyncio.get_running_loop().run_in_executor(None, _write_snapshot_file, path, data)
+    except OSError as e:
+        logger.error(f"Snapshot saqlanmadi: {e}")
+        return
+    logger.info(
+        f"Snapshot saqlandi: {len(data['admins'])} ta guruh adminlari, "
+        f"{len(data['membership'])} ta a’zolik natijasi"
+    )
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH):
+    if not os.path.exists(path):
+        return
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Snapshot o‘qilmadi: {e}")
+        return
+
+    admins, members = restore_snapshot(data)
+    logger.info(f"Snapshot yuklandi: {admins} ta guruh adminlari, {members} ta a’zolik natijasi")
+
+
+def snapshot_path() -> str:
+    if current_bot.get():
+        return SNAPSHOT_PATH.replace(".snapshot", f".bot{current_bot.get()}.snapshot")
+    if sharding.SHARD_COUNT <= 1:
+        return SNAPSHOT_PATH
+    return SNAPSHOT_PATH.replace(".snapshot", f".shard{sharding.SHARD_INDEX}.snapshot")
+
+
+async def snapshot_job(context: ContextTypes.DEFAULT_TYPE):
+    await save_snapshot(snapshot_path())
+
+
+async def post_init(application):
+    load_snapshot(snapshot_path())
+    if current_bot.get():
+        return  # umumiy resurslar asosiy bot bilan yuklanadi
+    refresh_blocked_media()
+    if moderation.ad_classifier.load():
+        logger.info(f"Reklama klassifikatori yuklandi: {moderation.ad_classifier.path} (2**{moderation.ad_classifier.bits})")
+
+
+async def post_shutdown(application):
+    await save_snapshot(snapshot_path())
+    group_stats.flush()
+    if not current_bot.get():
+        # Umumiy jurnallar — asosiy bot oxirida to‘xtaydi
+        await tracing.update_journal.flush()
+        await tracing.audit_log.flush()
+        await tracing.tracer.exporter.flush()
+
+
+# -----------------------------------------
+# Keshlarni oldindan to‘ldirish (pre-warm)
+# -----------------------------------------
+# Snapshot bo‘lmasa ham, ishga tushgach bazadagi barcha guruhlar uchun
+# adminlar ro‘yxati va kanal ID lari fon rejimida olinadi. So‘rovlar soni
+# PREWARM_CONCURRENCY va PREWARM_RATE bilan cheklanadi, degraded rejimda
+# esa to‘ldirish to‘xtab turadi — moderatsiya har doim ustun.
+
+class RateLimiter:
+    """So‘rovlar orasida kamida 1/rate soniya bo‘lishini ta’minlaydi."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
 
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+
+async def prewarm_caches(bot):
+    t0 = time.monotonic()
+
+    # Kanallar: eskirgan va hali aniqlanmagan yozuvlar
+    if sharding.SHARD_INDEX == 0:
+        await refresh_channels(bot)
+
+    group_ids = [
+        gid for gid in db.get_group_ids()
+        if owns_chat(gid) and admin_cache.get(gid) is None
+    ]
+    total = len(group_ids)
+    if not total:
+        logger.info("Pre-warm: barcha guruhlar keshda, to‘ldirish shart emas")
+        return
+
+    logger.info(f"Pre-warm boshlandi: {total} ta guruh adminlari")
+    limiter = RateLimiter(PREWARM_RATE)
+    sem = asyncio.Semaphore(PREWARM_CONCURRENCY)
+    done = 0
+    last_log = time.monotonic()
+
+    async def _one(group_id: int):
+        nonlocal done, last_log
+        current_group.set(group_id)
+        async with sem:
+            while load_monitor.degraded:
+                await asyncio.sleep(LOAD_CHECK_INTERVAL)
+            await limiter.wait()
+            await get_chat_admin_ids(bot, group_id)
+
+        done += 1
+        if time.monotonic() - last_log >= PREWARM_LOG_INTERVAL:
+            last_log = time.monotonic()
+            logger.info(f"Pre-warm: {done}/{total} guruh")
+
+    await asyncio.gather(*(_one(gid) for gid in group_ids), return_exceptions=True)
+    logger.info(f"Pre-warm tugadi: {done}/{total} guruh, {time.monotonic() - t0:.1f} soniya")
+
+
+async def prewarm_job(context: ContextTypes.DEFAULT_TYPE):
+    await prewarm_caches(context.bot)
+
+
+# -----------------------------------------
+# /auditlog — moderatsiya jurnali xulosasi
+# -----------------------------------------
+
+AUDIT_REASON_LABELS = {
+    "flood": "flood",
+    "media": "taqiqlangan media",
+    "spam": "takroriy spam",
+    "link": "havola",
+    "keyword": "taqiqlangan so‘z",
+    "membership": "a’zo emas",
+    "ad": "reklama",
+    "classifier": "reklama klassifikatori",
+}
+
+
+async def auditlog_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await admin_required(update):
+        await update.message.reply_text("❌ Faqat administratorlar uchun.")
+        return
+
+    if not tracing.audit_log.enabled:
+        await update.message.reply_text("ℹ️ Audit jurnali o‘chirilgan (BOT_AUDIT_DIR).")
+        return
+
+    hours = AUDIT_DEFAULT_HOURS
+    if context.args:
         try:
-            # Foydalanuvchining barcha kutayotgan (pending) guruhlarini olish
-            c = db.conn.cursor()
-            c.execute("SELECT DISTINCT user_id FROM pending_join_msgs")
-            users = [r[0] for r in c.fetchall()]
-
-            for user_id in users:
-                # Ushbu foydalanuvchi uchun barcha guruhlar
-                group_ids = db.get_pending_groups_for_user(user_id)
-
-                for group_id in group_ids:
-                    required_channels = db.get_required_channels(group_id)
-                    if not required_channels:
-                        continue
-
-                    # Foydalanuvchi hamma kanallarga a'zo bo‘lganmi?
-                    fully_joined = True
-                    for ch in required_channels:
-                        res = await user_is_member_of_channel(bot, user_id, ch)
-                        if not res:
-                            fully_joined = False
-                            break
-
-                    if not fully_joined:
-                        continue  # hali ham a’zo emas
-
-                    # ❗ A’zo bo‘lgan — endi xabarlarni o‘chiramiz
-                    join_msgs = db.get_join_messages(user_id, group_id)
-
-                    for chat_id, message_id in join_msgs:
-                        try:
-                            await bot.delete_message(chat_id=chat_id, message_id=message_id)
-                        except:
-                            pass
-
-                    # Ma’lumotlar bazasidan tozalash
-                    db.delete_join_messages(user_id, group_id)
-
-        except Exception as e:
-            logger.error(f"Xatolik (background_membership_checker): {e}")
+            hours = max(1, int(context.args[0]))
+        except ValueError:
+            await update.message.reply_text("Foydalanish: /auditlog [soat]\nMasalan: /auditlog 6")
+            return
+
+    await tracing.audit_log.flush()
+    total = await tracing.audit_log.chat_summary(update.effective_chat.id, hours)
+    if not total:
+        await update.message.reply_text(f"📋 Oxirgi {hours} soatda moderatsiya amallari yo‘q.")
+        return
+
+    sections = [
+        ("delete", "🗑 O‘chirilgan xabarlar"),
+        ("warn", "❗ Ogohlantirishlar"),
+        ("resolved", "✅ A’zolik tasdiqlandi"),
+        ("expired", "⌛ Muddati o‘tgan ogohlantirishlar"),
+    ]
+    lines = [f"📋 Moderatsiya jurnali (oxirgi {hours} soat):"]
+    for action, title in sections:
+        items = sorted(
+            ((k.partition(":")[2], n, ms) for k, (n, ms) in total.items() if k.partition(":")[0] == action),
+            key=lambda x: -x[1],
+        )
+        if not items:
             continue
+        count = sum(n for _, n, _ in items)
+        head = f"\n{title}: {count}"
+        if action == "delete":
+            head += f" (o‘rtacha {sum(ms for _, _, ms in items) / count / 1000:.1f} s ichida)"
+        lines.append(head)
+        for reason, n, _ in items:
+            if reason:
+                lines.append(f"  • {AUDIT_REASON_LABELS.get(reason, reason)}: {n}")
+
+    await update.message.reply_text("\n".join(lines))
 
 
 # -----------------------------------------
 # Botni ishga tushirish — MAIN()
 # -----------------------------------------
 
-def main():
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
+def build_application(with_updater: bool = True, base_url: Optional[str] = None, token: Optional[str] = None):
+    # Qo‘shimcha bot (current_bot) — umumiy jurnal va keshlar vazifalari asosiy botda
+    main_bot = not current_bot.get()
+    builder = (
+        ApplicationBuilder()
+        .token(token or BOT_TOKEN)
+        .request(build_api_request())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        # Soxta Bot API (replay.py)
+        builder = builder.base_url(base_url)
+    if with_updater:
+        builder = builder.get_updates_request(build_get_updates_request())
+    else:
+        # Sharding rejimida yangilanishlarni old jarayon uzatadi
+        builder = builder.updater(None)
+    application = builder.build()
+
+    # Jurnal — boshqa handlerlardan oldin, har bir yangilanish uchun
+    if tracing.update_journal.enabled:
+        application.add_handler(TypeHandler(Update, journal_update_handler), group=-1)
+        if main_bot:
+            application.job_queue.run_repeating(
+                journal_flush_job,
+                interval=JOURNAL_FLUSH_INTERVAL,
+                first=JOURNAL_FLUSH_INTERVAL
+            )
+
+    # Trace — eng birinchi boshlanadi, eng oxirgi guruhda tugaydi
+    # (moderatsiyaga o‘tgan xabarlar trace’ini partiya tugatadi)
+    if tracing.tracer.enabled:
+        application.add_handler(TypeHandler(Update, trace_start_handler), group=-3)
+        application.add_handler(TypeHandler(Update, trace_finish_handler), group=1001)
+        if main_bot:
+            application.job_queue.run_repeating(
+                trace_flush_job,
+                interval=TRACE_FLUSH_INTERVAL,
+                first=TRACE_FLUSH_INTERVAL
+            )
+
+    # Foydalanuvchi faolligi — qayta tekshirish jadvalini boshidan boshlash
+    application.add_handler(TypeHandler(Update, recheck_activity_handler), group=-2)
 
     # Buyruqlar
     application.add_handler(CommandHandler("start", start_cmd))
@@ -705,7 +2336,20 @@ def main():
     application.add_handler(CommandHandler("disable_membership", disable_membership_cmd))
     application.add_handler(CommandHandler("enable_adblock", enable_adblock_cmd))
     application.add_handler(CommandHandler("disable_adblock", disable_adblock_cmd))
+    application.add_handler(CommandHandler("setfailpolicy", setfailpolicy_cmd))
+    application.add_handler(CommandHandler("setadthreshold", setadthreshold_cmd))
     application.add_handler(CommandHandler("listsettings", listsettings_cmd))
+    application.add_handler(CommandHandler("blockmedia", blockmedia_cmd))
+    application.add_handler(CommandHandler("unblockmedia", unblockmedia_cmd))
+    application.add_handler(CommandHandler("filters", filters_cmd))
+    application.add_handler(CommandHandler("enable_filter", enable_filter_cmd))
+    application.add_handler(CommandHandler("disable_filter", disable_filter_cmd))
+    application.add_handler(CommandHandler("botstatus", botstatus_cmd))
+    application.add_handler(CommandHandler("auditlog", auditlog_cmd))
+    application.add_handler(CommandHandler("stats", stats_cmd))
+
+    # Bot guruhdan chiqarilganda
+    application.add_handler(ChatMemberHandler(my_chat_member_handler, ChatMemberHandler.MY_CHAT_MEMBER))
 
     # Xabarlar uchun asosiy handler
     application.add_handler(
@@ -717,14 +2361,189 @@ def main():
 
     # Fon ishchi vazifa — har 5 soniyada tekshiradi
     application.job_queue.run_repeating(
-        lambda context: asyncio.create_task(background_membership_checker(application)),
+        membership_check_job,
         interval=5,
         first=5
     )
 
+    # Muddati o‘tgan ogohlantirishlar (umumiy jadval — faqat bitta ishchida)
+    if sharding.SHARD_INDEX == 0:
+        application.job_queue.run_repeating(
+            expire_join_messages_job,
+            interval=PENDING_SWEEP_INTERVAL,
+            first=PENDING_SWEEP_INTERVAL
+        )
+
+    # Ishga tushgach keshlarni fon rejimida to‘ldirish
+    application.job_queue.run_once(prewarm_job, when=1)
+
+    # Kanallarni davriy qayta tekshirish (umumiy jadval — faqat bitta ishchida)
+    if sharding.SHARD_INDEX == 0:
+        application.job_queue.run_repeating(
+            revalidate_channels_job,
+            interval=CHANNEL_REVALIDATE_INTERVAL,
+            first=10
+        )
+
+    # Boshqa ishchilar qo‘shgan taqiqlangan media
+    if sharding.SHARD_COUNT > 1 and main_bot:
+        application.job_queue.run_repeating(
+            blocked_media_refresh_job,
+            interval=BLOCKED_MEDIA_REFRESH_INTERVAL,
+            first=BLOCKED_MEDIA_REFRESH_INTERVAL
+        )
+
+    # Umumiy keshdagi eskirgan yozuvlarni tozalash
+    if shared_cache is not None and sharding.SHARD_INDEX == 0 and main_bot:
+        application.job_queue.run_repeating(
+            shared_cache_purge_job,
+            interval=SHARED_CACHE_PURGE_INTERVAL,
+            first=SHARED_CACHE_PURGE_INTERVAL
+        )
+
+    # Audit jurnalini diskka yozish
+    if tracing.audit_log.enabled and main_bot:
+        application.job_queue.run_repeating(
+            audit_flush_job,
+            interval=AUDIT_FLUSH_INTERVAL,
+            first=AUDIT_FLUSH_INTERVAL
+        )
+
+    # Statistikani SQLite’ga yozish
+    application.job_queue.run_repeating(
+        stats_flush_job,
+        interval=STATS_FLUSH_INTERVAL,
+        first=STATS_FLUSH_INTERVAL
+    )
+
+    # DM navbatini yuborish
+    application.job_queue.run_repeating(
+        dm_outbox_job,
+        interval=DM_OUTBOX_FLUSH_INTERVAL,
+        first=DM_OUTBOX_FLUSH_INTERVAL
+    )
+
+    # Keshlarni davriy saqlash
+    application.job_queue.run_repeating(
+        snapshot_job,
+        interval=SNAPSHOT_INTERVAL,
+        first=SNAPSHOT_INTERVAL
+    )
+
+    # Yuklama nazorati (degraded rejim)
+    application.job_queue.run_repeating(
+        load_monitor_job,
+        interval=LOAD_CHECK_INTERVAL,
+        first=LOAD_CHECK_INTERVAL
+    )
+
+    # Flood detektoridagi jim foydalanuvchilarni tozalash
+    application.job_queue.run_repeating(
+        flood_sweep_job,
+        interval=FLOOD_SWEEP_INTERVAL,
+        first=FLOOD_SWEEP_INTERVAL
+    )
+
+    return application
+
+
+# --- Bir jarayonda bir nechta bot ---
+# run_polling() faqat bitta Application uchun, shuning uchun har bir bot
+# initialize/start/start_polling bilan alohida vazifada ishga tushiriladi
+# (vazifa ichida current_bot o‘rnatiladi). To‘xtashda qo‘shimcha botlar
+# avval, asosiy bot oxirida to‘xtaydi — umumiy jurnallar oxirgi marta yoziladi.
+
+async def _start_bot(bot_id: int, token: str):
+    current_bot.set(bot_id)
+    application = build_application(token=token)
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+    logger.info(f"Bot @{application.bot.username} ishga tushdi (bo‘lim {bot_id})")
+    return application
+
+
+async def _stop_bot(bot_id: int, application):
+    current_bot.set(bot_id)
+    try:
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+    finally:
+        await post_shutdown(application)
+
+
+async def _run_bots(tokens: List[str]):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    started = []
+    try:
+        for i, token in enumerate(tokens):
+            bot_id = token_bot_id(token) if i else 0
+            started.append((bot_id, await asyncio.create_task(_start_bot(bot_id, token))))
+        await stop.wait()
+    finally:
+        for bot_id, application in reversed(started):
+            try:
+                await asyncio.create_task(_stop_bot(bot_id, application))
+            except Exception as e:
+                logger.error(f"Bot to‘xtatilmadi (bo‘lim {bot_id}): {e}")
+
+
+def run_multi_bot(tokens: List[str]):
+    ids = [token_bot_id(t) for t in tokens]
+    if len(set(ids)) != len(ids):
+        raise SystemExit("BOT_TOKEN va BOT_EXTRA_TOKENS da bir xil bot takrorlangan")
+    asyncio.run(_run_bots(tokens))
+
+
+# --- Ko‘p jarayonli rejim ---
+# Ishchi jarayon (spawn) bot.py ni qaytadan import qiladi — o‘z SQLite
+# ulanishi bilan; webhook qabul qiluvchi va ishchi tsikli sharding.py da.
+
+def run_shard_worker(index: int, count: int):
+    sharding.assign_shard(index, count)
+    start_log_listener()
+    try:
+        asyncio.run(sharding.serve_shard_worker(index, build_application))
+    finally:
+        stop_log_listener()
+
+
+def main():
+    start_log_listener()
+    try:
+        _main()
+    finally:
+        stop_log_listener()
+
+
+def _main():
+    workers = int(os.environ.get("BOT_WORKERS", "1"))
+    if workers > 1:
+        if BOT_EXTRA_TOKENS:
+            raise SystemExit("BOT_EXTRA_TOKENS sharding rejimida (BOT_WORKERS > 1) qo‘llanmaydi")
+        print(f"Bot {workers} ta ishchi jarayon bilan ishga tushirildi...")
+        sharding.run_sharded(workers, run_shard_worker, Bot(BOT_TOKEN, request=build_api_request()))
+        return
+
+    if BOT_EXTRA_TOKENS:
+        print(f"Bot {1 + len(BOT_EXTRA_TOKENS)} ta token bilan bitta jarayonda ishga tushirildi...")
+        run_multi_bot([BOT_TOKEN] + BOT_EXTRA_TOKENS)
+        return
+
+    application = build_application()
+
     print("Bot ishga tushirildi...")
 
-    application.run_polling()
+    # chat_member (kanalga qo‘shilish) standart ro‘yxatda yo‘q
+    application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
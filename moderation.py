@@ -0,0 +1,869 @@
+"""
+Moderatsiya filtrlari: matnni normallashtirish, havola va kalit so‘zlar,
+reklama klassifikatori, guruhlararo spam izlari, flood detektori,
+taqiqlangan media va ularni narxi bo‘yicha ishlatadigan filtrlar zanjiri.
+
+Tarmoqqa bog‘liq qismlar (a’zolik filtri, adminlar ro‘yxati) bot.py da —
+zanjir ularni tashqaridan oladi.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import re
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Message
+
+from sharding import PerBot
+from storage import SharedCache, TTLCache, shared_cache
+from tracing import trace_span
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # ixtiyoriy — faqat reklama klassifikatori uchun
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Sozlamalar
+# ---------------------------
+
+# Reklama klassifikatori (ixtiyoriy, NumPy kerak; train_classifier.py bilan o‘rgatiladi)
+CLASSIFIER_PATH = os.environ.get("BOT_CLASSIFIER", "ad_classifier.npy")
+CLASSIFIER_NGRAMS = (2, 3, 4)  # belgi n-grammalari — o‘zgartirilsa model qayta o‘rgatiladi
+CLASSIFIER_BITS = 18           # xesh fazosi: 2**18 og‘irlik (float32 — 1 MB)
+
+# Guruhlararo takroriy spam (fingerprint)
+SPAM_FP_WINDOW = 600           # sirpanuvchi oyna, soniya
+SPAM_FP_BUCKETS = 6            # oyna nechta bo‘lakka bo‘linadi
+SPAM_FP_WIDTH = 4096           # count-min sketch kengligi
+SPAM_FP_DEPTH = 4              # count-min sketch chuqurligi
+SPAM_FP_CHAT_THRESHOLD = 3     # nechta turli guruhda ko‘rinsa — spam...
+SPAM_FP_USER_THRESHOLD = 2     # ...va nechta turli foydalanuvchidan (bitta odamning e’loni — spam emas)
+SPAM_FP_MIN_LENGTH = 30        # qisqa matnlar ("salom") hisobga olinmaydi
+
+# Flood (juda tez xabar yuborish)
+FLOOD_MAX_MESSAGES = 5         # shuncha xabar...
+FLOOD_WINDOW = 3.0             # ...shuncha soniya ichida — flood
+FLOOD_PENALTY = 60             # flood holati davomiyligi, soniya
+FLOOD_IDLE_EVICT = 300         # shuncha vaqt jim turgan foydalanuvchi unutiladi
+
+# Taqiqlangan media (file_unique_id) va forward qilingan kanallar
+MEDIA_BLOCKLIST_MAX = 50_000
+
+# Verdiktlar keshi (bir xil yoki o‘zgarmagan tahrirlangan matnlar uchun)
+VERDICT_CACHE_PER_CHAT = 512
+VERDICT_CACHE_CHATS = 2_000
+
+
+# ---------------------------
+# Matnni normallashtirish
+# ---------------------------
+# Reklamachilar filtrlarni chetlab o‘tish uchun lotin harflari o‘rniga
+# o‘xshash kirill/yunon harflarini ("саsіno"), ko‘rinmas belgilarni
+# ("ka\u200bzino"), matematik/keng shriftlarni ("𝐤𝐚𝐳𝐢𝐧𝐨", "ｔ.ｍｅ") va
+# bo‘shliqli havolalarni ("t . me / kanal", "t[.]me") ishlatadi.
+#
+# normalize_text() matnni bitta ko‘rinishga keltiradi: casefold, keyin
+# oldindan tuzilgan str.translate jadvali (o‘xshash harflar -> lotin,
+# ko‘rinmas belgilar -> o‘chiriladi), bo‘shliqlarni bittaga qisqartirish va
+# bitta kompilyatsiya qilingan tozalash regex’i (faqat matnda bo‘shliqli
+# nuqta, qavs yoki "dot" bo‘lsa). Natija faqat solishtirish uchun — hech qayerda
+# ko‘rsatilmaydi. Taqiqlangan so‘zlar ham xuddi shu funksiyadan o‘tadi,
+# shuning uchun kirillcha kalit so‘zlar ("реклама") ham ishlaydi.
+#
+# Havolalar uchun normalize_link_text() — o‘xshash harflarsiz: faqat o‘zi
+# ASCII belgiga teng bo‘lganlar (keng/matematik shrift, ko‘rinmas belgilar)
+# almashtiriladi. Aks holda oddiy kirillcha matn ("Ура.Ок" -> "ypa.ok")
+# havolaga aylanardi. Domen oldidagi nuqta ham faqat niqoblangan
+# ko‘rinishda ("[.]", "(.)", "dot", "nuqta") qo‘shiladi — oddiy gap oxiri
+# ("keldim. Online dars") havola emas.
+# Natijalar keshlanadi: havola va kalit so‘z filtrlari bitta xabar uchun
+# normallashtirishni bir marta bajaradi.
+
+TEXT_NORM_CACHE_SIZE = 4096
+LINK_DETAIL_MAX = 200          # auditdagi havola uzunligi
+
+# casefold’dan keyingi kichik harflar
+_HOMOGLYPHS = {
+    # kirill
+    "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x",
+    "к": "k", "і": "i", "ј": "j", "ѕ": "s", "һ": "h", "ԁ": "d", "ԛ": "q", "ԝ": "w",
+    # yunon
+    "α": "a", "ο": "o", "ρ": "p", "ι": "i", "κ": "k", "ν": "v", "υ": "u", "χ": "x", "γ": "y",
+}
+
+# nuqta va slash o‘xshashlari (havolalar uchun ham)
+_PUNCT_LOOKALIKES = {"。": ".", "｡": ".", "․": ".", "﹒": ".", "∕": "/", "⁄": "/"}
+
+_INVISIBLE = (
+    [0x00AD, 0x034F, 0x061C, 0x115F, 0x1160, 0x180E, 0x3164, 0xFEFF, 0xFFA0]
+    + list(range(0x200B, 0x2010))     # zero-width, LRM/RLM
+    + list(range(0x202A, 0x202F))     # yo‘nalish belgilari
+    + list(range(0x2060, 0x2070))     # word joiner, invisible operators
+    + list(range(0xFE00, 0xFE10))     # variation selectors
+    + list(range(0x0300, 0x0370))     # alohida turgan diakritik belgilar (ustidan chizish va h.k.)
+)
+
+
+def _build_text_table(homoglyphs: bool) -> Dict[int, Optional[str]]:
+    table: Dict[int, Optional[str]] = {cp: None for cp in _INVISIBLE}
+    # Keng (fullwidth), matematik va aylanali harf/raqamlar -> ASCII
+    ranges = [range(0xFF01, 0xFF5F), range(0x1D400, 0x1D800), range(0x24B6, 0x24EA), range(0x1F130, 0x1F18A)]
+    for r in ranges:
+        for cp in r:
+            norm = unicodedata.normalize("NFKC", chr(cp)).casefold()
+            if len(norm) == 1 and norm.isascii():
+                table[cp] = norm
+    for src, dst in _PUNCT_LOOKALIKES.items():
+        table[ord(src)] = dst
+    if homoglyphs:
+        for src, dst in _HOMOGLYPHS.items():
+            table[ord(src)] = dst
+    return table
+
+
+TEXT_TABLE = _build_text_table(homoglyphs=True)
+LINK_TEXT_TABLE = _build_text_table(homoglyphs=False)
+
+# Bitta o‘tishda (bo‘shliqlar allaqachon bittaga qisqartirilgan):
+# "t . me / kanal", "t[.]me", "t dot me" -> "t.me/..."; domen oldidagi
+# niqoblangan nuqta ("kazino [.] com", "kazino dot com" -> "kazino.com")
+_OBFUSCATED_DOT = r"(?: ?[\[({<] ?(?:\.|dot|nuqta) ?[\])}>] ?| (?:dot|nuqta) )"
+_DOT = rf"(?:{_OBFUSCATED_DOT}| ?\. ?)"
+TEXT_CLEANUP_REGEX = re.compile(
+    rf"(?P<tme>\bt{_DOT}me\b(?: ?/ ?)?)"
+    rf"|(?P<dot>(?<=\w){_OBFUSCATED_DOT}(?=(?:com|net|org|uz|ru|io|info|xyz|su|pro|site|online|link|ly|gg)\b))"
+)
+
+
+def _cleanup(m) -> str:
+    if m.lastgroup == "tme":
+        return "t.me/" if "/" in m.group() else "t.me"
+    return "."
+
+
+def _needs_cleanup(text: str) -> bool:
+    # Regex’dan ancha arzon: oddiy xabarlarning ko‘pchiligi bu yerda to‘xtaydi
+    return (
+        " ." in text or ". " in text or " /" in text or "/ " in text
+        or "[" in text or "(" in text or "{" in text or "<" in text
+        or " dot " in text or " nuqta " in text
+    )
+
+
+def _normalize(text: str, table: Dict[int, Optional[str]]) -> str:
+    text = " ".join(text.casefold().translate(table).split())
+    if _needs_cleanup(text):
+        text = TEXT_CLEANUP_REGEX.sub(_cleanup, text)
+    return text
+
+
+@lru_cache(maxsize=TEXT_NORM_CACHE_SIZE)
+def normalize_text(text: str) -> str:
+    return _normalize(text, TEXT_TABLE)
+
+
+@lru_cache(maxsize=TEXT_NORM_CACHE_SIZE)
+def normalize_link_text(text: str) -> str:
+    return _normalize(text, LINK_TEXT_TABLE)
+
+
+# ---------------------------
+# Havolalar va taqiqlangan so‘zlar
+# ---------------------------
+
+# Faqat "bormi?" so‘raladi, shuning uchun har bir tarmoq eng qisqa
+# yetarli qismni tekshiradi ([^\s]+ dagi qaytishlarsiz)
+URL_REGEX = re.compile(
+    r"(https?://\S)|"
+    r"(www\.\S)|"
+    r"(t\.me/\S)|"
+    r"(\S\.[a-z]{2})",
+    re.IGNORECASE,
+)
+
+def contains_url(text: str) -> bool:
+    return bool(URL_REGEX.search(normalize_link_text(text)))
+
+def contains_tme_link(text: str) -> bool:
+    return "t.me/" in normalize_text(text)
+
+def find_link(text: str) -> Optional[str]:
+    """Topilgan havola — normallashtirilgan matndagi butun so‘z (audit uchun)."""
+    norm = normalize_link_text(text)
+    m = URL_REGEX.search(norm)
+    if m is not None:
+        start = m.start()
+    else:
+        norm = normalize_text(text)
+        start = norm.find("t.me/")
+        if start < 0:
+            return None
+    start = norm.rfind(" ", 0, start) + 1
+    end = norm.find(" ", start)
+    return norm[start:end if end >= 0 else len(norm)][:LINK_DETAIL_MAX]
+
+def contains_banned_keyword(text: str, banned_keywords: List[str]) -> Optional[str]:
+    text_n = normalize_text(text)
+    for kw in banned_keywords:
+        if normalize_text(kw) in text_n:
+            return kw
+    return None
+
+
+# ---------------------------
+# Reklama klassifikatori (ixtiyoriy)
+# ---------------------------
+# Kalit so‘zlar va regex’lar qayta yozilgan reklamani o‘tkazib yuboradi va
+# oddiy suhbatni ortiqcha bloklaydi. Klassifikator normallashtirilgan
+# matnning belgi n-grammalarini 2**bits o‘lchamli fazoga xeshlaydi va
+# chiziqli (naive Bayes log-nisbat) og‘irliklar yig‘indisini sigmoid
+# orqali 0..1 ehtimolga aylantiradi. Xeshlash va yig‘indi NumPy’da
+# vektorlashtirilgan — tarmoq yoki GPU kerak emas.
+#
+# Og‘irliklar train_classifier.py bilan jurnal + audit (yoki matn
+# fayllari) asosida oflayn o‘rgatiladi va .npy fayl sifatida saqlanadi:
+# shakli (2**bits + 1,), oxirgi element — bias. Fayl mmap bilan ochiladi,
+# shuning uchun sharding ishchilari bitta nusxani bo‘lishadi. NumPy yoki
+# fayl bo‘lmasa filtr o‘chiq qoladi. Chegara guruh bo‘yicha
+# (/setadthreshold), 0 — o‘chirilgan.
+
+FNV_BASIS = 0x811C9DC5  # uint32 massivlar bilan — to‘lib o‘tish modul 2**32
+FNV_PRIME = 0x01000193
+
+
+def hashed_ngrams(texts: List[str], bits: int):
+    """Bir nechta matnning xeshlangan belgi n-grammalari (FNV-1a) bir yo‘la.
+
+    Qaytaradi: (indekslar, har bir indeks qaysi matnga tegishli).
+    """
+    norm = [" " + normalize_text(t) + " " for t in texts]
+    codes = np.frombuffer("".join(norm).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    seg = np.repeat(np.arange(len(norm)), [len(t) for t in norm])
+    # h — har bir pozitsiyadan boshlangan n-gramma xeshi; n+1 uchun bitta
+    # belgi qo‘shiladi (FNV ketma-ket bo‘lgani uchun oldingi xesh davom etadi).
+    # Ikki matn chegarasidan o‘tgan n-grammalar tashlanadi.
+    h = (codes ^ FNV_BASIS) * FNV_PRIME
+    idx_parts, seg_parts = [], []
+    for n in range(2, max(CLASSIFIER_NGRAMS) + 1):
+        if len(h) < 2:
+            break
+        h = (h[:-1] ^ codes[n - 1:]) * FNV_PRIME
+        if n in CLASSIFIER_NGRAMS:
+            inside = seg[:len(h)] == seg[n - 1:]
+            idx_parts.append(h[inside])
+            seg_parts.append(seg[:len(h)][inside])
+    if not idx_parts:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64)
+    return np.concatenate(idx_parts) >> (32 - bits), np.concatenate(seg_parts)
+
+
+def ngram_indices(text: str, bits: int):
+    return hashed_ngrams([text], bits)[0]
+
+
+class AdClassifier:
+    def __init__(self):
+        self.weights = None  # mmap qilingan float32, oxirgi element — bias
+        self.bits = 0
+        self.path = ""
+
+    @property
+    def loaded(self) -> bool:
+        return self.weights is not None
+
+    def load(self, path: str = CLASSIFIER_PATH) -> bool:
+        if np is None or not path or not os.path.exists(path):
+            return False
+        try:
+            w = np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Klassifikator {path} o‘qilmadi: {e}")
+            return False
+        dim = w.shape[0] - 1 if w.ndim == 1 else 0
+        if dim <= 0 or dim & (dim - 1):
+            logger.warning(f"Klassifikator {path}: noto‘g‘ri shakl {w.shape}")
+            return False
+        # memmap emas, oddiy ndarray ko‘rinishi — indekslash arzonroq (xotira baribir mmap)
+        self.weights, self.bits, self.path = w.view(np.ndarray), dim.bit_length() - 1, path
+        return True
+
+    def score_many(self, texts: List[str]) -> List[float]:
+        """Har bir matn uchun reklama ehtimoli (0..1) — butun partiya bitta vektor amalida."""
+        idx, seg = hashed_ngrams(texts, self.bits)
+        sums = np.bincount(seg, weights=self.weights[idx], minlength=len(texts))
+        bias = float(self.weights[-1])
+        # Partiya kichik — sigmoid oddiy Python’da np.clip/np.exp dan arzonroq
+        return [1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, x + bias)))) for x in sums.tolist()]
+
+    def score(self, text: str) -> float:
+        return self.score_many([text])[0]
+
+
+ad_classifier = AdClassifier()
+
+
+# ---------------------------
+# Guruhlararo takroriy spamni aniqlash
+# ---------------------------
+# Reklamachilar bitta matnni ko‘plab guruhlarga tashlaydi. Matndan
+# normallashtirilgan iz (fingerprint) olinadi va u nechta turli guruhda
+# hamda nechta turli foydalanuvchidan ko‘ringani sirpanuvchi oynali
+# count-min sketch’larda sanaladi. Adminlarning xabarlari sanalmaydi, bitta
+# odamning bir nechta guruhga yuborgan e’loni ham spam hisoblanmaydi.
+# Ikkala chegaradan oshgan iz blocked_fingerprints ga tushadi va keyingi
+# nusxalar bitta lug‘at tekshiruvi bilan o‘chiriladi.
+#
+# Xotira: 2 * SPAM_FP_BUCKETS * SPAM_FP_DEPTH * SPAM_FP_WIDTH * 4 bayt
+# (standart qiymatlarda 768 KB) va TTLCache’lar uchun maxsize cheklovi.
+#
+# Umumiy kesh yoqilgan bo‘lsa (sharding), guruhlar turli ishchilarda —
+# lokal sketch boshqa ishchi ko‘rgan guruhlarni bilmaydi. Shunda har bir
+# (iz, guruh) va (iz, foydalanuvchi) umumiy keshga SPAM_FP_WINDOW muddatli
+# kalit sifatida yoziladi va sanash shu kalitlar bo‘yicha bo‘ladi; bloklangan
+# iz ham umumiy keshga tushadi va barcha ishchilarda amal qiladi.
+
+FINGERPRINT_STRIP_REGEX = re.compile(r"[\W_]+", re.UNICODE)
+
+def text_fingerprint(text: str) -> Optional[int]:
+    """Katta-kichik harf, bo‘shliq, emoji va tinish belgilarisiz matn izi."""
+    norm = FINGERPRINT_STRIP_REGEX.sub("", text.casefold())
+    if len(norm) < SPAM_FP_MIN_LENGTH:
+        return None
+    digest = hashlib.blake2b(norm.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class SlidingCountMinSketch:
+    """Oyna SPAM_FP_BUCKETS bo‘lakka bo‘lingan count-min sketch.
+
+    Har bir bo‘lak o‘z jadvaliga ega; vaqt o‘tishi bilan eng eski bo‘lak
+    nolga tushiriladi, shuning uchun baho faqat oxirgi `window` soniyani
+    qamraydi.
+    """
+
+    __slots__ = ("width", "depth", "slot", "_tables", "_epochs")
+
+    def __init__(self, width: int = SPAM_FP_WIDTH, depth: int = SPAM_FP_DEPTH,
+                 window: float = SPAM_FP_WINDOW, buckets: int = SPAM_FP_BUCKETS):
+        self.width = width
+        self.depth = depth
+        self.slot = window / buckets
+        self._tables = [array("I", bytes(4 * width * depth)) for _ in range(buckets)]
+        self._epochs = [-1] * buckets
+
+    def _indexes(self, key: int):
+        h1 = key & 0xFFFFFFFF
+        h2 = (key >> 32) | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def _current(self) -> array:
+        epoch = int(time.monotonic() // self.slot)
+        i = epoch % len(self._tables)
+        if self._epochs[i] != epoch:
+            self._tables[i] = array("I", bytes(4 * self.width * self.depth))
+            self._epochs[i] = epoch
+        return self._tables[i]
+
+    def add(self, key: int) -> int:
+        table = self._current()
+        for idx in self._indexes(key):
+            table[idx] += 1
+        return self.estimate(key)
+
+    def estimate(self, key: int) -> int:
+        oldest = int(time.monotonic() // self.slot) - len(self._tables) + 1
+        live = [t for t, e in zip(self._tables, self._epochs) if e >= oldest]
+        return min(sum(t[idx] for t in live) for idx in self._indexes(key))
+
+
+class SpamFingerprints:
+    def __init__(self, shared: Optional[SharedCache] = None):
+        self.sketch = SlidingCountMinSketch()                     # iz -> guruhlar soni
+        self.user_sketch = SlidingCountMinSketch()                # iz -> foydalanuvchilar soni
+        self.seen = TTLCache(SPAM_FP_WINDOW, maxsize=50_000)      # (iz, chat_id)
+        self.seen_users = TTLCache(SPAM_FP_WINDOW, maxsize=50_000)  # (iz, user_id)
+        self.blocked = TTLCache(SPAM_FP_WINDOW, maxsize=10_000)   # iz -> True
+        self.shared = shared
+
+    def observe(self, fp: int, chat_id: int, user_id: int) -> bool:
+        """Izni qayd etadi (yuboruvchi admin emas); chegaradan oshgan bo‘lsa True qaytaradi."""
+        if self.blocked.get(fp, False):
+            return True
+        if self.shared is not None and self.shared.peek(f"spamblock:{fp:016x}") is not None:
+            self.blocked.set(fp, True)  # boshqa ishchi aniqlagan
+            return True
+        # Har bir guruh va har bir foydalanuvchi bir marta sanaladi
+        new_chat = not self.seen.get((fp, chat_id))
+        new_user = not self.seen_users.get((fp, user_id))
+        if not (new_chat or new_user):
+            return False
+        if new_chat:
+            self.seen.set((fp, chat_id), True)
+        if new_user:
+            self.seen_users.set((fp, user_id), True)
+
+        if self.shared is not None:
+            if new_chat:
+                self.shared.set(f"spam:{fp:016x}:{chat_id}", 1, SPAM_FP_WINDOW)
+            if new_user:
+                self.shared.set(f"spamuser:{fp:016x}:{user_id}", 1, SPAM_FP_WINDOW)
+            chats = self.shared.count_prefix(f"spam:{fp:016x}:")
+            users = self.shared.count_prefix(f"spamuser:{fp:016x}:")
+        else:
+            chats = self.sketch.add(fp) if new_chat else self.sketch.estimate(fp)
+            users = self.user_sketch.add(fp) if new_user else self.user_sketch.estimate(fp)
+        if chats >= SPAM_FP_CHAT_THRESHOLD and users >= SPAM_FP_USER_THRESHOLD:
+            self.blocked.set(fp, True)
+            if self.shared is not None:
+                self.shared.set(f"spamblock:{fp:016x}", 1, SPAM_FP_WINDOW)
+            logger.info(f"Guruhlararo spam aniqlandi: {fp:016x}")
+            return True
+        return False
+
+
+spam_fingerprints = SpamFingerprints(shared_cache)
+
+
+# ---------------------------
+# Flood detektori
+# ---------------------------
+# Har bir (chat, foydalanuvchi) uchun oxirgi FLOOD_MAX_MESSAGES ta xabar
+# vaqti qat’iy o‘lchamli halqa buferda saqlanadi. Yangi xabar buferdagi
+# eng eski vaqtni almashtiradi: agar o‘sha vaqt FLOOD_WINDOW ichida bo‘lsa,
+# foydalanuvchi flood holatiga o‘tadi va FLOOD_PENALTY davomida uning
+# xabarlari hech qanday tekshiruvsiz o‘chiriladi (ogohlantirish — bitta).
+#
+# Xotira: bitta foydalanuvchiga ~350 bayt (RateRing 64 B, 5 ta double
+# array 120 B, kalit tuple 56 B va lug‘at yozuvi ~100 B). Uzoq jim turganlar
+# sweep() orqali o‘chiriladi, shuning uchun jami hajm faol foydalanuvchilar
+# soniga proporsional.
+
+class RateRing:
+    __slots__ = ("stamps", "pos", "flood_until", "warned")
+
+    def __init__(self):
+        self.stamps = array("d", [0.0]) * FLOOD_MAX_MESSAGES
+        self.pos = 0
+        self.flood_until = 0.0
+        self.warned = False
+
+    def hit(self, now: float) -> bool:
+        oldest = self.stamps[self.pos]
+        self.stamps[self.pos] = now
+        self.pos = (self.pos + 1) % FLOOD_MAX_MESSAGES
+
+        if now < self.flood_until:
+            return True
+        if oldest and now - oldest < FLOOD_WINDOW:
+            self.flood_until = now + FLOOD_PENALTY
+            self.warned = False
+            return True
+        return False
+
+    @property
+    def last_seen(self) -> float:
+        return self.stamps[self.pos - 1]
+
+
+class FloodDetector:
+    def __init__(self):
+        self._rings: Dict[Tuple[int, int], RateRing] = {}
+
+    def hit(self, chat_id: int, user_id: int, now: float) -> bool:
+        ring = self._rings.get((chat_id, user_id))
+        if ring is None:
+            ring = self._rings[(chat_id, user_id)] = RateRing()
+        return ring.hit(now)
+
+    def take_warning(self, chat_id: int, user_id: int) -> bool:
+        """Flood davomida faqat birinchi chaqiruv True qaytaradi."""
+        ring = self._rings.get((chat_id, user_id))
+        if ring is None or ring.warned:
+            return False
+        ring.warned = True
+        return True
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        idle = [
+            k for k, r in self._rings.items()
+            if r.flood_until < now and now - r.last_seen > FLOOD_IDLE_EVICT
+        ]
+        for k in idle:
+            del self._rings[k]
+        return len(idle)
+
+    def __len__(self):
+        return len(self._rings)
+
+
+flood_detector = PerBot(FloodDetector)
+
+
+# ---------------------------
+# Taqiqlangan media keshi
+# ---------------------------
+# Matnsiz spam (rasm, stiker, forward) bir xil fayl bilan qayta yuboriladi.
+# file_unique_id barcha botlar va chatlar uchun bir xil, shuning uchun
+# uni va forward qilingan kanal ID sini bitta LRU to‘plamda saqlaymiz —
+# tekshiruv bitta lug‘at qidiruvi.
+
+class LRUSet:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, None]" = OrderedDict()
+
+    def add(self, key: str):
+        self._data[key] = None
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def discard(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key: str) -> bool:
+        if key in self._data:
+            self._data.move_to_end(key)
+            return True
+        return False
+
+    def __len__(self):
+        return len(self._data)
+
+
+blocked_media = LRUSet(MEDIA_BLOCKLIST_MAX)
+
+
+def media_keys(msg: Message) -> List[str]:
+    keys = []
+
+    if msg.photo:
+        keys.append(f"file:{msg.photo[-1].file_unique_id}")
+    else:
+        att = msg.effective_attachment
+        uid = getattr(att, "file_unique_id", None)
+        if uid:
+            keys.append(f"file:{uid}")
+
+    if msg.forward_from_chat:
+        keys.append(f"chat:{msg.forward_from_chat.id}")
+
+    return keys
+
+
+def is_blocked_media(msg: Message) -> bool:
+    return any(k in blocked_media for k in media_keys(msg))
+
+
+# -----------------------------------------
+# Moderatsiya filtrlari
+# -----------------------------------------
+# Har bir filtr o‘z narxini (cost) va tarmoq kerakligini (needs_network)
+# e’lon qiladi. Zanjir avval arzon lokal filtrlarni ishlatadi va birinchi
+# topilgan qoidabuzarlikda to‘xtaydi; adminlar ro‘yxati va a’zolik kabi
+# tarmoq tekshiruvlari faqat lokal filtrlardan o‘tgan xabarlar uchun
+# bajariladi. needs_admins — filtr adminlar chiqarib tashlangandan keyin
+# ishlaydi (yuboruvchini hisobga oladigan filtrlar, masalan, spam izlari). Guruh uchun filtrni /disable_filter orqali o‘chirish mumkin,
+# group_flag esa eski enforce_* sozlamalariga bog‘laydi.
+
+class Verdict:
+    __slots__ = ("reason", "detail")
+
+    def __init__(self, reason: str, detail=None):
+        self.reason = reason
+        self.detail = detail
+
+
+# ---------------------------
+# Verdiktlar keshi
+# ---------------------------
+# Bir xil matn qayta yuborilganda yoki xabar matni o‘zgarmasdan
+# tahrirlanganda (masalan, faqat reaksiya/markup) cacheable filtrlar
+# qayta ishlamaydi. Kalit — matn va entity’lar xeshi hamda guruhning
+# tegishli sozlamalari xeshi, shuning uchun /setkeywords yoki
+# /disable_filter dan keyin eski verdiktlar o‘z-o‘zidan ishlatilmaydi.
+
+VERDICT_MISS = object()
+
+
+def content_key(msg: Message) -> int:
+    text = msg.text or msg.caption or ""
+    entities = msg.entities or msg.caption_entities or ()
+    return hash((text, tuple((e.type, e.offset, e.length, e.url) for e in entities)))
+
+
+def verdict_settings_token(g: dict) -> int:
+    return hash((g["banned_keywords"], g["enforce_adblock"], g["disabled_filters"], g["classifier_threshold"]))
+
+
+class VerdictCache:
+    def __init__(self, per_chat: int = VERDICT_CACHE_PER_CHAT, max_chats: int = VERDICT_CACHE_CHATS):
+        self.per_chat = per_chat
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[int, OrderedDict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chat_id: int, key):
+        lru = self._chats.get(chat_id)
+        if lru is None or key not in lru:
+            self.misses += 1
+            return VERDICT_MISS
+        self.hits += 1
+        lru.move_to_end(key)
+        return lru[key]
+
+    def set(self, chat_id: int, key, verdict: Optional[Verdict]):
+        lru = self._chats.get(chat_id)
+        if lru is None:
+            lru = self._chats[chat_id] = OrderedDict()
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        self._chats.move_to_end(chat_id)
+
+        lru[key] = verdict
+        lru.move_to_end(key)
+        while len(lru) > self.per_chat:
+            lru.popitem(last=False)
+
+
+verdict_cache = VerdictCache()
+
+
+class ModerationFilter:
+    name = ""
+    label = ""
+    cost = 0
+    needs_network = False
+    # Faqat admin bo‘lmaganlar xabarlarini ko‘radi (tarmoq filtrlari — doim)
+    needs_admins = False
+    group_flag: Optional[str] = None
+    # Natija faqat xabar mazmuni va guruh sozlamalariga bog‘liq — keshlanadi
+    cacheable = False
+    # Tahrirlangan xabarlarda ham ishlaydimi
+    on_edit = True
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.total_time = 0.0
+
+    def enabled(self, g: dict) -> bool:
+        if self.name in g["disabled_filters"]:
+            return False
+        return self.group_flag is None or bool(g[self.group_flag])
+
+    def record(self, elapsed: float, calls: int, hits: int):
+        self.total_time += elapsed
+        self.calls += calls
+        self.hits += hits
+
+    def applies_to(self, msg: Message) -> bool:
+        """needs_admins filtrlari uchun: shu xabar sababli adminlar ro‘yxati kerakmi."""
+        return True
+
+    def check(self, msg: Message, g: dict) -> Optional[Verdict]:
+        raise NotImplementedError
+
+    async def check_batch(self, bot, chat, g: dict, msgs: List[Message]) -> List[Optional[Verdict]]:
+        return [self.check(m, g) for m in msgs]
+
+
+class FloodFilter(ModerationFilter):
+    name = "flood"
+    label = "Flood (juda tez xabar yuborish)"
+    cost = 1
+    on_edit = False  # tahrir yangi xabar emas
+
+    def check(self, msg, g):
+        user_id = msg.from_user.id
+        if flood_detector.hit(msg.chat_id, user_id, msg.date.timestamp()):
+            return Verdict("flood", flood_detector.take_warning(msg.chat_id, user_id))
+        return None
+
+
+class BlockedMediaFilter(ModerationFilter):
+    name = "media"
+    label = "Taqiqlangan media va forwardlar"
+    cost = 2
+    group_flag = "enforce_adblock"
+
+    def check(self, msg, g):
+        if is_blocked_media(msg):
+            return Verdict("media")
+        return None
+
+
+class SpamFingerprintFilter(ModerationFilter):
+    name = "spam"
+    label = "Guruhlararo takroriy spam"
+    cost = 3
+    needs_admins = True  # adminlarning e’lonlari sanalmaydi
+    group_flag = "enforce_adblock"
+
+    def applies_to(self, msg):
+        # Qisqa matnlarning izi olinmaydi
+        return len(msg.text or msg.caption or "") >= SPAM_FP_MIN_LENGTH
+
+    def check(self, msg, g):
+        text = msg.text or msg.caption
+        fp = text_fingerprint(text) if text else None
+        if fp is not None and spam_fingerprints.observe(fp, msg.chat_id, msg.from_user.id):
+            return Verdict("spam")
+        return None
+
+
+class LinkFilter(ModerationFilter):
+    name = "links"
+    label = "Havolalar va t.me linklar"
+    cost = 5
+    group_flag = "enforce_adblock"
+    cacheable = True
+
+    def check(self, msg, g):
+        link = find_link(msg.text or msg.caption or "")
+        if link is not None:
+            return Verdict("link", link)
+        return None
+
+
+class KeywordFilter(ModerationFilter):
+    name = "keywords"
+    label = "Taqiqlangan so‘zlar"
+    cost = 10
+    group_flag = "enforce_adblock"
+    cacheable = True
+
+    def check(self, msg, g):
+        bad_kw = contains_banned_keyword(msg.text or msg.caption or "", g["banned_keywords_list"])
+        if bad_kw:
+            return Verdict("keyword", bad_kw)
+        return None
+
+
+class ClassifierFilter(ModerationFilter):
+    name = "classifier"
+    label = "Reklama klassifikatori (n-gram)"
+    cost = 20
+    group_flag = "enforce_adblock"
+    cacheable = True
+
+    def enabled(self, g):
+        return ad_classifier.loaded and g["classifier_threshold"] > 0 and super().enabled(g)
+
+    async def check_batch(self, bot, chat, g, msgs):
+        texts = [m.text or m.caption or "" for m in msgs]
+        scores = ad_classifier.score_many(texts)
+        threshold = g["classifier_threshold"]
+        return [
+            Verdict("classifier", round(p, 2)) if t and p >= threshold else None
+            for t, p in zip(texts, scores)
+        ]
+
+
+class FilterPipeline:
+    def __init__(self, filters: List[ModerationFilter], admin_ids):
+        # Avval lokal, keyin adminlarsiz va tarmoq; har birining ichida arzonidan qimmatiga
+        self.filters = sorted(filters, key=lambda f: (f.needs_admins, f.needs_network, f.cost))
+        self.by_name = {f.name: f for f in self.filters}
+        # admin_ids(bot, chat, g) -> (adminlar, needs_admins filtrlari ishlaydimi)
+        self.admin_ids = admin_ids
+        self.admin_calls = 0
+        self.admin_time = 0.0
+
+    async def _run_stage(self, f: ModerationFilter, bot, chat, g, pending, verdicts) -> List[Message]:
+        t0 = time.perf_counter()
+        with trace_span("filter." + f.name, messages=len(pending)) as span:
+            results = await f.check_batch(bot, chat, g, pending)
+            remaining = []
+            for m, v in zip(pending, results):
+                if v is None:
+                    remaining.append(m)
+                else:
+                    verdicts.append((m, v))
+            span.set("hits", len(pending) - len(remaining))
+        f.record(time.perf_counter() - t0, len(pending), len(pending) - len(remaining))
+        return remaining
+
+    async def run(self, bot, chat, g: dict, msgs: List[Message]) -> List[Tuple[Message, Verdict]]:
+        active = [f for f in self.filters if f.enabled(g)]
+        verdicts: List[Tuple[Message, Verdict]] = []
+        pending = msgs
+
+        # Keshdan: o‘zgarmagan matn uchun cacheable filtrlar qayta ishlamaydi
+        token = verdict_settings_token(g)
+        keys: Dict[int, tuple] = {}
+        cached_clean = set()
+        if any(f.cacheable for f in active):
+            remaining = []
+            for m in pending:
+                key = keys[id(m)] = (content_key(m), token)
+                v = verdict_cache.get(chat.id, key)
+                if v is VERDICT_MISS:
+                    remaining.append(m)
+                elif v is None:
+                    cached_clean.add(id(m))
+                    remaining.append(m)
+                else:
+                    verdicts.append((m, v))
+            pending = remaining
+
+        for f in active:
+            if f.needs_admins:
+                break
+            stage, skipped = [], []
+            for m in pending:
+                if (m.edit_date is None or f.on_edit) and not (f.cacheable and id(m) in cached_clean):
+                    stage.append(m)
+                else:
+                    skipped.append(m)
+            n = len(verdicts)
+            passed = await self._run_stage(f, bot, chat, g, stage, verdicts)
+            if f.cacheable:
+                for m, v in verdicts[n:]:
+                    verdict_cache.set(chat.id, keys[id(m)], v)
+            pending = skipped + passed
+
+        # Barcha cacheable filtrlardan o‘tgan yangi matnlar — toza
+        for m in pending:
+            key = keys.get(id(m))
+            if key is not None and id(m) not in cached_clean:
+                verdict_cache.set(chat.id, key, None)
+
+        after_admins = [f for f in active if f.needs_admins]
+        if not verdicts and not any(f.applies_to(m) for f in after_admins for m in pending):
+            return verdicts
+
+        # Adminlar mustasno — ro‘yxat faqat kerak bo‘lganda olinadi
+        t0 = time.perf_counter()
+        with trace_span("admin.check"):
+            admins, check_rest = await self.admin_ids(bot, chat, g)
+        if not check_rest:
+            after_admins = []
+        self.admin_calls += 1
+        self.admin_time += time.perf_counter() - t0
+
+        verdicts = [(m, v) for m, v in verdicts if m.from_user.id not in admins]
+        pending = [m for m in pending if m.from_user.id not in admins]
+
+        for f in after_admins:
+            if not pending:
+                break
+            pending = await self._run_stage(f, bot, chat, g, pending, verdicts)
+
+        return verdicts
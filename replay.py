@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Yangilanishlar jurnalini qayta o‘ynatish (replay).
+
+BOT_JOURNAL_DIR bilan yozilgan jurnal (journal-*.jsonl.gz) bot
+handlerlari orqali soxta Bot API serveriga (bench_http.FakeBotAPI)
+qarshi qayta o‘tkaziladi. Soxta API har bir metodga jurnalda yozilgan
+o‘rtacha (median) kechikish bilan javob beradi, shuning uchun reyd yoki
+429 bo‘roni paytidagi trafikni o‘zgarishlardan oldin va keyin solishtirish
+mumkin:
+ - --speed 1 — yozilgan tezlikda (2 — ikki barobar tezroq);
+ - --speed 0 — iloji boricha tez (navbat to‘ladi, degraded rejim ham sinaladi).
+
+Natija: o‘tkazuvchanlik (update/s), handler va moderatsiya kechikishi
+(p50/p95/p99), Bot API chaqiruvlari soni (yozilgan va qayta o‘ynalgan).
+
+Guruh sozlamalari --db faylining vaqtinchalik nusxasidan o‘qiladi —
+asl baza o‘zgarmaydi.
+
+Ishga tushirish:
+    python replay.py journal/ --db bot_settings.db
+    python replay.py journal/journal-20240101-120000.jsonl.gz --speed 0
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+# Replay paytida jurnal va audit yozilmaydi, umumiy keshga tegilmaydi
+os.environ.pop("BOT_JOURNAL_DIR", None)
+os.environ["BOT_AUDIT_DIR"] = ""
+os.environ.pop("SHARED_CACHE", None)
+os.environ.setdefault("BOT_TOKEN", "123456:replay")
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import bot as botmod
+import tracing
+from storage import DB, DB_PATH
+from bench_http import FakeBotAPI
+
+
+# ---------------------------
+# Jurnalni o‘qish
+# ---------------------------
+
+def journal_paths(args_paths):
+    paths = []
+    for p in args_paths:
+        if os.path.isdir(p):
+            paths += sorted(glob.glob(os.path.join(p, "journal-*.jsonl.gz")))
+        else:
+            paths.append(p)
+    return paths
+
+
+def load_journal(paths):
+    updates = []
+    api_ms = {}
+    api_errors = {}
+    for entry in tracing.read_journal(paths):
+        if "u" in entry:
+            if "b" in entry:
+                continue  # qo‘shimcha bot yangilanishi — asosiy bot sozlamalari bilan emas
+            updates.append((entry["t"], entry["u"]))
+        elif "api" in entry:
+            method = entry["api"]
+            api_ms.setdefault(method, []).append(entry["ms"])
+            code = entry.get("code")
+            if code is None or code >= 400:
+                api_errors[method] = api_errors.get(method, 0) + 1
+    updates.sort(key=lambda x: x[0])
+    return updates, api_ms, api_errors
+
+
+def use_settings_copy(path: str) -> str:
+    """Sozlamalar bazasining nusxasini ochadi (backup API — WAL bilan ham to‘g‘ri)."""
+    fd, tmp = tempfile.mkstemp(suffix=".db", prefix="replay-")
+    os.close(fd)
+    if os.path.exists(path):
+        src = sqlite3.connect(path)
+        dst = sqlite3.connect(tmp)
+        src.backup(dst)
+        src.close()
+        dst.close()
+    botmod.db = DB(tmp)
+    botmod.refresh_blocked_media()
+    return tmp
+
+
+def percentiles(values):
+    if not values:
+        return "—"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q))] * 1000
+    return f"p50 {statistics.median(values) * 1000:7.1f} ms  p95 {pick(0.95):7.1f} ms  p99 {pick(0.99):7.1f} ms"
+
+
+# ---------------------------
+# Qayta o‘ynatish
+# ---------------------------
+
+async def replay(args):
+    updates, api_ms, api_errors = load_journal(journal_paths(args.journal))
+    if not updates:
+        print("Jurnalda yangilanishlar topilmadi")
+        return
+
+    if args.latency is not None:
+        method_latency = {}
+    else:
+        method_latency = {m: statistics.median(v) / 1000 for m, v in api_ms.items()}
+    api = FakeBotAPI(args.latency or 0.0, method_latency, member_status=args.member_status)
+    port = await api.start()
+
+    tmp_db = use_settings_copy(args.db)
+    application = botmod.build_application(with_updater=False, base_url=f"http://127.0.0.1:{port}/bot")
+
+    scheduled = {}      # id(Update) -> navbatga tushishi kerak bo‘lgan vaqt
+    handler_lat = []
+    message_sched = {}  # (chat_id, message_id) -> vaqt
+    moderation_lat = []
+    inflight = 0
+
+    async def on_done(update: Update, context):
+        t = scheduled.pop(id(update), None)
+        if t is not None:
+            handler_lat.append(time.perf_counter() - t)
+
+    # Eng oxirgi guruh — barcha handlerlar tugagach
+    application.add_handler(TypeHandler(Update, on_done), group=1000)
+
+    original_moderate_batch = botmod.moderate_batch
+
+    async def timed_moderate_batch(bot, msgs):
+        nonlocal inflight
+        inflight += 1
+        try:
+            await original_moderate_batch(bot, msgs)
+        finally:
+            inflight -= 1
+            now = time.perf_counter()
+            for m in msgs:
+                t = message_sched.pop((m.chat_id, m.message_id), None)
+                if t is not None:
+                    moderation_lat.append(now - t)
+
+    botmod.moderate_batch = timed_moderate_batch
+
+    await application.initialize()
+    await application.start()
+    api.calls.clear()
+
+    objs = []
+    first_t = updates[0][0]
+    start = time.perf_counter()
+    for t, data in updates:
+        target = start + (t - first_t) / args.speed if args.speed > 0 else time.perf_counter()
+        delay = target - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        update = Update.de_json(data, application.bot)
+        objs.append(update)
+        scheduled[id(update)] = target
+        msg = update.message or update.edited_message
+        if msg is not None:
+            message_sched[(msg.chat_id, msg.message_id)] = target
+        await application.update_queue.put(update)
+
+    # Navbat, partiyalar va moderatsiya tugashini kutish
+    deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < deadline:
+        if (not scheduled and application.update_queue.empty()
+                and len(botmod.moderation_batcher) == 0 and inflight == 0):
+            break
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    await application.stop()
+    await application.shutdown()
+    await api.stop()
+    botmod.db.close()  # -wal va -shm fayllari ham o‘chadi
+    os.remove(tmp_db)
+
+    messages = sum(1 for u in objs if u.message or u.edited_message)
+    print(f"Yangilanishlar:        {len(updates)} ta (xabarlar {messages}), tugallanmagan {len(scheduled)}")
+    print(f"Vaqt:                  {elapsed:.2f} s, {len(updates) / elapsed:.0f} update/s")
+    print(f"Handler kechikishi:    {percentiles(handler_lat)}")
+    print(f"Moderatsiya kechikishi: {percentiles(moderation_lat)}")
+    print(f"Bot API so‘rovlari:    {sum(api.calls.values())} ta (jurnalda {sum(len(v) for v in api_ms.values())} ta)")
+    for method in sorted(set(api.calls) | set(api_ms)):
+        recorded = api_ms.get(method, [])
+        median = f"{statistics.median(recorded):.1f} ms" if recorded else "—"
+        print(
+            f"  {method:<28} {api.calls.get(method, 0):6d}  jurnalda {len(recorded):6d}  "
+            f"median {median:>10}  xatolar {api_errors.get(method, 0)}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("journal", nargs="+", help="jurnal fayllari yoki katalog")
+    parser.add_argument("--db", default=DB_PATH, help="guruh sozlamalari bazasi (nusxasi ishlatiladi)")
+    parser.add_argument("--speed", type=float, default=1.0, help="0 — iloji boricha tez")
+    parser.add_argument("--latency", type=float, default=None,
+                        help="barcha metodlar uchun bir xil kechikish (standart — jurnaldagi median)")
+    parser.add_argument("--member-status", default="member", choices=["member", "left"])
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    args = parser.parse_args()
+    asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Ishni bo‘lish: bir jarayondagi bir nechta bot (current_bot, PerBot) va
+ko‘p jarayonli rejim (consistent hash, webhook qabul qiluvchi, ishchilar).
+
+bot.py, tracing.py va storage.py shu moduldan foydalanadi; bu modul ulardan
+hech narsa import qilmaydi.
+"""
+
+import asyncio
+import bisect
+import contextvars
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+from typing import Dict, Optional
+
+from telegram import Bot, Update
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Sozlamalar
+# ---------------------------
+
+# Ko‘p jarayonli (sharding) rejim — BOT_WORKERS > 1 bo‘lsa
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = int(os.environ.get("PORT", "8443"))
+WEBHOOK_MAX_BODY = 1 << 20  # bayt; Telegram yangilanishlari bundan ancha kichik
+SHARD_SOCKET_DIR = "/tmp"
+SHARD_VNODES = 64              # consistent hash halqasidagi virtual tugunlar
+
+
+# ---------------------------
+# Bir jarayonda bir nechta bot
+# ---------------------------
+# Brendlangan nusxalar (bot.py, bot1.py, ...) avval har biri alohida
+# jarayon, alohida SQLite fayli va sovuq keshlar bilan ishlardi. Endi
+# BOT_EXTRA_TOKENS dagi botlar asosiy bot bilan bitta jarayonda, alohida
+# Application sifatida ishlaydi:
+#   - saqlash bitta, lekin guruh sozlamalari, pending yozuvlar, kanallar va
+#     statistika bot bo‘limlarida (asosiy bot — 0, ya’ni eski ma’lumotlar);
+#   - a’zolik va adminlar keshi, spam izlari, taqiqlangan media va
+#     klassifikator umumiy — natija qaysi bot so‘raganiga bog‘liq emas;
+#   - moderatsiya navbati, DM outbox, flood detektori, yuklama nazorati,
+#     qayta tekshirish va statistika hisoblagichlari har bir bot uchun
+#     alohida (PerBot).
+# Qaysi bot uchun ishlanayotgani current_bot orqali uzatiladi: har bir
+# Application o‘z vazifasida ishga tushiriladi, uning handlerlari va
+# job’lari shu kontekstni meros qilib oladi.
+
+current_bot: contextvars.ContextVar = contextvars.ContextVar("current_bot", default=0)
+
+
+def token_bot_id(token: str) -> int:
+    """Bot ID si — tokenning ":" gacha qismi (getMe shart emas)."""
+    return int(token.split(":", 1)[0])
+
+
+class PerBot:
+    """Joriy bot uchun alohida nusxa — birinchi murojaatda yaratiladi."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances: dict = {}
+
+    def instance(self):
+        bot_id = current_bot.get()
+        inst = self._instances.get(bot_id)
+        if inst is None:
+            inst = self._instances[bot_id] = self._factory()
+        return inst
+
+    def __getattr__(self, name):
+        return getattr(self.instance(), name)
+
+    def __len__(self):
+        return len(self.instance())
+
+
+# -----------------------------------------
+# Gorizontal sharding (ko‘p jarayonli rejim)
+# -----------------------------------------
+# Bitta jarayon, bitta event loop va bitta SQLite ulanishi — chegara.
+# BOT_WORKERS > 1 bo‘lsa, bot webhook rejimida ishlaydi:
+#   - old jarayon (front) Telegram webhook so‘rovlarini qabul qiladi va
+#     har bir yangilanishni chat_id bo‘yicha consistent hash orqali N ta
+#     ishchi jarayondan biriga Unix socket orqali uzatadi;
+#   - har bir ishchi odatdagi handlerlarni ishlatadi, lekin faqat o‘ziga
+#     tegishli guruhlarni ko‘radi, shuning uchun bitta guruh xabarlari
+#     doim bitta jarayonda va tartib bilan qayta ishlanadi;
+#   - sozlamalar va pending join yozuvlari umumiy SQLite faylida (WAL
+#     rejimi) saqlanadi, fon tekshiruvchi faqat o‘z guruhlarini tekshiradi,
+#     global vazifalar (kanallarni qayta tekshirish) esa faqat 0-ishchida;
+#   - guruhlararo holat umumiy keshda (SharedCache, o‘zi yoqiladi):
+#     guruhlararo spam izlari, DM navbatining "bitta DM" egallovi va DM
+#     qabul qilmaydiganlar; taqiqlangan media bazadan davriy qayta
+#     o‘qiladi, bekor qilinganlari ham (MEDIA_UNBLOCK_KEY).
+# Tashqi servis kerak emas — hammasi bitta Linux xostda ishlaydi.
+
+SHARD_INDEX = 0
+SHARD_COUNT = 1
+
+
+class ShardRing:
+    """Virtual tugunli consistent hash halqasi."""
+
+    def __init__(self, count: int, vnodes: int = SHARD_VNODES):
+        points = []
+        for shard in range(count):
+            for v in range(vnodes):
+                points.append((self._hash(f"shard-{shard}-{v}"), shard))
+        points.sort()
+        self._keys = [p[0] for p in points]
+        self._shards = [p[1] for p in points]
+
+    @staticmethod
+    def _hash(value) -> int:
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def shard_for(self, chat_id: int) -> int:
+        i = bisect.bisect(self._keys, self._hash(chat_id)) % len(self._keys)
+        return self._shards[i]
+
+
+_shard_ring: Optional[ShardRing] = None
+
+
+def owns_chat(chat_id: int) -> bool:
+    if SHARD_COUNT <= 1:
+        return True
+    return _shard_ring.shard_for(chat_id) == SHARD_INDEX
+
+
+def update_chat_id(data: dict) -> int:
+    for key in ("message", "edited_message", "channel_post", "edited_channel_post",
+                "my_chat_member", "chat_member", "chat_join_request"):
+        if key in data:
+            return data[key]["chat"]["id"]
+    cq = data.get("callback_query")
+    if cq:
+        if cq.get("message"):
+            return cq["message"]["chat"]["id"]
+        return cq["from"]["id"]
+    return 0
+
+
+def shard_socket_path(index: int) -> str:
+    return os.path.join(SHARD_SOCKET_DIR, f"bot-shard-{index}.sock")
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    size = int.from_bytes(await reader.readexactly(4), "big")
+    return await reader.readexactly(size)
+
+
+def _frame(payload: bytes) -> bytes:
+    return len(payload).to_bytes(4, "big") + payload
+
+
+# --- Ishchi jarayon ---
+
+def assign_shard(index: int, count: int):
+    global SHARD_INDEX, SHARD_COUNT, _shard_ring
+    SHARD_INDEX, SHARD_COUNT = index, count
+    _shard_ring = ShardRing(count)
+
+
+async def serve_shard_worker(index: int, build_application):
+    """Ishchi Application’ini ishga tushiradi va old jarayon uzatgan yangilanishlarni qabul qiladi."""
+    application = build_application(with_updater=False)
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+
+    async def on_connection(reader, writer):
+        try:
+            while True:
+                data = json.loads(await _read_frame(reader))
+                await application.update_queue.put(Update.de_json(data, application.bot))
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    path = shard_socket_path(index)
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(on_connection, path=path)
+    logger.info(f"Ishchi {index}/{SHARD_COUNT} tayyor: {path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    server.close()
+    await server.wait_closed()
+    await application.stop()
+    await application.shutdown()
+    await application.post_shutdown(application)
+
+
+# --- Old jarayon (webhook qabul qiluvchi) ---
+
+class ShardRouter:
+    def __init__(self, count: int):
+        self.ring = ShardRing(count)
+        self._writers: Dict[int, asyncio.StreamWriter] = {}
+        self._locks = [asyncio.Lock() for _ in range(count)]
+
+    async def _writer(self, shard: int) -> asyncio.StreamWriter:
+        w = self._writers.get(shard)
+        if w is None or w.is_closing():
+            _, w = await asyncio.open_unix_connection(shard_socket_path(shard))
+            self._writers[shard] = w
+        return w
+
+    async def forward(self, body: bytes) -> bool:
+        shard = self.ring.shard_for(update_chat_id(json.loads(body)))
+        async with self._locks[shard]:
+            for _ in range(2):  # ishchi qayta ishga tushgan bo‘lsa — qayta ulanish
+                try:
+                    w = await self._writer(shard)
+                    w.write(_frame(body))
+                    await w.drain()
+                    return True
+                except (ConnectionError, FileNotFoundError):
+                    self._writers.pop(shard, None)
+        logger.error(f"Yangilanish {shard}-ishchiga uzatilmadi")
+        return False
+
+
+async def _serve_webhook(router: ShardRouter, tg: Bot):
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                headers = {
+                    k.strip().lower(): v.strip()
+                    for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)
+                }
+                # Faqat Content-Length bilan (Telegram shunday yuboradi). Tana faqat
+                # sarlavhalar tekshirilgandan keyin o‘qiladi; rad etilsa — ulanish yopiladi
+                length = headers.get("content-length", "")
+                if "transfer-encoding" in headers or not length:
+                    status = b"411 Length Required"
+                elif WEBHOOK_SECRET and headers.get("x-telegram-bot-api-secret-token") != WEBHOOK_SECRET:
+                    status = b"403 Forbidden"
+                elif not re.fullmatch(r"[0-9]+", length):
+                    status = b"400 Bad Request"
+                elif int(length) > WEBHOOK_MAX_BODY:
+                    status = b"413 Payload Too Large"
+                else:
+                    status = None
+                if status is not None:
+                    writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(int(length))
+
+                if await router.forward(body):
+                    status = b"200 OK"
+                else:
+                    status = b"503 Service Unavailable"  # Telegram keyinroq qayta yuboradi
+
+                writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, WEBHOOK_LISTEN, WEBHOOK_PORT)
+
+    async with tg:
+        await tg.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None, allowed_updates=Update.ALL_TYPES)
+    logger.info(f"Webhook qabul qiluvchi {WEBHOOK_LISTEN}:{WEBHOOK_PORT} da, {SHARD_COUNT} ta ishchi")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    async with server:
+        await stop.wait()
+
+
+def run_sharded(count: int, worker, tg: Bot):
+    """worker(index, count) — ishchi jarayon funksiyasi, tg — webhook o‘rnatadigan bot."""
+    global SHARD_COUNT
+    SHARD_COUNT = count
+
+    if not WEBHOOK_URL:
+        raise RuntimeError("BOT_WORKERS > 1 uchun WEBHOOK_URL o‘rnatilishi kerak")
+
+    # Har bir ishchi bot.py ni qaytadan import qiladi — o‘z SQLite ulanishi bilan
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=worker, args=(i, count), daemon=True) for i in range(count)]
+    for p in workers:
+        p.start()
+
+    try:
+        asyncio.run(_serve_webhook(ShardRouter(count), tg))
+    finally:
+        for p in workers:
+            p.terminate()
+        for p in workers:
+            p.join(timeout=10)
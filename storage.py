@@ -0,0 +1,1534 @@
+"""
+Saqlash: guruh sozlamalari, pending yozuvlar va statistika dvigatellari
+(SQLite, xotira, LMDB) hamda keshlar — xotiradagi TTL kesh va
+jarayonlararo umumiy kesh fayli.
+
+`db` va `shared_cache` birinchi murojaatda ochiladi — import paytida fayl
+yaratilmaydi.
+"""
+
+import abc
+import copy
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sharding import current_bot
+from tracing import current_traces, traced
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Sozlamalar
+# ---------------------------
+
+DEFAULT_BANNED_KEYWORDS = [
+    "promo", "promotion", "discount", "bet", "casino", "followers",
+    "free followers", "giveaway", "click here", "subscribe",
+    "earn", "work from home"
+]
+
+DEFAULT_ENFORCE_MEMBERSHIP = True
+DEFAULT_ENFORCE_ADBLOCK = True
+DEFAULT_MEMBERSHIP_FAIL_OPEN = True  # muddat o‘tsa — a’zo deb hisoblash
+
+DB_PATH = "bot_settings.db"
+STORAGE_ENGINE = os.environ.get("BOT_STORAGE", "sqlite")  # sqlite | memory | lmdb
+LMDB_PATH = "bot_settings.lmdb"
+LMDB_MAP_SIZE = 1 << 30        # lmdb faylining eng katta hajmi, bayt
+LMDB_MAX_DBS = 128             # nomlangan bazalar: har bir bot uchun 8 ta + umumiy
+
+PENDING_JOIN_TTL = 24 * 3600   # shundan keyin ogohlantirish o‘chiriladi (Telegram 48 soatdan eskisini o‘chirmaydi)
+VACUUM_PAGES = 1000            # har tozalashdan keyin faylga qaytariladigan sahifalar
+
+# Kutilayotgan foydalanuvchini qayta tekshirish oraliqlari (soniya): har
+# muvaffaqiyatsiz tekshiruvdan keyin keyingisiga o‘tiladi, oxirgisi takrorlanadi.
+# Foydalanuvchi yozsa, tugma bossa yoki kanalga qo‘shilsa — boshidan boshlanadi.
+RECHECK_SCHEDULE = (5, 30, 300, 3600)
+
+CACHE_MAX_ENTRIES = 100_000
+
+# Jarayonlararo umumiy kesh (a’zolik va adminlar) — bitta xostdagi barcha
+# jarayonlar uchun alohida SQLite fayli. BOT_WORKERS > 1 bo‘lsa o‘zi yoqiladi.
+SHARED_CACHE_ENABLED = (
+    os.environ.get("SHARED_CACHE", "") == "1"
+    or int(os.environ.get("BOT_WORKERS", "1")) > 1
+)
+SHARED_CACHE_PATH = os.environ.get("SHARED_CACHE_PATH", "bot_shared_cache.db")
+SHARED_CACHE_BUSY_TIMEOUT = 0.2  # fayl band bo‘lsa kutish (event loop to‘xtaydi), soniya
+
+
+# ---------------------------
+# Saqlash interfeysi
+# ---------------------------
+# Bot faqat shu metodlar orqali ishlaydi. Mavjud dvigatellar:
+#   - DB            — SQLite (standart, bir nechta jarayon uchun WAL);
+#   - MemoryStorage — jarayon xotirasida (testlar, benchmark);
+#   - LMDBStorage   — lmdb kalit-qiymat fayli (ixtiyoriy: pip install lmdb).
+# BOT_STORAGE muhit o‘zgaruvchisi bilan tanlanadi. `db` birinchi
+# murojaatda ochiladi — import paytida fayl yaratilmaydi.
+#
+# Bir jarayondagi bir nechta bot bitta dvigatelni bo‘lishadi: partition()
+# shu bot ma’lumotlari uchun ko‘rinish qaytaradi (ulanish umumiy), `db`
+# esa joriy bot (current_bot) bo‘limiga yo‘naltiradi. Taqiqlangan media
+# barcha botlar uchun umumiy.
+
+class Storage(abc.ABC):
+    bot_id = 0  # bo‘lim: 0 — asosiy bot (BOT_TOKEN), aks holda bot ID si
+
+    def partition(self, bot_id: int) -> "Storage":
+        view = copy.copy(self)
+        view.bot_id = bot_id
+        return view
+
+    # --- Guruh sozlamalari ---
+    @abc.abstractmethod
+    def get_group(self, group_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def ensure_group(self, group_id: int):
+        raise NotImplementedError
+
+    def _set_group_field(self, group_id: int, field: str, value):
+        # SQL dvigateli har bir setter‘ni o‘zi yozadi, shuning uchun bu majburiy emas
+        raise NotImplementedError
+
+    def set_required_channels(self, group_id: int, channels: List[str]):
+        self._set_group_field(group_id, "required_channels", ",".join(channels))
+
+    def set_banned_keywords(self, group_id: int, keywords: List[str]):
+        self._set_group_field(group_id, "banned_keywords", ",".join(keywords))
+
+    def set_enforce_membership(self, group_id: int, value: bool):
+        self._set_group_field(group_id, "enforce_membership", bool(value))
+
+    def set_enforce_adblock(self, group_id: int, value: bool):
+        self._set_group_field(group_id, "enforce_adblock", bool(value))
+
+    def set_membership_fail_open(self, group_id: int, value: bool):
+        self._set_group_field(group_id, "membership_fail_open", bool(value))
+
+    def set_disabled_filters(self, group_id: int, names: List[str]):
+        self._set_group_field(group_id, "disabled_filters", ",".join(names))
+
+    def set_classifier_threshold(self, group_id: int, value: float):
+        self._set_group_field(group_id, "classifier_threshold", float(value))
+
+    def get_required_channels(self, group_id: int) -> List[str]:
+        g = self.get_group(group_id)
+        if not g or not g["required_channels"]:
+            return []
+        return [s.strip() for s in g["required_channels"].split(",") if s.strip()]
+
+    def get_banned_keywords(self, group_id: int) -> List[str]:
+        g = self.get_group(group_id)
+        if not g or not g["banned_keywords"]:
+            return DEFAULT_BANNED_KEYWORDS.copy()
+        return [s.strip() for s in g["banned_keywords"].split(",") if s.strip()]
+
+    @abc.abstractmethod
+    def get_group_ids(self) -> List[int]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_all_required_channels(self) -> Dict[int, List[str]]:
+        raise NotImplementedError
+
+    # --- Kanallar ---
+    @abc.abstractmethod
+    def save_channels(self, channels: List[dict]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_channels(self, chat_ids: List[int]) -> Dict[int, dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_stale_channels(self, max_age: int) -> List[int]:
+        raise NotImplementedError
+
+    # --- Pending join xabarlari ---
+    @abc.abstractmethod
+    def save_join_message(self, user_id: int, group_id: int, chat_id: int, message_id: int,
+                          ttl: int = PENDING_JOIN_TTL):
+        """Yozuv allaqachon bo‘lsa, faqat muddati yangilanadi."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def pop_expired_join_messages(self, now: int, limit: int) -> List[Tuple[int, int, int, int]]:
+        """Muddati o‘tgan yozuvlarni o‘chiradi: [(user_id, group_id, chat_id, message_id)]."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_group_join_messages(self, group_id: int) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_join_messages(self, user_id: int, group_id: int) -> List[Tuple[int, int]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_join_messages(self, user_id: int, group_id: int):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def count_join_message_refs(self, chat_id: int, message_id: int) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_pending_groups_for_user(self, user_id: int) -> List[int]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_pending_user_ids(self) -> List[int]:
+        raise NotImplementedError
+
+    # --- Qayta tekshirish jadvali ---
+    # Har bir kutilayotgan (user, guruh) uchun: step — RECHECK_SCHEDULE dagi
+    # o‘rin, next_check — keyingi tekshiruv vaqti (unix). save_join_message
+    # jadvalni boshidan boshlaydi, yozuvlar o‘chirilganda u ham o‘chadi.
+    @abc.abstractmethod
+    def get_due_rechecks(self, now: int, limit: int, offset: int = 0) -> List[Tuple[int, int, int]]:
+        """Vaqti kelgan tekshiruvlar: [(user_id, group_id, step)], offset — sahifalash uchun."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_recheck(self, user_id: int, group_id: int, step: int, next_check: int):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def reset_rechecks(self, user_ids: List[int], next_check: int) -> int:
+        raise NotImplementedError
+
+    # --- Taqiqlangan media ---
+    @abc.abstractmethod
+    def add_blocked_media(self, keys: List[str], added_by: int):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def remove_blocked_media(self, keys: List[str]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_blocked_media_since(self, since: int, limit: int) -> List[str]:
+        raise NotImplementedError
+
+    # --- Statistika ---
+    @abc.abstractmethod
+    def add_group_stats(self, rows: List[Tuple[int, int, str, int]]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_group_stats(self, group_id: int, since_hour: int) -> Dict[str, int]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_top_groups(self, key: str, since_hour: int, limit: int) -> List[Tuple[int, int]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_group_stats_before(self, hour: int) -> int:
+        raise NotImplementedError
+
+    def compact(self):
+        """Bo‘shagan joyni qaytarish (SQLite — incremental vacuum)."""
+
+    def close(self):
+        pass
+
+
+def new_group_row() -> dict:
+    """Yangi guruhning standart sozlamalari (get_group ko‘rinishida)."""
+    return {
+        "required_channels": "",
+        "banned_keywords": ",".join(DEFAULT_BANNED_KEYWORDS),
+        "enforce_membership": DEFAULT_ENFORCE_MEMBERSHIP,
+        "enforce_adblock": DEFAULT_ENFORCE_ADBLOCK,
+        "join_button_text": "Kanalga a’zo bo‘ling",
+        "override_message": "Iltimos, majburiy kanalga a’zo bo‘ling.",
+        "disabled_filters": "",
+        "membership_fail_open": DEFAULT_MEMBERSHIP_FAIL_OPEN,
+        "classifier_threshold": 0.0,
+    }
+
+
+# ---------------------------
+# Ma’lumotlar bazasi (SQLite)
+# ---------------------------
+# Jadval: groups
+#   - bot_id, group_id (PRIMARY KEY): bot bo‘limi (0 — asosiy bot) va guruh
+#   - required_channels: majburiy kanallar ("," bilan ajratilgan)
+#   - banned_keywords: taqiqlangan so‘zlar
+#   - enforce_membership: a’zolik tekshiruvi (0/1)
+#   - enforce_adblock: reklamani bloklash (0/1)
+#   - join_button_text: tugma matni
+#   - override_message: maxsus matn (ixtiyoriy)
+#   - disabled_filters: o‘chirilgan moderatsiya filtrlari ("," bilan ajratilgan)
+#   - membership_fail_open: a’zolik aniqlanmasa — xabarni qoldirish (1) yoki o‘chirish (0)
+#   - classifier_threshold: reklama klassifikatori chegarasi (0 — o‘chirilgan)
+#
+# Jadval: pending_join_msgs
+#   - bot_id: xabarni yuborgan bot bo‘limi
+#   - user_id: foydalanuvchi ID
+#   - group_id: guruh ID
+#   - chat_id: xabar qaysi chatga yuborilgan
+#   - message_id: yuborilgan xabar ID
+#   - created_at: yozilgan vaqt (unix)
+#   - expires_at: shu vaqtdan keyin xabar o‘chiriladi va yozuv tozalanadi
+#
+# Ushbu jadval join-subscribtion xabarlari keyin o‘chirilishi uchun kerak.
+# Fayl incremental auto-vacuum rejimida: tozalangan sahifalar
+# PRAGMA incremental_vacuum orqali fon vazifasida faylga qaytariladi.
+#
+# Jadval: pending_checks
+#   - bot_id, user_id, group_id (PRIMARY KEY): kutilayotgan juftlik
+#   - step: RECHECK_SCHEDULE dagi joriy oraliq
+#   - next_check: keyingi a’zolik tekshiruvi vaqti (unix)
+#
+# Jadval: blocked_media (barcha botlar uchun umumiy)
+#   - key: "file:<file_unique_id>" yoki "chat:<forward qilingan kanal ID>"
+#   - added_by: qo‘shgan admin ID
+#   - added_at: qo‘shilgan vaqt (unix)
+#
+# Jadval: group_stats
+#   - bot_id, group_id, hour (unix soat), key ("messages", "deleted:link", ...)
+#   - value: shu soatdagi hisoblagich qiymati (ishchilar qo‘shib boradi)
+#
+# Jadval: channels
+#   - bot_id, chat_id (PRIMARY KEY): bot bo‘limi va kanalning raqamli ID si
+#     (yopiq kanal ma’lumotini faqat unga qo‘shilgan bot ko‘radi)
+#   - ident: admin kiritgan ko‘rinish (@kanal1)
+#   - title: kanal nomi
+#   - username: kanalning joriy username'i
+#   - invite_link: taklif havolasi
+#   - checked_at: oxirgi marta get_chat orqali tekshirilgan vaqt (unix)
+#
+# groups.required_channels endi raqamli ID larni saqlaydi, shuning uchun
+# get_chat_member har safar username'ni qayta aniqlamaydi.
+#
+# Bir nechta bot bitta faylni bo‘lishadi: DB.partition(bot_id) shu ulanish
+# ustidagi ko‘rinish, barcha so‘rovlar self.bot_id bilan cheklanadi. bot_id
+# ustunisiz eski jadvallar bir marta qayta quriladi (yozuvlar 0-bo‘limga).
+
+class DB(Storage):
+    def __init__(self, db_path=DB_PATH):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        # Bir nechta jarayon (sharding) bitta faylga yozishi uchun
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=10000")
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            # Mavjud faylda rejim faqat VACUUM dan keyin o‘zgaradi (bir martalik)
+            self.conn.execute("VACUUM")
+        self._init_db()
+
+    def _init_db(self):
+        c = self.conn.cursor()
+        # Sxema o‘zgarishlari bitta tranzaksiyada — ishchilar bir vaqtda ochsa ham
+        c.execute("BEGIN IMMEDIATE")
+
+        # Guruh sozlamalari jadvali
+        self._create_partitioned(c, "groups", f"""
+            CREATE TABLE groups (
+                bot_id INTEGER DEFAULT 0,
+                group_id INTEGER,
+                required_channels TEXT,
+                banned_keywords TEXT,
+                enforce_membership INTEGER DEFAULT 1,
+                enforce_adblock INTEGER DEFAULT 1,
+                join_button_text TEXT DEFAULT 'Kanalga a’zo bo‘ling',
+                override_message TEXT DEFAULT 'Iltimos, majburiy kanalga a’zo bo‘ling.',
+                disabled_filters TEXT DEFAULT '',
+                membership_fail_open INTEGER DEFAULT {1 if DEFAULT_MEMBERSHIP_FAIL_OPEN else 0},
+                classifier_threshold REAL DEFAULT 0,
+                PRIMARY KEY (bot_id, group_id)
+            )
+        """)
+
+        # Pending join xabarlari (keyin o‘chiriladigan)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS pending_join_msgs (
+                user_id INTEGER,
+                group_id INTEGER,
+                chat_id INTEGER,
+                message_id INTEGER
+            )
+        """)
+        self._add_column(c, "pending_join_msgs", "created_at", "INTEGER DEFAULT 0")
+        self._add_column(c, "pending_join_msgs", "expires_at", "INTEGER DEFAULT 0")
+        self._add_column(c, "pending_join_msgs", "bot_id", "INTEGER DEFAULT 0")
+        # Eski yozuvlar (vaqtsiz) — yangilanishdan boshlab bitta TTL beriladi
+        now = int(time.time())
+        c.execute(
+            "UPDATE pending_join_msgs SET created_at = ?, expires_at = ? WHERE expires_at = 0",
+            (now, now + PENDING_JOIN_TTL)
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS idx_pending_user_group ON pending_join_msgs (user_id, group_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_pending_message ON pending_join_msgs (chat_id, message_id)")
+        c.execute("DROP INDEX IF EXISTS idx_pending_expires")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_pending_bot_expires ON pending_join_msgs (bot_id, expires_at)")
+
+        # Qayta tekshirish jadvali (user, guruh juftligi bo‘yicha)
+        self._create_partitioned(c, "pending_checks", """
+            CREATE TABLE pending_checks (
+                bot_id INTEGER DEFAULT 0,
+                user_id INTEGER,
+                group_id INTEGER,
+                step INTEGER DEFAULT 0,
+                next_check INTEGER DEFAULT 0,
+                PRIMARY KEY (bot_id, user_id, group_id)
+            ) WITHOUT ROWID
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_pending_checks_next ON pending_checks (bot_id, next_check)")
+        # Jadvalsiz qolgan eski yozuvlar — darhol tekshiriladi
+        c.execute("""
+            INSERT OR IGNORE INTO pending_checks (bot_id, user_id, group_id)
+            SELECT DISTINCT bot_id, user_id, group_id FROM pending_join_msgs
+        """)
+
+        # Aniqlangan kanallar (raqamli ID, nom, havola)
+        self._create_partitioned(c, "channels", """
+            CREATE TABLE channels (
+                bot_id INTEGER DEFAULT 0,
+                chat_id INTEGER,
+                ident TEXT,
+                title TEXT,
+                username TEXT,
+                invite_link TEXT,
+                checked_at INTEGER DEFAULT 0,
+                PRIMARY KEY (bot_id, chat_id)
+            )
+        """)
+
+        # Barcha guruhlar (va botlar) uchun umumiy taqiqlangan media
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS blocked_media (
+                key TEXT PRIMARY KEY,
+                added_by INTEGER,
+                added_at INTEGER
+            )
+        """)
+
+        # Guruhlar bo‘yicha soatlik statistika
+        self._create_partitioned(c, "group_stats", """
+            CREATE TABLE group_stats (
+                bot_id INTEGER DEFAULT 0,
+                group_id INTEGER,
+                hour INTEGER,
+                key TEXT,
+                value INTEGER DEFAULT 0,
+                PRIMARY KEY (bot_id, group_id, hour, key)
+            ) WITHOUT ROWID
+        """)
+
+        self.conn.commit()
+
+    @staticmethod
+    def _add_column(c, table: str, column: str, decl: str):
+        # Eski bazalar uchun oddiy migratsiya
+        c.execute(f"PRAGMA table_info({table})")
+        if column not in {r[1] for r in c.fetchall()}:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    @staticmethod
+    def _create_partitioned(c, table: str, ddl: str):
+        # Kalitida bot_id bo‘lmagan eski jadval qayta quriladi (PRIMARY KEY
+        # o‘zgarmaydi), yozuvlari asosiy botga (0) o‘tadi
+        c.execute(f"PRAGMA table_info({table})")
+        old = [r[1] for r in c.fetchall()]
+        if "bot_id" in old:
+            return
+        if old:
+            c.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        c.execute(ddl)
+        if old:
+            c.execute(f"PRAGMA table_info({table})")
+            new = {r[1] for r in c.fetchall()}
+            cols = ", ".join(col for col in old if col in new)
+            c.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {table}_old")
+            c.execute(f"DROP TABLE {table}_old")
+
+    # --- Guruh sozlamalari funksiyalari ---
+
+    def get_group(self, group_id: int) -> Optional[dict]:
+        c = self.conn.cursor()
+        c.execute("""
+            SELECT required_channels, banned_keywords, enforce_membership,
+                   enforce_adblock, join_button_text, override_message,
+                   disabled_filters, membership_fail_open, classifier_threshold
+            FROM groups
+            WHERE bot_id = ? AND group_id = ?
+        """, (self.bot_id, group_id))
+        row = c.fetchone()
+
+        if not row:
+            return None
+
+        return {
+            "required_channels": row[0] or "",
+            "banned_keywords": row[1] or "",
+            "enforce_membership": bool(row[2]),
+            "enforce_adblock": bool(row[3]),
+            "join_button_text": row[4] or "Kanalga a’zo bo‘ling",
+            "override_message": row[5] or "",
+            "disabled_filters": row[6] or "",
+            "membership_fail_open": DEFAULT_MEMBERSHIP_FAIL_OPEN if row[7] is None else bool(row[7]),
+            "classifier_threshold": row[8] or 0.0,
+        }
+
+    def ensure_group(self, group_id: int):
+        if self.get_group(group_id) is None:
+            c = self.conn.cursor()
+            c.execute("""
+                INSERT INTO groups (bot_id, group_id, required_channels, banned_keywords,
+                    enforce_membership, enforce_adblock)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                self.bot_id,
+                group_id,
+                "",
+                ",".join(DEFAULT_BANNED_KEYWORDS),
+                1 if DEFAULT_ENFORCE_MEMBERSHIP else 0,
+                1 if DEFAULT_ENFORCE_ADBLOCK else 0,
+            ))
+            self.conn.commit()
+
+    def set_required_channels(self, group_id: int, channels: List[str]):
+        self.ensure_group(group_id)
+        c = self.conn.cursor()
+        c.execute(
+            "UPDATE groups SET required_channels = ? WHERE bot_id = ? AND group_id = ?",
+            (",".join(channels), self.bot_id, group_id)
+        )
+        self.conn.commit()
+
+    def set_banned_keywords(self, group_id: int, keywords: List[str]):
+        self.ensure_group(group_id)
+        c = self.conn.cursor()
+        c.execute("""
+            UPDATE groups SET banned_keywords = ?
+            WHERE bot_id = ? AND group_id = ?
+        """, (",".join(keywords), self.bot_id, group_id))
+        self.conn.commit()
+
+    def set_enforce_membership(self, group_id: int, value: bool):
+        self.ensure_group(group_id)
+        c = self.conn.cursor()
+        c.execute("""
+            UPDATE groups SET enforce_membership = ?
+            WHERE bot_id = ? AND group_id = ?
+        """, (1 if value else 0, self.bot_id, group_id))
+        self.conn.commit()
+
+    def set_enforce_adblock(self, group_id: int, value: bool):
+        self.ensure_group(group_id)
+        c = self.conn.cursor()
+        c.execute("""
+            UPDATE groups SET enforce_adblock = ?
+            WHERE bot_id = ? AND group_id = ?
+        """, (1 if value else 0, self.bot_id, group_id))
+        self.conn.commit()
+
+    def get_group_ids(self) -> List[int]:
+        c = self.conn.cursor()
+        c.execute("SELECT group_id FROM groups WHERE bot_id = ?", (self.bot_id,))
+        return [r[0] for r in c.fetchall()]
+
+    def get_all_required_channels(self) -> Dict[int, List[str]]:
+        c = self.conn.cursor()
+        c.execute("""
+            SELECT group_id, required_channels FROM groups
+            WHERE bot_id = ? AND required_channels IS NOT NULL AND required_channels != ''
+        """, (self.bot_id,))
+        return {
+            r[0]: [s.strip() for s in r[1].split(",") if s.strip()]
+            for r in c.fetchall()
+        }
+
+    # --- Kanallar (raqamli ID, nom, havola) ---
+
+    def save_channels(self, channels: List[dict]):
+        now = int(time.time())
+        c = self.conn.cursor()
+        c.executemany("""
+            INSERT INTO channels (bot_id, chat_id, ident, title, username, invite_link, checked_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(bot_id, chat_id) DO UPDATE SET
+                ident = excluded.ident,
+                title = excluded.title,
+                username = excluded.username,
+                invite_link = excluded.invite_link,
+                checked_at = excluded.checked_at
+        """, [
+            (self.bot_id, ch["chat_id"], ch["ident"], ch["title"], ch["username"], ch["invite_link"], now)
+            for ch in channels
+        ])
+        self.conn.commit()
+
+    def get_channels(self, chat_ids: List[int]) -> Dict[int, dict]:
+        if not chat_ids:
+            return {}
+        c = self.conn.cursor()
+        c.execute(f"""
+            SELECT chat_id, ident, title, username, invite_link
+            FROM channels
+            WHERE bot_id = ? AND chat_id IN ({",".join("?" * len(chat_ids))})
+        """, [self.bot_id, *chat_ids])
+        return {
+            r[0]: {
+                "chat_id": r[0],
+                "ident": r[1] or "",
+                "title": r[2] or "",
+                "username": r[3] or "",
+                "invite_link": r[4] or "",
+            }
+            for r in c.fetchall()
+        }
+
+    def get_stale_channels(self, max_age: int) -> List[int]:
+        c = self.conn.cursor()
+        c.execute(
+            "SELECT chat_id FROM channels WHERE bot_id = ? AND checked_at < ?",
+            (self.bot_id, int(time.time()) - max_age)
+        )
+        return [r[0] for r in c.fetchall()]
+
+    def set_membership_fail_open(self, group_id: int, value: bool):
+        self.ensure_group(group_id)
+        c = self.conn.cursor()
+        c.execute("""
+            UPDATE groups SET membership_fail_open = ?
+            WHERE bot_id = ? AND group_id = ?
+        """, (1 if value else 0, self.bot_id, group_id))
+        self.conn.commit()
+
+    def set_disabled_filters(self, group_id: int, names: List[str]):
+        self.ensure_group(group_id)
+        c = self.conn.cursor()
+        c.execute("""
+            UPDATE groups SET disabled_filters = ?
+            WHERE bot_id = ? AND group_id = ?
+        """, (",".join(names), self.bot_id, group_id))
+        self.conn.commit()
+
+    def set_classifier_threshold(self, group_id: int, value: float):
+        self.ensure_group(group_id)
+        c = self.conn.cursor()
+        c.execute("""
+            UPDATE groups SET classifier_threshold = ?
+            WHERE bot_id = ? AND group_id = ?
+        """, (float(value), self.bot_id, group_id))
+        self.conn.commit()
+
+    # --- Pending join xabarlarini boshqarish ---
+
+    def save_join_message(self, user_id: int, group_id: int, chat_id: int, message_id: int,
+                          ttl: int = PENDING_JOIN_TTL):
+        now = int(time.time())
+        c = self.conn.cursor()
+        # Bir xil yozuv qayta saqlansa — faqat muddati yangilanadi (boshqa dvigatellardagidek)
+        c.execute("""
+            UPDATE pending_join_msgs SET created_at = ?, expires_at = ?
+            WHERE bot_id = ? AND user_id = ? AND group_id = ? AND chat_id = ? AND message_id = ?
+        """, (now, now + ttl, self.bot_id, user_id, group_id, chat_id, message_id))
+        if c.rowcount == 0:
+            c.execute("""
+                INSERT INTO pending_join_msgs (bot_id, user_id, group_id, chat_id, message_id, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (self.bot_id, user_id, group_id, chat_id, message_id, now, now + ttl))
+        c.execute("""
+            INSERT OR REPLACE INTO pending_checks (bot_id, user_id, group_id, step, next_check)
+            VALUES (?, ?, ?, 0, ?)
+        """, (self.bot_id, user_id, group_id, now + RECHECK_SCHEDULE[0]))
+        self.conn.commit()
+
+    def pop_expired_join_messages(self, now: int, limit: int) -> List[Tuple[int, int, int, int]]:
+        c = self.conn.cursor()
+        c.execute("""
+            SELECT rowid, user_id, group_id, chat_id, message_id FROM pending_join_msgs
+            WHERE bot_id = ? AND expires_at <= ? ORDER BY expires_at LIMIT ?
+        """, (self.bot_id, now, limit))
+        rows = c.fetchall()
+        if rows:
+            c.executemany("DELETE FROM pending_join_msgs WHERE rowid = ?", [(r[0],) for r in rows])
+            # Boshqa yozuvi qolmagan juftliklarning jadvali ham o‘chadi
+            c.executemany("""
+                DELETE FROM pending_checks WHERE bot_id = ? AND user_id = ? AND group_id = ? AND NOT EXISTS (
+                    SELECT 1 FROM pending_join_msgs p
+                    WHERE p.bot_id = pending_checks.bot_id AND p.user_id = pending_checks.user_id
+                      AND p.group_id = pending_checks.group_id
+                )
+            """, {(self.bot_id, r[1], r[2]) for r in rows})
+            self.conn.commit()
+        return [tuple(r[1:]) for r in rows]
+
+    def delete_group_join_messages(self, group_id: int) -> int:
+        c = self.conn.cursor()
+        c.execute("DELETE FROM pending_join_msgs WHERE bot_id = ? AND group_id = ?", (self.bot_id, group_id))
+        removed = c.rowcount
+        c.execute("DELETE FROM pending_checks WHERE bot_id = ? AND group_id = ?", (self.bot_id, group_id))
+        self.conn.commit()
+        return removed
+
+    def get_join_messages(self, user_id: int, group_id: int) -> List[Tuple[int, int]]:
+        c = self.conn.cursor()
+        c.execute("""
+            SELECT chat_id, message_id FROM pending_join_msgs
+            WHERE user_id = ? AND group_id = ? AND bot_id = ?
+        """, (user_id, group_id, self.bot_id))
+        return [(r[0], r[1]) for r in c.fetchall()]
+
+    def delete_join_messages(self, user_id: int, group_id: int):
+        c = self.conn.cursor()
+        c.execute("""
+            DELETE FROM pending_join_msgs
+            WHERE user_id = ? AND group_id = ? AND bot_id = ?
+        """, (user_id, group_id, self.bot_id))
+        c.execute(
+            "DELETE FROM pending_checks WHERE bot_id = ? AND user_id = ? AND group_id = ?",
+            (self.bot_id, user_id, group_id)
+        )
+        self.conn.commit()
+
+    def count_join_message_refs(self, chat_id: int, message_id: int) -> int:
+        c = self.conn.cursor()
+        c.execute("""
+            SELECT COUNT(*) FROM pending_join_msgs
+            WHERE chat_id = ? AND message_id = ? AND bot_id = ?
+        """, (chat_id, message_id, self.bot_id))
+        return c.fetchone()[0]
+
+    def get_pending_groups_for_user(self, user_id: int) -> List[int]:
+        c = self.conn.cursor()
+        c.execute("""
+            SELECT DISTINCT group_id FROM pending_join_msgs
+            WHERE user_id = ? AND bot_id = ?
+        """, (user_id, self.bot_id))
+        return [r[0] for r in c.fetchall()]
+
+    def get_pending_user_ids(self) -> List[int]:
+        c = self.conn.cursor()
+        c.execute("SELECT DISTINCT user_id FROM pending_join_msgs WHERE bot_id = ?", (self.bot_id,))
+        return [r[0] for r in c.fetchall()]
+
+    # --- Qayta tekshirish jadvali ---
+
+    def get_due_rechecks(self, now: int, limit: int, offset: int = 0) -> List[Tuple[int, int, int]]:
+        c = self.conn.cursor()
+        c.execute("""
+            SELECT user_id, group_id, step FROM pending_checks
+            WHERE bot_id = ? AND next_check <= ? ORDER BY next_check, user_id, group_id LIMIT ? OFFSET ?
+        """, (self.bot_id, now, limit, offset))
+        return [(r[0], r[1], r[2]) for r in c.fetchall()]
+
+    def set_recheck(self, user_id: int, group_id: int, step: int, next_check: int):
+        c = self.conn.cursor()
+        c.execute("""
+            UPDATE pending_checks SET step = ?, next_check = ?
+            WHERE bot_id = ? AND user_id = ? AND group_id = ?
+        """, (step, next_check, self.bot_id, user_id, group_id))
+        self.conn.commit()
+
+    def reset_rechecks(self, user_ids: List[int], next_check: int) -> int:
+        c = self.conn.cursor()
+        c.executemany("""
+            UPDATE pending_checks SET step = 0, next_check = ?
+            WHERE bot_id = ? AND user_id = ? AND (step > 0 OR next_check > ?)
+        """, [(next_check, self.bot_id, uid, next_check) for uid in user_ids])
+        self.conn.commit()
+        return c.rowcount
+
+    # --- Taqiqlangan media ---
+
+    def add_blocked_media(self, keys: List[str], added_by: int):
+        now = int(time.time())
+        c = self.conn.cursor()
+        c.executemany("""
+            INSERT OR REPLACE INTO blocked_media (key, added_by, added_at)
+            VALUES (?, ?, ?)
+        """, [(k, added_by, now) for k in keys])
+        self.conn.commit()
+
+    def remove_blocked_media(self, keys: List[str]):
+        c = self.conn.cursor()
+        c.executemany("DELETE FROM blocked_media WHERE key = ?", [(k,) for k in keys])
+        self.conn.commit()
+
+    def get_blocked_media_since(self, since: int, limit: int) -> List[str]:
+        c = self.conn.cursor()
+        c.execute(
+            "SELECT key FROM blocked_media WHERE added_at >= ? ORDER BY added_at ASC LIMIT ?",
+            (since, limit)
+        )
+        return [r[0] for r in c.fetchall()]
+
+    # --- Statistika ---
+    def add_group_stats(self, rows: List[Tuple[int, int, str, int]]):
+        # Xato bo‘lsa hammasi bekor qilinadi — GroupStats keyingi safar qayta yozadi
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO group_stats (bot_id, group_id, hour, key, value) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (bot_id, group_id, hour, key) DO UPDATE SET value = value + excluded.value
+            """, [(self.bot_id, *r) for r in rows])
+
+    def get_group_stats(self, group_id: int, since_hour: int) -> Dict[str, int]:
+        c = self.conn.cursor()
+        c.execute(
+            "SELECT key, SUM(value) FROM group_stats WHERE bot_id=? AND group_id=? AND hour>=? GROUP BY key",
+            (self.bot_id, group_id, since_hour)
+        )
+        return dict(c.fetchall())
+
+    def get_top_groups(self, key: str, since_hour: int, limit: int) -> List[Tuple[int, int]]:
+        c = self.conn.cursor()
+        c.execute("""
+            SELECT group_id, SUM(value) AS total FROM group_stats
+            WHERE bot_id=? AND key=? AND hour>=? GROUP BY group_id ORDER BY total DESC LIMIT ?
+        """, (self.bot_id, key, since_hour, limit))
+        return c.fetchall()
+
+    def delete_group_stats_before(self, hour: int) -> int:
+        # Barcha botlar uchun — saqlash muddati umumiy
+        c = self.conn.cursor()
+        c.execute("DELETE FROM group_stats WHERE hour < ?", (hour,))
+        self.conn.commit()
+        return c.rowcount
+
+    def compact(self):
+        # execute() pragma’ni bir qadam bajaradi (bitta sahifa) — executescript
+        # oxirigacha bajaradi
+        self.conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES});")
+
+    def close(self):
+        self.conn.close()
+
+
+# ---------------------------
+# Xotiradagi saqlash
+# ---------------------------
+
+class MemoryStorage(Storage):
+    """Hamma narsa jarayon xotirasida — qayta ishga tushganda yo‘qoladi."""
+
+    def __init__(self):
+        self._groups: Dict[int, dict] = {}
+        self._channels: Dict[int, dict] = {}      # chat_id -> kanal + checked_at
+        self._pending: Dict[int, Dict[int, List[Tuple[int, int]]]] = {}  # user -> guruh -> [(chat, msg)]
+        self._expires: Dict[Tuple[int, int, int, int], int] = {}         # (user, guruh, chat, msg) -> vaqt
+        self._checks: Dict[Tuple[int, int], Tuple[int, int]] = {}        # (user, guruh) -> (step, next_check)
+        self._refs: Dict[Tuple[int, int], int] = {}
+        self._blocked: Dict[str, Tuple[int, int]] = {}  # kalit -> (added_by, added_at)
+        self._stats: Dict[Tuple[int, int, str], int] = {}
+
+    def partition(self, bot_id: int) -> Storage:
+        view = MemoryStorage()
+        view.bot_id = bot_id
+        view._blocked = self._blocked  # umumiy
+        return view
+
+    # --- Guruh sozlamalari ---
+    def get_group(self, group_id: int) -> Optional[dict]:
+        g = self._groups.get(group_id)
+        return dict(g) if g is not None else None
+
+    def ensure_group(self, group_id: int):
+        if group_id not in self._groups:
+            self._groups[group_id] = new_group_row()
+
+    def _set_group_field(self, group_id: int, field: str, value):
+        self.ensure_group(group_id)
+        self._groups[group_id][field] = value
+
+    def get_group_ids(self) -> List[int]:
+        return list(self._groups)
+
+    def get_all_required_channels(self) -> Dict[int, List[str]]:
+        return {
+            gid: [s.strip() for s in g["required_channels"].split(",") if s.strip()]
+            for gid, g in self._groups.items() if g["required_channels"]
+        }
+
+    # --- Kanallar ---
+    def save_channels(self, channels: List[dict]):
+        now = int(time.time())
+        for ch in channels:
+            self._channels[ch["chat_id"]] = {
+                "chat_id": ch["chat_id"],
+                "ident": ch["ident"] or "",
+                "title": ch["title"] or "",
+                "username": ch["username"] or "",
+                "invite_link": ch["invite_link"] or "",
+                "checked_at": now,
+            }
+
+    def get_channels(self, chat_ids: List[int]) -> Dict[int, dict]:
+        result = {}
+        for chat_id in chat_ids:
+            ch = self._channels.get(chat_id)
+            if ch is not None:
+                result[chat_id] = {k: v for k, v in ch.items() if k != "checked_at"}
+        return result
+
+    def get_stale_channels(self, max_age: int) -> List[int]:
+        cutoff = int(time.time()) - max_age
+        return [chat_id for chat_id, ch in self._channels.items() if ch["checked_at"] < cutoff]
+
+    # --- Pending join xabarlari ---
+    def save_join_message(self, user_id: int, group_id: int, chat_id: int, message_id: int,
+                          ttl: int = PENDING_JOIN_TTL):
+        msgs = self._pending.setdefault(user_id, {}).setdefault(group_id, [])
+        if (chat_id, message_id) not in msgs:  # takror — faqat muddati yangilanadi
+            msgs.append((chat_id, message_id))
+            self._refs[(chat_id, message_id)] = self._refs.get((chat_id, message_id), 0) + 1
+        now = int(time.time())
+        self._expires[(user_id, group_id, chat_id, message_id)] = now + ttl
+        self._checks[(user_id, group_id)] = (0, now + RECHECK_SCHEDULE[0])
+
+    def pop_expired_join_messages(self, now: int, limit: int) -> List[Tuple[int, int, int, int]]:
+        expired = sorted((at, k) for k, at in self._expires.items() if at <= now)[:limit]
+        rows = [k for _, k in expired]
+        for user_id, group_id, chat_id, message_id in rows:
+            self._remove_join_message(user_id, group_id, chat_id, message_id)
+        return rows
+
+    def _remove_join_message(self, user_id: int, group_id: int, chat_id: int, message_id: int):
+        self._expires.pop((user_id, group_id, chat_id, message_id), None)
+        groups = self._pending.get(user_id, {})
+        msgs = groups.get(group_id, [])
+        if (chat_id, message_id) in msgs:
+            msgs.remove((chat_id, message_id))
+            n = self._refs.get((chat_id, message_id), 0) - 1
+            if n > 0:
+                self._refs[(chat_id, message_id)] = n
+            else:
+                self._refs.pop((chat_id, message_id), None)
+        if not msgs:
+            groups.pop(group_id, None)
+            self._checks.pop((user_id, group_id), None)
+        if not groups:
+            self._pending.pop(user_id, None)
+
+    def delete_group_join_messages(self, group_id: int) -> int:
+        rows = [k for k in self._expires if k[1] == group_id]
+        for row in rows:
+            self._remove_join_message(*row)
+        return len(rows)
+
+    def get_join_messages(self, user_id: int, group_id: int) -> List[Tuple[int, int]]:
+        return list(self._pending.get(user_id, {}).get(group_id, ()))
+
+    def delete_join_messages(self, user_id: int, group_id: int):
+        for chat_id, message_id in self.get_join_messages(user_id, group_id):
+            self._remove_join_message(user_id, group_id, chat_id, message_id)
+
+    def count_join_message_refs(self, chat_id: int, message_id: int) -> int:
+        return self._refs.get((chat_id, message_id), 0)
+
+    def get_pending_groups_for_user(self, user_id: int) -> List[int]:
+        return list(self._pending.get(user_id, ()))
+
+    def get_pending_user_ids(self) -> List[int]:
+        return list(self._pending)
+
+    # --- Qayta tekshirish jadvali ---
+    def get_due_rechecks(self, now: int, limit: int, offset: int = 0) -> List[Tuple[int, int, int]]:
+        due = sorted((nxt, k, step) for k, (step, nxt) in self._checks.items() if nxt <= now)[offset:offset + limit]
+        return [(k[0], k[1], step) for _, k, step in due]
+
+    def set_recheck(self, user_id: int, group_id: int, step: int, next_check: int):
+        if (user_id, group_id) in self._checks:
+            self._checks[(user_id, group_id)] = (step, next_check)
+
+    def reset_rechecks(self, user_ids: List[int], next_check: int) -> int:
+        n = 0
+        for user_id in user_ids:
+            for group_id in self._pending.get(user_id, ()):
+                step, nxt = self._checks.get((user_id, group_id), (0, 0))
+                if step > 0 or nxt > next_check:
+                    self._checks[(user_id, group_id)] = (0, next_check)
+                    n += 1
+        return n
+
+    # --- Taqiqlangan media ---
+    def add_blocked_media(self, keys: List[str], added_by: int):
+        now = int(time.time())
+        for k in keys:
+            self._blocked[k] = (added_by, now)
+
+    def remove_blocked_media(self, keys: List[str]):
+        for k in keys:
+            self._blocked.pop(k, None)
+
+    def get_blocked_media_since(self, since: int, limit: int) -> List[str]:
+        items = sorted((at, k) for k, (_, at) in self._blocked.items() if at >= since)
+        return [k for _, k in items[:limit]]
+
+    # --- Statistika ---
+    def add_group_stats(self, rows: List[Tuple[int, int, str, int]]):
+        for gid, hour, key, value in rows:
+            self._stats[(gid, hour, key)] = self._stats.get((gid, hour, key), 0) + value
+
+    def get_group_stats(self, group_id: int, since_hour: int) -> Dict[str, int]:
+        total: Dict[str, int] = {}
+        for (gid, hour, key), value in self._stats.items():
+            if gid == group_id and hour >= since_hour:
+                total[key] = total.get(key, 0) + value
+        return total
+
+    def get_top_groups(self, key: str, since_hour: int, limit: int) -> List[Tuple[int, int]]:
+        total: Dict[int, int] = {}
+        for (gid, hour, k), value in self._stats.items():
+            if k == key and hour >= since_hour:
+                total[gid] = total.get(gid, 0) + value
+        return sorted(total.items(), key=lambda x: -x[1])[:limit]
+
+    def delete_group_stats_before(self, hour: int) -> int:
+        old = [k for k in self._stats if k[1] < hour]
+        for k in old:
+            del self._stats[k]
+        return len(old)
+
+
+# ---------------------------
+# LMDB (ixtiyoriy)
+# ---------------------------
+# Har bir jadval — alohida nomlangan lmdb bazasi, kalitlar matn:
+#   groups   "<group_id>"                         -> JSON
+#   channels "<chat_id>"                          -> JSON (+ checked_at)
+#   pending  "<user>:<group>:<chat>:<message>"    -> expires_at
+#   refs     "<chat>:<message>:<user>:<group>"    -> ""  (teskari indeks)
+#   expiry   "<expires_at:012>:<user>:<group>:<chat>:<message>" -> ""  (muddat indeksi)
+#   checks   "<user>:<group>"                     -> "<step>:<next_check>"
+#   due      "<next_check:012>:<user>:<group>"    -> ""  (qayta tekshirish indeksi)
+#   blocked  "<key>"                              -> JSON [added_by, added_at]
+#   stats    "<group>:<hour>:<key>"               -> son
+# Bir xil pending yozuvi ikki marta saqlanmaydi. lmdb bir nechta
+# jarayondan o‘qish/yozishni qo‘llaydi (sharding). Qo‘shimcha botlar
+# bo‘limi — "@<bot_id>" qo‘shimchali alohida bazalar ("groups@123", ...),
+# blocked esa umumiy.
+
+class LMDBStorage(Storage):
+    def __init__(self, path: str = LMDB_PATH, map_size: int = LMDB_MAP_SIZE):
+        try:
+            import lmdb
+        except ImportError as e:
+            raise RuntimeError("BOT_STORAGE=lmdb uchun lmdb kerak. O‘rnatish: pip install lmdb") from e
+
+        self.env = lmdb.open(path, map_size=map_size, subdir=False, max_dbs=LMDB_MAX_DBS)
+        self._blocked = self.env.open_db(b"blocked")
+        self._open_partition("")
+
+    def _open_partition(self, suffix: str):
+        name = lambda table: (table + suffix).encode()
+        self._groups = self.env.open_db(name("groups"))
+        self._channels = self.env.open_db(name("channels"))
+        self._pending = self.env.open_db(name("pending"))
+        self._refs = self.env.open_db(name("refs"))
+        self._stats = self.env.open_db(name("stats"))
+        self._expiry = self.env.open_db(name("expiry"))
+        self._checks = self.env.open_db(name("checks"))
+        self._due = self.env.open_db(name("due"))
+
+    def partition(self, bot_id: int) -> Storage:
+        view = super().partition(bot_id)
+        view._open_partition(f"@{bot_id}")
+        return view
+
+    @staticmethod
+    def _k(*parts) -> bytes:
+        return ":".join(str(p) for p in parts).encode()
+
+    @staticmethod
+    def _scan(txn, db, prefix: bytes = b""):
+        cur = txn.cursor(db)
+        if not cur.set_range(prefix):
+            return
+        for key, value in cur:
+            if not key.startswith(prefix):
+                break
+            yield key, value
+
+    # --- Guruh sozlamalari ---
+    def get_group(self, group_id: int) -> Optional[dict]:
+        with self.env.begin(db=self._groups) as txn:
+            raw = txn.get(self._k(group_id))
+        return json.loads(raw) if raw is not None else None
+
+    def ensure_group(self, group_id: int):
+        with self.env.begin(write=True, db=self._groups) as txn:
+            txn.put(self._k(group_id), json.dumps(new_group_row()).encode(), overwrite=False)
+
+    def _set_group_field(self, group_id: int, field: str, value):
+        with self.env.begin(write=True, db=self._groups) as txn:
+            raw = txn.get(self._k(group_id))
+            g = json.loads(raw) if raw is not None else new_group_row()
+            g[field] = value
+            txn.put(self._k(group_id), json.dumps(g).encode())
+
+    def get_group_ids(self) -> List[int]:
+        with self.env.begin(db=self._groups) as txn:
+            return [int(k) for k, _ in self._scan(txn, self._groups)]
+
+    def get_all_required_channels(self) -> Dict[int, List[str]]:
+        result = {}
+        with self.env.begin(db=self._groups) as txn:
+            for k, raw in self._scan(txn, self._groups):
+                chs = json.loads(raw)["required_channels"]
+                if chs:
+                    result[int(k)] = [s.strip() for s in chs.split(",") if s.strip()]
+        return result
+
+    # --- Kanallar ---
+    def save_channels(self, channels: List[dict]):
+        now = int(time.time())
+        with self.env.begin(write=True, db=self._channels) as txn:
+            for ch in channels:
+                row = {
+                    "chat_id": ch["chat_id"],
+                    "ident": ch["ident"] or "",
+                    "title": ch["title"] or "",
+                    "username": ch["username"] or "",
+                    "invite_link": ch["invite_link"] or "",
+                    "checked_at": now,
+                }
+                txn.put(self._k(ch["chat_id"]), json.dumps(row).encode())
+
+    def get_channels(self, chat_ids: List[int]) -> Dict[int, dict]:
+        result = {}
+        with self.env.begin(db=self._channels) as txn:
+            for chat_id in chat_ids:
+                raw = txn.get(self._k(chat_id))
+                if raw is not None:
+                    row = json.loads(raw)
+                    row.pop("checked_at", None)
+                    result[chat_id] = row
+        return result
+
+    def get_stale_channels(self, max_age: int) -> List[int]:
+        cutoff = int(time.time()) - max_age
+        with self.env.begin(db=self._channels) as txn:
+            return [
+                int(k) for k, raw in self._scan(txn, self._channels)
+                if json.loads(raw)["checked_at"] < cutoff
+            ]
+
+    # --- Pending join xabarlari ---
+    def save_join_message(self, user_id: int, group_id: int, chat_id: int, message_id: int,
+                          ttl: int = PENDING_JOIN_TTL):
+        expires_at = int(time.time()) + ttl
+        with self.env.begin(write=True) as txn:
+            old = txn.get(self._k(user_id, group_id, chat_id, message_id), db=self._pending)
+            if old:
+                txn.delete(self._k(f"{int(old):012d}", user_id, group_id, chat_id, message_id), db=self._expiry)
+            txn.put(self._k(user_id, group_id, chat_id, message_id), str(expires_at).encode(), db=self._pending)
+            txn.put(self._k(chat_id, message_id, user_id, group_id), b"", db=self._refs)
+            txn.put(self._k(f"{expires_at:012d}", user_id, group_id, chat_id, message_id), b"", db=self._expiry)
+            self._put_check(txn, user_id, group_id, 0, expires_at - ttl + RECHECK_SCHEDULE[0])
+
+    def _put_check(self, txn, user_id, group_id, step: int, next_check: int):
+        self._drop_check(txn, user_id, group_id)
+        txn.put(self._k(user_id, group_id), f"{step}:{next_check}".encode(), db=self._checks)
+        txn.put(self._k(f"{next_check:012d}", user_id, group_id), b"", db=self._due)
+
+    def _drop_check(self, txn, user_id, group_id) -> Optional[Tuple[int, int]]:
+        old = txn.pop(self._k(user_id, group_id), db=self._checks)
+        if not old:
+            return None
+        step, next_check = (int(x) for x in old.decode().split(":"))
+        txn.delete(self._k(f"{next_check:012d}", user_id, group_id), db=self._due)
+        return step, next_check
+
+    def _delete_pending(self, txn, user_id, group_id, chat_id, message_id):
+        old = txn.pop(self._k(user_id, group_id, chat_id, message_id), db=self._pending)
+        txn.delete(self._k(chat_id, message_id, user_id, group_id), db=self._refs)
+        if old:
+            txn.delete(self._k(f"{int(old):012d}", user_id, group_id, chat_id, message_id), db=self._expiry)
+        # Juftlikning oxirgi yozuvi bo‘lsa — jadvali ham o‘chadi
+        if next(self._scan(txn, self._pending, self._k(user_id, group_id, "")), None) is None:
+            self._drop_check(txn, user_id, group_id)
+
+    def pop_expired_join_messages(self, now: int, limit: int) -> List[Tuple[int, int, int, int]]:
+        rows = []
+        with self.env.begin(write=True) as txn:
+            for k, _ in self._scan(txn, self._expiry):
+                expires_at, *row = k.decode().split(":")
+                if int(expires_at) > now or len(rows) >= limit:
+                    break
+                rows.append(tuple(int(x) for x in row))
+            for row in rows:
+                self._delete_pending(txn, *row)
+        return rows
+
+    def delete_group_join_messages(self, group_id: int) -> int:
+        with self.env.begin(write=True) as txn:
+            rows = []
+            for k, _ in self._scan(txn, self._pending):
+                user_id, gid, chat_id, message_id = (int(x) for x in k.decode().split(":"))
+                if gid == group_id:
+                    rows.append((user_id, gid, chat_id, message_id))
+            for row in rows:
+                self._delete_pending(txn, *row)
+        return len(rows)
+
+    def get_join_messages(self, user_id: int, group_id: int) -> List[Tuple[int, int]]:
+        with self.env.begin(db=self._pending) as txn:
+            result = []
+            for k, _ in self._scan(txn, self._pending, self._k(user_id, group_id, "")):
+                _, _, chat_id, message_id = k.decode().split(":")
+                result.append((int(chat_id), int(message_id)))
+            return result
+
+    def delete_join_messages(self, user_id: int, group_id: int):
+        with self.env.begin(write=True) as txn:
+            keys = [k for k, _ in self._scan(txn, self._pending, self._k(user_id, group_id, ""))]
+            for k in keys:
+                _, _, chat_id, message_id = k.decode().split(":")
+                self._delete_pending(txn, user_id, group_id, chat_id, message_id)
+
+    def count_join_message_refs(self, chat_id: int, message_id: int) -> int:
+        with self.env.begin(db=self._refs) as txn:
+            return sum(1 for _ in self._scan(txn, self._refs, self._k(chat_id, message_id, "")))
+
+    def get_pending_groups_for_user(self, user_id: int) -> List[int]:
+        with self.env.begin(db=self._pending) as txn:
+            groups = {int(k.decode().split(":")[1]) for k, _ in self._scan(txn, self._pending, self._k(user_id, ""))}
+        return list(groups)
+
+    def get_pending_user_ids(self) -> List[int]:
+        with self.env.begin(db=self._pending) as txn:
+            users = {int(k.decode().split(":", 1)[0]) for k, _ in self._scan(txn, self._pending)}
+        return list(users)
+
+    # --- Qayta tekshirish jadvali ---
+    def get_due_rechecks(self, now: int, limit: int, offset: int = 0) -> List[Tuple[int, int, int]]:
+        rows = []
+        with self.env.begin() as txn:
+            for i, (k, _) in enumerate(self._scan(txn, self._due)):
+                next_check, user_id, group_id = (int(x) for x in k.decode().split(":"))
+                if next_check > now or len(rows) >= limit:
+                    break
+                if i < offset:
+                    continue
+                raw = txn.get(self._k(user_id, group_id), db=self._checks)
+                rows.append((user_id, group_id, int(raw.decode().split(":")[0]) if raw else 0))
+        return rows
+
+    def set_recheck(self, user_id: int, group_id: int, step: int, next_check: int):
+        with self.env.begin(write=True) as txn:
+            if txn.get(self._k(user_id, group_id), db=self._checks) is not None:
+                self._put_check(txn, user_id, group_id, step, next_check)
+
+    def reset_rechecks(self, user_ids: List[int], next_check: int) -> int:
+        n = 0
+        with self.env.begin(write=True) as txn:
+            for user_id in user_ids:
+                for k, raw in list(self._scan(txn, self._checks, self._k(user_id, ""))):
+                    step, nxt = (int(x) for x in raw.decode().split(":"))
+                    if step > 0 or nxt > next_check:
+                        self._put_check(txn, user_id, int(k.decode().split(":")[1]), 0, next_check)
+                        n += 1
+        return n
+
+    # --- Taqiqlangan media ---
+    def add_blocked_media(self, keys: List[str], added_by: int):
+        now = int(time.time())
+        with self.env.begin(write=True, db=self._blocked) as txn:
+            for k in keys:
+                txn.put(k.encode(), json.dumps([added_by, now]).encode())
+
+    def remove_blocked_media(self, keys: List[str]):
+        with self.env.begin(write=True, db=self._blocked) as txn:
+            for k in keys:
+                txn.delete(k.encode())
+
+    def get_blocked_media_since(self, since: int, limit: int) -> List[str]:
+        with self.env.begin(db=self._blocked) as txn:
+            items = sorted(
+                (json.loads(raw)[1], k.decode()) for k, raw in self._scan(txn, self._blocked)
+            )
+        return [k for at, k in items if at >= since][:limit]
+
+    # --- Statistika ---
+    def add_group_stats(self, rows: List[Tuple[int, int, str, int]]):
+        with self.env.begin(write=True, db=self._stats) as txn:
+            for gid, hour, key, value in rows:
+                k = self._k(gid, hour, key)
+                raw = txn.get(k)
+                txn.put(k, str((int(raw) if raw is not None else 0) + value).encode())
+
+    def get_group_stats(self, group_id: int, since_hour: int) -> Dict[str, int]:
+        total: Dict[str, int] = {}
+        with self.env.begin(db=self._stats) as txn:
+            for k, raw in self._scan(txn, self._stats, self._k(group_id, "")):
+                _, hour, key = k.decode().split(":", 2)
+                if int(hour) >= since_hour:
+                    total[key] = total.get(key, 0) + int(raw)
+        return total
+
+    def get_top_groups(self, key: str, since_hour: int, limit: int) -> List[Tuple[int, int]]:
+        total: Dict[int, int] = {}
+        with self.env.begin(db=self._stats) as txn:
+            for k, raw in self._scan(txn, self._stats):
+                gid, hour, k2 = k.decode().split(":", 2)
+                if k2 == key and int(hour) >= since_hour:
+                    total[int(gid)] = total.get(int(gid), 0) + int(raw)
+        return sorted(total.items(), key=lambda x: -x[1])[:limit]
+
+    def delete_group_stats_before(self, hour: int) -> int:
+        with self.env.begin(write=True, db=self._stats) as txn:
+            old = [k for k, _ in self._scan(txn, self._stats) if int(k.decode().split(":", 2)[1]) < hour]
+            for k in old:
+                txn.delete(k)
+        return len(old)
+
+    def close(self):
+        self.env.close()
+
+
+def open_storage(engine: str = STORAGE_ENGINE) -> Storage:
+    if engine == "sqlite":
+        return DB(DB_PATH)
+    if engine == "memory":
+        return MemoryStorage()
+    if engine == "lmdb":
+        return LMDBStorage(LMDB_PATH)
+    raise ValueError(f"Noma’lum saqlash turi: {engine} (sqlite | memory | lmdb)")
+
+
+# LazyStorage shu prefiksli metodlarni "db.<metod>" spani bilan o‘raydi
+STORAGE_WRITE_PREFIXES = ("set_", "save_", "add_", "delete_", "remove_", "pop_", "reset_", "ensure_")
+
+
+class LazyStorage:
+    """Saqlash birinchi murojaatda ochiladi — import paytida fayl yaratilmaydi.
+
+    Qo‘shimcha bot uchun ishlanayotgan bo‘lsa (current_bot), uning bo‘limi
+    qaytariladi. Trace yig‘ilayotganda yozish metodlari spanga o‘raladi.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._impl: Optional[Storage] = None
+        self._partitions: Dict[int, Storage] = {}
+
+    def __getattr__(self, name):
+        if self._impl is None:
+            self._impl = self._factory()
+        bot_id = current_bot.get()
+        if not bot_id:
+            attr = getattr(self._impl, name)
+        else:
+            part = self._partitions.get(bot_id)
+            if part is None:
+                part = self._partitions[bot_id] = self._impl.partition(bot_id)
+            attr = getattr(part, name)
+        if current_traces.get() is not None and name.startswith(STORAGE_WRITE_PREFIXES):
+            return traced("db." + name, attr)
+        return attr
+
+
+db = LazyStorage(open_storage)
+
+
+# ---------------------------
+# Keshlar (xotirada va jarayonlararo)
+# ---------------------------
+
+class TTLCache:
+    """Muddati cheklangan, hajmi chegaralangan oddiy LRU kesh."""
+
+    def __init__(self, ttl: float, maxsize: int = CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[object, Tuple[float, object]]" = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def items_with_ttl(self):
+        """(kalit, qiymat, qolgan_ttl) — muddati o‘tmaganlar."""
+        now = time.monotonic()
+        return [(k, v, exp - now) for k, (exp, v) in self._data.items() if exp > now]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedCache:
+    """Jarayonlararo kesh: WAL rejimidagi alohida SQLite fayli.
+
+    Bir xostdagi ishchilar get_chat_member / get_chat_administrators
+    natijalarini shu yerda bo‘lishadi. Muddat devor soati (time.time)
+    bo‘yicha saqlanadi. Fayl band bo‘lsa yoki xato bo‘lsa — kesh topilmadi
+    deb hisoblanadi, bot ishlashda davom etadi.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, timeout=SHARED_CACHE_BUSY_TIMEOUT, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Kesh — yo‘qolsa ham zarari yo‘q, fsync shart emas
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                expires_at REAL
+            ) WITHOUT ROWID
+        """)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Tuple[object, float]]:
+        """(qiymat, qolgan_ttl) yoki None."""
+        found = self.peek(key)
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def peek(self, key: str) -> Optional[Tuple[object, float]]:
+        """get() kabi, lekin kesh statistikasiga qo‘shilmaydi (ichki holat uchun)."""
+        now = time.time()
+        try:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key=? AND expires_at>?", (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.debug(f"Umumiy kesh o‘qilmadi: {e}")
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1] - now
+
+    def claim(self, key: str, ttl: float) -> bool:
+        """Kalitni atomar egallaydi: boshqa jarayon egallagan bo‘lsa (muddati
+        o‘tmagan) — False. Xato bo‘lsa True (jarayon yolg‘iz ishlayotgandek)."""
+        now = time.time()
+        try:
+            return self.conn.execute("""
+                INSERT INTO cache (key, value, expires_at) VALUES (?, 'true', ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+                WHERE cache.expires_at <= ?
+            """, (key, now + ttl, now)).rowcount > 0
+        except sqlite3.Error as e:
+            logger.debug(f"Umumiy keshda egallanmadi: {e}")
+            return True
+
+    def count_prefix(self, prefix: str) -> int:
+        """Muddati o‘tmagan, prefix bilan boshlanuvchi kalitlar soni (PK oralig‘i)."""
+        try:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE key >= ? AND key < ? AND expires_at > ?",
+                (prefix, prefix + "\x7f", time.time())
+            ).fetchone()[0]
+        except sqlite3.Error as e:
+            logger.debug(f"Umumiy kesh o‘qilmadi: {e}")
+            return 0
+
+    def set(self, key: str, value, ttl: float):
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl)
+            )
+        except sqlite3.Error as e:
+            logger.debug(f"Umumiy keshga yozilmadi: {e}")
+
+    def delete(self, key: str):
+        try:
+            self.conn.execute("DELETE FROM cache WHERE key=?", (key,))
+        except sqlite3.Error as e:
+            logger.debug(f"Umumiy keshdan o‘chirilmadi: {e}")
+
+    def purge(self) -> int:
+        try:
+            return self.conn.execute("DELETE FROM cache WHERE expires_at<=?", (time.time(),)).rowcount
+        except sqlite3.Error as e:
+            logger.debug(f"Umumiy kesh tozalanmadi: {e}")
+            return 0
+
+
+class SharedTTLCache(TTLCache):
+    """Lokal LRU kesh + umumiy kesh (ikki qavatli).
+
+    Lokal keshda topilmasa, boshqa jarayon yozgan natija umumiy keshdan
+    olinadi va qolgan muddati bilan lokal keshga qo‘yiladi. Yozuvlar
+    ikkala qavatga ham tushadi.
+    """
+
+    def __init__(self, ttl: float, namespace: str, shared: Optional[SharedCache],
+                 encode=lambda v: v, decode=lambda v: v, maxsize: int = CACHE_MAX_ENTRIES):
+        super().__init__(ttl, maxsize)
+        self.namespace = namespace
+        self.shared = shared
+        self.encode = encode
+        self.decode = decode
+
+    def _key(self, key) -> str:
+        return f"{self.namespace}:{json.dumps(key)}"
+
+    def get(self, key, default=None):
+        value = super().get(key)
+        if value is not None:
+            return value
+        if self.shared is None:
+            return default
+        found = self.shared.get(self._key(key))
+        if found is None:
+            return default
+        raw, remaining = found
+        value = self.decode(raw)
+        super().set(key, value, ttl=remaining)
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        super().set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(self._key(key), self.encode(value), self.ttl if ttl is None else ttl)
+
+    def pop(self, key):
+        super().pop(key)
+        if self.shared is not None:
+            self.shared.delete(self._key(key))
+
+
+class LazySharedCache:
+    """Umumiy kesh fayli birinchi murojaatda ochiladi — import paytida yaratilmaydi."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._impl: Optional[SharedCache] = None
+
+    def __getattr__(self, name):
+        if self._impl is None:
+            self._impl = SharedCache(self.path)
+        return getattr(self._impl, name)
+
+
+shared_cache = LazySharedCache(SHARED_CACHE_PATH) if SHARED_CACHE_ENABLED else None
@@ -0,0 +1,78 @@
+"""Umumiy fixture’lar.
+
+bot.py import paytida joriy katalogda fayl ochmaydi, lekin testlar baribir
+vaqtinchalik katalogda ishlaydi — repodagi bot_settings.db ga tegilmaydi.
+"""
+
+import asyncio
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="bot-tests-")
+os.chdir(WORKDIR)
+atexit.register(shutil.rmtree, WORKDIR, ignore_errors=True)
+os.environ.update(BOT_TOKEN="123456:test", BOT_STORAGE="memory")
+for _name in ("BOT_JOURNAL_DIR", "BOT_AUDIT_DIR", "SHARED_CACHE", "BOT_WORKERS", "BOT_EXTRA_TOKENS", "BOT_TRACE", "BOT_CLASSIFIER"):
+    os.environ.pop(_name, None)
+sys.path.insert(0, ROOT)
+
+import bot  # noqa: E402
+import moderation  # noqa: E402
+from storage import DB, LMDBStorage, MemoryStorage, Storage  # noqa: E402
+
+from fakes import FakeApp, FakeBot  # noqa: E402
+
+ENGINES = ["sqlite", "memory", "lmdb"]
+
+
+def open_engine(engine: str, directory) -> "Storage":
+    if engine == "sqlite":
+        return DB(os.path.join(directory, "test.db"))
+    if engine == "memory":
+        return MemoryStorage()
+    pytest.importorskip("lmdb")
+    return LMDBStorage(os.path.join(directory, "test.lmdb"))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """Har bir test toza xotira ombori va bo‘sh keshlar bilan boshlanadi."""
+    monkeypatch.setattr(bot, "db", MemoryStorage())
+    monkeypatch.setattr(moderation, "spam_fingerprints", moderation.SpamFingerprints())
+    monkeypatch.setattr(moderation, "verdict_cache", moderation.VerdictCache())
+    for cache in (bot.admin_cache, bot.membership_cache):
+        cache._data.clear()
+    moderation.blocked_media.clear()
+    for per_bot in (moderation.flood_detector, bot.moderation_batcher, bot.dm_outbox,
+                    bot.load_monitor, bot.group_stats, bot.recheck_scheduler):
+        per_bot._instances.clear()
+    yield
+
+
+@pytest.fixture(params=ENGINES)
+def storage(request, tmp_path, monkeypatch):
+    """Har bir dvigatel uchun alohida: sqlite, memory, lmdb (o‘rnatilgan bo‘lsa)."""
+    s = open_engine(request.param, str(tmp_path))
+    monkeypatch.setattr(bot, "db", s)
+    yield s
+    s.close()
+
+
+@pytest.fixture
+def fake_bot():
+    return FakeBot()
+
+
+@pytest.fixture
+def app(fake_bot):
+    return FakeApp(fake_bot)
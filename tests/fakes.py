@@ -0,0 +1,104 @@
+"""Soxta Bot va Telegram obyektlari — tarmoqsiz handler testlari uchun."""
+
+import asyncio
+import datetime
+import itertools
+import types
+
+from telegram import Chat, ChatMemberAdministrator, ChatMemberLeft, ChatMemberMember, Message, Update, User
+from telegram.error import BadRequest
+
+
+class FakeBot:
+    """Bot API o‘rnini bosadi: chaqiruvlar `calls` ro‘yxatiga yoziladi."""
+
+    def __init__(self):
+        self.calls = []
+        self.members = {}   # (chat_id, user_id) -> "member" | "administrator" | "left"
+        self.admins = {}    # chat_id -> [user_id]
+        self.chats = {"@kanal1": (-1001, "Kanal 1", "kanal1")}
+        self.member_delay = 0.0
+        self.send_errors = {}  # chat_id -> send_message ko‘taradigan xato
+        self.ids = itertools.count(1000)
+        self.id = 42
+        self.username = "fakebot"
+
+    def methods(self):
+        return [c[0] for c in self.calls]
+
+    async def get_chat(self, ident, **kwargs):
+        self.calls.append(("get_chat", ident))
+        for key, (cid, title, username) in self.chats.items():
+            if ident in (key, cid):
+                return Chat(cid, "channel", title=title, username=username)
+        raise BadRequest("Chat not found")
+
+    async def get_chat_member(self, chat_id, user_id, **kwargs):
+        self.calls.append(("get_chat_member", chat_id, user_id))
+        if self.member_delay:
+            await asyncio.sleep(self.member_delay)
+        status = self.members.get((chat_id, user_id), "left")
+        user = User(user_id, "u", False)
+        if status == "administrator":
+            return ChatMemberAdministrator(user, True, *([False] * 10))
+        if status == "member":
+            return ChatMemberMember(user)
+        return ChatMemberLeft(user)
+
+    async def get_chat_administrators(self, chat_id, **kwargs):
+        self.calls.append(("get_chat_administrators", chat_id))
+        return [
+            ChatMemberAdministrator(User(uid, "a", False), True, *([False] * 10))
+            for uid in self.admins.get(chat_id, [])
+        ]
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(("send_message", chat_id, text))
+        if chat_id in self.send_errors:
+            raise self.send_errors[chat_id]
+        return types.SimpleNamespace(message_id=next(self.ids), chat_id=chat_id)
+
+    async def delete_message(self, chat_id, message_id, **kwargs):
+        self.calls.append(("delete_message", chat_id, message_id))
+        return True
+
+
+class FakeApp:
+    def __init__(self, bot: FakeBot):
+        self.bot = bot
+        self.update_queue = asyncio.Queue()
+        self.bot_data = {}
+        self.tasks = []
+
+    def create_task(self, coro, update=None):
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.append(task)
+        return task
+
+    async def drain(self):
+        """Partiya taymerlari va yaratilgan vazifalar tugashini kutadi."""
+        await asyncio.sleep(0.2)
+        while self.tasks:
+            await self.tasks.pop(0)
+
+
+def make_msg(bot: FakeBot, chat_id: int, user_id: int, text: str = None, chat_type: str = "supergroup",
+             message_id: int = None, **kwargs) -> Message:
+    msg = Message(
+        message_id or next(bot.ids), datetime.datetime.now(datetime.timezone.utc),
+        Chat(chat_id, chat_type, title=f"G{chat_id}"), from_user=User(user_id, f"U{user_id}", False),
+        text=text, **kwargs
+    )
+    msg.set_bot(bot)
+    msg.chat.set_bot(bot)
+    return msg
+
+
+def make_update(msg: Message) -> Update:
+    update = Update(next(msg.get_bot().ids), message=msg)
+    update.set_bot(msg.get_bot())
+    return update
+
+
+def make_context(app: FakeApp, args=None):
+    return types.SimpleNamespace(bot=app.bot, application=app, args=list(args or []), bot_data=app.bot_data)
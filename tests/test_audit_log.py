@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+import bot
+import tracing
+from conftest import run
+from fakes import make_context, make_msg, make_update
+
+
+@pytest.fixture
+def audit(tmp_path, monkeypatch):
+    log = tracing.AuditLog(str(tmp_path / "audit"), tracing.AUDIT_MAX_BYTES, 5, 1000)
+    monkeypatch.setattr(tracing, "audit_log", log)
+    return log
+
+
+def entries(log):
+    result = []
+    for path in log._files():
+        with open(path, encoding="utf-8") as f:
+            result += [json.loads(line) for line in f]
+    return result
+
+
+def test_deletions_and_warnings_are_recorded_with_detail(audit, fake_bot):
+    fake_bot.admins[-5] = []
+    msgs = [make_msg(fake_bot, -5, 2, "bu yerga kiring: t.me/reklama_kanal"), make_msg(fake_bot, -5, 3, "salom")]
+    run(bot.moderate_chat_batch(fake_bot, msgs[0].chat, msgs))
+    run(audit.flush())
+
+    delete, warn = entries(audit)
+    assert delete["action"] == "delete" and delete["reason"] == "link"
+    assert delete["detail"] == "t.me/reklama_kanal"
+    assert delete["user"] == 2 and delete["ok"] is True and delete["ms"] >= 0
+    assert warn["action"] == "warn" and warn["reason"] == "ad" and warn["ok"] is True
+
+
+def test_disabled_log_records_nothing():
+    log = tracing.AuditLog("", tracing.AUDIT_MAX_BYTES, 5, 1000)
+    log.record("delete", -5, 2, "link")
+    assert not log.enabled and log._buf == []
+
+
+def test_summary_spans_rotated_files(audit):
+    audit.max_bytes = 1
+    for reason in ("link", "keyword", "link"):
+        audit.record("delete", -5, 2, reason, ms=1000.0)
+        audit.record("delete", -6, 2, reason)
+        run(audit.flush())
+
+    assert len(audit._files()) == 3
+    total = run(audit.chat_summary(-5, 1))
+    assert total == {"delete:link": [2, 2000.0], "delete:keyword": [1, 1000.0]}
+
+
+def test_orphan_file_is_indexed_on_start(audit):
+    audit.record("warn", -5, 2, "flood")
+    run(audit.flush())
+
+    # Jarayon to‘satdan to‘xtadi: indeks yozilmagan, yangi jarayon ochadi
+    restarted = tracing.AuditLog(audit.directory, tracing.AUDIT_MAX_BYTES, 5, 1000)
+    restarted.record("warn", -5, 3, "flood")
+    run(restarted.flush())
+    assert run(restarted.chat_summary(-5, 1)) == {"warn:flood": [2, 0.0]}
+
+
+def test_auditlog_command_reports_counts(audit, app, fake_bot):
+    fake_bot.members[(-5, 7)] = "administrator"
+    audit.record("delete", -5, 2, "classifier", ms=2000.0)
+    audit.record("delete", -5, 3, "link", ms=4000.0)
+    audit.record("warn", -5, 2, "ad")
+
+    msg = make_msg(fake_bot, -5, 7, "/auditlog 6")
+    run(bot.auditlog_cmd(make_update(msg), make_context(app, ["6"])))
+    text = fake_bot.calls[-1][2]
+    assert "O‘chirilgan xabarlar: 2 (o‘rtacha 3.0 s ichida)" in text
+    assert "reklama klassifikatori: 1" in text
+    assert "Ogohlantirishlar: 1" in text
+
+
+def test_log_listener_is_started_by_the_bot_not_on_import():
+    handlers = list(bot.logging.root.handlers)
+    assert bot._log_listener is None
+    assert not any(isinstance(h, bot.logging.handlers.QueueHandler) for h in handlers)
+
+    bot.start_log_listener()
+    try:
+        assert [type(h) for h in bot.logging.root.handlers] == [bot.logging.handlers.QueueHandler]
+    finally:
+        bot.stop_log_listener()
+    assert bot.logging.root.handlers == handlers and bot._log_listener is None
@@ -0,0 +1,83 @@
+import asyncio
+
+import bot
+from conftest import run
+from fakes import make_context, make_msg, make_update
+
+
+def test_handler_moderates_per_chat_with_one_admin_lookup(app, fake_bot):
+    fake_bot.admins[-5] = [1]
+    fake_bot.admins[-6] = []
+
+    async def main():
+        msgs = [
+            make_msg(fake_bot, -5, 1, "admin http://x.com"),
+            make_msg(fake_bot, -5, 2, "t.me/reklama"),
+            make_msg(fake_bot, -5, 3, "salom"),
+            make_msg(fake_bot, -6, 2, "casino bonus"),
+            make_msg(fake_bot, -6, 4, "example.com ga kiring"),
+        ]
+        for m in msgs:
+            await bot.membership_and_adblock_handler(make_update(m), make_context(app))
+        await app.drain()
+        return msgs
+
+    msgs = run(main())
+    deleted = {(c[1], c[2]) for c in fake_bot.calls if c[0] == "delete_message"}
+    assert deleted == {(-5, msgs[1].message_id), (-6, msgs[3].message_id), (-6, msgs[4].message_id)}
+    # Har bir guruh partiyasi uchun adminlar ro‘yxati bir marta olinadi
+    assert sorted(c[1] for c in fake_bot.calls if c[0] == "get_chat_administrators") == [-6, -5]
+
+
+def test_batch_waits_while_updates_are_queued(app, fake_bot, monkeypatch):
+    batches = []
+
+    async def fake_moderate_batch(_bot, msgs):
+        batches.append(list(msgs))
+
+    monkeypatch.setattr(bot, "moderate_batch", fake_moderate_batch)
+
+    async def main():
+        app.update_queue.put_nowait(object())
+        batcher = bot.moderation_batcher.instance()
+        for i in range(3):
+            batcher.add(app, make_msg(fake_bot, -5, i + 1, "salom"))
+        await asyncio.sleep(0)
+        assert batches == [] and len(batcher) == 3
+        await asyncio.sleep(bot.BATCH_MAX_DELAY + 0.05)
+        await app.drain()
+
+    run(main())
+    assert [len(b) for b in batches] == [3]
+
+
+def test_full_batch_flushes_immediately(app, fake_bot, monkeypatch):
+    batches = []
+
+    async def fake_moderate_batch(_bot, msgs):
+        batches.append(list(msgs))
+
+    monkeypatch.setattr(bot, "moderate_batch", fake_moderate_batch)
+    monkeypatch.setattr(bot, "BATCH_MAX_SIZE", 4)
+
+    async def main():
+        app.update_queue.put_nowait(object())
+        batcher = bot.moderation_batcher.instance()
+        for i in range(5):
+            batcher.add(app, make_msg(fake_bot, -5, i + 1, "salom"))
+        assert len(batcher) == 1
+        await asyncio.sleep(bot.BATCH_MAX_DELAY + 0.05)
+        await app.drain()
+
+    run(main())
+    assert [len(b) for b in batches] == [4, 1]
+
+
+def test_private_chats_are_ignored(app, fake_bot):
+    async def main():
+        msg = make_msg(fake_bot, 9, 9, "http://x.com", chat_type="private")
+        await bot.membership_and_adblock_handler(make_update(msg), make_context(app))
+        await app.drain()
+
+    run(main())
+    assert fake_bot.calls == []
@@ -0,0 +1,69 @@
+from telegram import Chat, PhotoSize
+
+import bot
+import moderation
+from storage import SharedCache
+from conftest import run
+from fakes import make_context, make_msg, make_update
+
+PHOTO = [PhotoSize("a", "small", 90, 90), PhotoSize("b", "big", 800, 800)]
+
+
+def test_media_keys_for_photo_and_forward(fake_bot):
+    msg = make_msg(fake_bot, -5, 1, photo=PHOTO, forward_from_chat=Chat(-1009, "channel"))
+    assert moderation.media_keys(msg) == ["file:big", "chat:-1009"]
+    assert moderation.media_keys(make_msg(fake_bot, -5, 1, "salom")) == []
+
+
+def block_via_command(app, fake_bot, user_id, command=bot.blockmedia_cmd):
+    target = make_msg(fake_bot, -5, 2, photo=PHOTO)
+    msg = make_msg(fake_bot, -5, user_id, "/blockmedia", reply_to_message=target)
+    run(command(make_update(msg), make_context(app)))
+    return target
+
+
+def test_group_admin_cannot_block_globally(app, fake_bot):
+    fake_bot.members[(-5, 7)] = "administrator"
+    block_via_command(app, fake_bot, 7)
+
+    assert "file:big" not in moderation.blocked_media
+    assert bot.db.get_blocked_media_since(0, 10) == []
+    assert "delete_message" not in fake_bot.methods()
+
+
+def test_global_admin_blocks_and_unblocks(app, fake_bot, monkeypatch):
+    monkeypatch.setattr(bot, "GLOBAL_ADMINS", [7])
+    target = block_via_command(app, fake_bot, 7)
+
+    assert moderation.is_blocked_media(make_msg(fake_bot, -6, 3, photo=PHOTO))
+    assert bot.db.get_blocked_media_since(0, 10) == ["file:big"]
+    assert ("delete_message", -5, target.message_id) in fake_bot.calls
+
+    block_via_command(app, fake_bot, 7, bot.unblockmedia_cmd)
+    assert not moderation.is_blocked_media(make_msg(fake_bot, -6, 3, photo=PHOTO))
+    assert bot.db.get_blocked_media_since(0, 10) == []
+
+
+def test_unblock_propagates_to_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "shared_cache", SharedCache(str(tmp_path / "shared.db")))
+    monkeypatch.setattr(bot, "_blocked_media_loaded_at", 0)
+    monkeypatch.setattr(bot, "_blocked_media_unblock_seen", None)
+
+    bot.db.add_blocked_media(["file:big"], 7)
+    bot.refresh_blocked_media()
+    assert "file:big" in moderation.blocked_media
+
+    # Boshqa ishchi taqiqni bekor qildi: baza va umumiy kesh kaliti
+    bot.db.remove_blocked_media(["file:big"])
+    bot.shared_cache.set(bot.MEDIA_UNBLOCK_KEY, 123.0, bot.MEDIA_UNBLOCK_TTL)
+    bot.refresh_blocked_media()
+    assert "file:big" not in moderation.blocked_media
+
+
+def test_lru_set_is_bounded():
+    s = moderation.LRUSet(2)
+    s.add("a")
+    s.add("b")
+    assert "a" in s
+    s.add("c")
+    assert "b" not in s and "a" in s and len(s) == 2
@@ -0,0 +1,57 @@
+import bot
+from conftest import run
+from fakes import make_context, make_msg, make_update
+
+
+def test_parse_channel_target_forms():
+    assert bot.parse_channel_target("-1001234") == -1001234
+    assert bot.parse_channel_target(" kanal1 ") == "@kanal1"
+    assert bot.parse_channel_target("@kanal1") == "@kanal1"
+    assert bot.parse_channel_target("https://t.me/kanal1/") == "@kanal1"
+    assert bot.parse_channel_target("t.me/kanal1") == "@kanal1"
+
+
+def test_setchannel_stores_numeric_ids(app, fake_bot):
+    fake_bot.members[(-5, 7)] = "administrator"
+    msg = make_msg(fake_bot, -5, 7, "/setchannel @kanal1")
+    run(bot.setchannel_cmd(make_update(msg), make_context(app, ["@kanal1"])))
+
+    assert bot.db.get_required_channels(-5) == ["-1001"]
+    assert bot.get_channel_targets(-5) == [-1001]
+    info = bot.db.get_channels([-1001])[-1001]
+    assert info["username"] == "kanal1"
+    assert info["invite_link"] == "https://t.me/kanal1"
+
+
+def test_setchannel_rejects_unknown_channel(app, fake_bot):
+    fake_bot.members[(-5, 7)] = "administrator"
+    msg = make_msg(fake_bot, -5, 7, "/setchannel @kanal1, @yoq")
+    run(bot.setchannel_cmd(make_update(msg), make_context(app, ["@kanal1,", "@yoq"])))
+
+    assert bot.db.get_required_channels(-5) == []
+    assert "@yoq" in fake_bot.calls[-1][2]
+
+
+def test_setchannel_requires_admin(app, fake_bot):
+    msg = make_msg(fake_bot, -5, 7, "/setchannel @kanal1")
+    run(bot.setchannel_cmd(make_update(msg), make_context(app, ["@kanal1"])))
+
+    assert bot.db.get_required_channels(-5) == []
+    assert "get_chat" not in fake_bot.methods()
+
+
+def test_refresh_channels_migrates_legacy_usernames(fake_bot):
+    bot.db.set_required_channels(-5, ["@kanal1", "@yoq"])
+    run(bot.refresh_channels(fake_bot))
+
+    # Topilgani raqamli ID ga aylanadi, topilmagani o‘zgarmaydi
+    assert bot.db.get_required_channels(-5) == ["-1001", "@yoq"]
+    assert bot.db.get_channels([-1001])[-1001]["ident"] == "@kanal1"
+
+
+def test_channel_join_url_falls_back_to_username():
+    assert bot.channel_join_url("@kanal1", None) == "https://t.me/kanal1"
+    assert bot.channel_join_url(-1001, None) is None
+    info = {"invite_link": "", "username": "k", "title": "K"}
+    assert bot.channel_join_url(-1001, info) == "https://t.me/k"
+    assert bot.channel_label(-1001, info) == "K (@k)"
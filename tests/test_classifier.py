@@ -0,0 +1,98 @@
+from collections import Counter
+
+import pytest
+
+import bot
+import moderation
+from conftest import run
+from fakes import make_context, make_msg, make_update
+
+np = pytest.importorskip("numpy")
+
+BITS = 12
+ADS = [
+    "Daromad qilishni xohlaysizmi? Kanalga obuna bo‘ling",
+    "Kuniga 100$ daromad, batafsil lichkaga yozing",
+    "Arzon kredit, tez daromad — obuna bo‘ling",
+    "Tez pul ishlash sirlari, obuna bo‘ling",
+]
+CHAT = [
+    "Bugun darsga kelasizmi?",
+    "Ertaga soat nechada uchrashamiz",
+    "Rahmat, hammasi tushunarli bo‘ldi",
+    "Uy vazifasini kim bajardi?",
+]
+
+
+def reference_ngrams(text: str, bits: int) -> Counter:
+    """Oddiy Python’dagi FNV-1a — vektorlashtirilgan variant bilan solishtirish uchun."""
+    s = " " + moderation.normalize_text(text) + " "
+    result = Counter()
+    for n in moderation.CLASSIFIER_NGRAMS:
+        for i in range(len(s) - n + 1):
+            h = moderation.FNV_BASIS
+            for ch in s[i:i + n]:
+                h = ((h ^ ord(ch)) * moderation.FNV_PRIME) & 0xFFFFFFFF
+            result[h >> (32 - bits)] += 1
+    return result
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    train_classifier = pytest.importorskip("train_classifier")
+    weights, _ = train_classifier.train([(t, 1) for t in ADS] + [(t, 0) for t in CHAT], BITS, 1.0)
+    path = str(tmp_path / "model.npy")
+    np.save(path, weights)
+    clf = moderation.AdClassifier()
+    assert clf.load(path)
+    monkeypatch.setattr(moderation, "ad_classifier", clf)
+    return clf
+
+
+def test_vectorized_hashing_matches_reference():
+    texts = ["Salom", "Obuna bo‘ling 🔥", "", "a"]
+    idx, seg = moderation.hashed_ngrams(texts, BITS)
+    for i, text in enumerate(texts):
+        assert Counter(idx[seg == i].tolist()) == reference_ngrams(text, BITS)
+
+
+def test_trained_model_separates_classes(model):
+    assert model.bits == BITS
+    scores = model.score_many(["Tez daromad, obuna bo‘ling", "Darsga ertaga kelasizmi?"])
+    assert scores[0] > 0.5 > scores[1]
+    assert scores == [model.score("Tez daromad, obuna bo‘ling"), model.score("Darsga ertaga kelasizmi?")]
+
+
+def test_invalid_model_files_are_rejected(tmp_path):
+    clf = moderation.AdClassifier()
+    assert not clf.load(str(tmp_path / "yoq.npy"))
+    path = str(tmp_path / "bad.npy")
+    np.save(path, np.zeros(1000, dtype=np.float32))  # 2**k + 1 emas
+    assert not clf.load(path)
+    assert not clf.loaded
+
+
+def test_filter_uses_group_threshold(model, fake_bot):
+    bot.db.set_classifier_threshold(-5, 0.5)
+    fake_bot.admins[-5] = []
+    pipeline = moderation.FilterPipeline([moderation.ClassifierFilter()], bot.pipeline_admin_ids)
+    msgs = [make_msg(fake_bot, -5, 2, "Tez daromad, obuna bo‘ling"), make_msg(fake_bot, -5, 3, "Darsga kelasizmi?")]
+    verdicts = run(pipeline.run(fake_bot, msgs[0].chat, bot.load_group_settings(-5), msgs))
+    assert [(m.from_user.id, v.reason) for m, v in verdicts] == [(2, "classifier")]
+    assert 0.5 <= verdicts[0][1].detail <= 1.0
+
+    bot.db.set_classifier_threshold(-5, 0.0)
+    assert not pipeline.by_name["classifier"].enabled(bot.load_group_settings(-5))
+
+
+def test_filter_is_off_without_model():
+    bot.db.set_classifier_threshold(-5, 0.5)
+    assert not moderation.ClassifierFilter().enabled(bot.load_group_settings(-5))
+
+
+def test_setadthreshold_validates_input(app, fake_bot):
+    fake_bot.members[(-5, 7)] = "administrator"
+    for arg, expected in (("0.9", 0.9), ("x", 0.9), ("1.5", 0.9), ("off", 0.0)):
+        msg = make_msg(fake_bot, -5, 7, "/setadthreshold " + arg)
+        run(bot.setadthreshold_cmd(make_update(msg), make_context(app, [arg])))
+        assert bot.load_group_settings(-5)["classifier_threshold"] == expected
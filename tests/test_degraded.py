@@ -0,0 +1,119 @@
+import asyncio
+
+import bot
+from conftest import run
+from fakes import make_msg
+
+
+def moderate(fake_bot, msgs):
+    run(bot.moderate_chat_batch(fake_bot, msgs[0].chat, msgs))
+    # Tarmoq so‘rovlari (fonda olinadigan adminlar ham) — alohida tekshiriladi
+    return [c for c in fake_bot.calls if c[0] not in ("get_chat_member", "get_chat_administrators")]
+
+
+def test_monitor_switches_on_backlog_and_recovers(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bot.time, "monotonic", lambda: now[0])
+    m = bot.LoadMonitor()
+
+    assert m.update(10, 0.0) is None
+    assert m.update(bot.DEGRADED_QUEUE_DEPTH, 0.0) is True
+    assert m.update(0, 0.0) is None
+    now[0] += bot.DEGRADED_RECOVER_AFTER / 2
+    assert m.update(bot.DEGRADED_QUEUE_DEPTH, 0.0) is None  # tinchlik uzildi
+    assert m.update(0, 0.0) is None
+    now[0] += bot.DEGRADED_RECOVER_AFTER
+    assert m.update(0, 0.0) is False
+    assert m.switches == 2 and m.mode == 0
+
+
+def test_degraded_fail_open_keeps_local_verdicts_without_admin_list(fake_bot):
+    bot.load_monitor.instance().degraded = True
+    bot.db.set_membership_fail_open(-5, True)
+    bot.db.set_required_channels(-5, ["-1001"])
+    bot.membership_cache.set((-1001, 3), False)
+    msgs = [make_msg(fake_bot, -5, 2, "t.me/reklama"), make_msg(fake_bot, -5, 3, "salom")]
+    # Havola ogohlantirishsiz o‘chiriladi, a’zolik bosqichi o‘tkazib yuboriladi
+    assert moderate(fake_bot, msgs) == [("delete_message", -5, msgs[0].message_id)]
+
+
+def test_degraded_admin_miss_warms_cache_in_background(fake_bot):
+    bot.load_monitor.instance().degraded = True
+    fake_bot.admins[-5] = [1]
+
+    msg = make_msg(fake_bot, -5, 2, "t.me/reklama")
+
+    async def main():
+        await bot.moderate_chat_batch(fake_bot, msg.chat, [msg])
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+    run(main())
+    assert fake_bot.methods().count("get_chat_administrators") == 1
+    assert bot.admin_cache.get(-5) == frozenset({1})
+    assert bot.load_monitor._warming == {}
+
+
+def test_admin_warming_is_bounded(fake_bot, monkeypatch):
+    monkeypatch.setattr(bot, "DEGRADED_ADMIN_WARM", 2)
+    monitor = bot.LoadMonitor()
+
+    async def main():
+        for chat_id in (-5, -5, -6, -7):
+            monitor.warm_admins(fake_bot, chat_id)
+        assert sorted(monitor._warming) == [-6, -5]
+        await asyncio.sleep(0)
+
+    run(main())
+    assert sorted(c[1] for c in fake_bot.calls) == [-6, -5]
+
+
+def test_degraded_fail_closed_deletes_silently(fake_bot):
+    bot.load_monitor.instance().degraded = True
+    bot.db.set_membership_fail_open(-5, False)
+    msg = make_msg(fake_bot, -5, 2, "t.me/reklama")
+    assert moderate(fake_bot, [msg]) == [("delete_message", -5, msg.message_id)]
+
+
+def test_degraded_uses_cached_admins(fake_bot):
+    bot.load_monitor.instance().degraded = True
+    bot.admin_cache.set(-5, frozenset({1}))
+    msgs = [make_msg(fake_bot, -5, 1, "t.me/admin"), make_msg(fake_bot, -5, 2, "t.me/reklama")]
+    assert moderate(fake_bot, msgs) == [("delete_message", -5, msgs[1].message_id)]
+
+
+def test_degraded_defers_unknown_membership(fake_bot):
+    bot.db.set_required_channels(-5, ["-1001"])
+    bot.admin_cache.set(-5, frozenset())
+    bot.load_monitor.instance().degraded = True
+    assert moderate(fake_bot, [make_msg(fake_bot, -5, 2, "salom")]) == []
+    assert "get_chat_member" not in fake_bot.methods()
+
+    bot.load_monitor.instance().degraded = False
+    run(bot.load_monitor.resolve_deferred(fake_bot))
+    assert ("get_chat_member", -1001, 2) in fake_bot.calls
+    assert bot.get_not_member_channels_from_cache(2, [-1001]) == [-1001]
+    # A’zo emas — odatdagi ogohlantirish va qayta tekshiruv navbati
+    assert fake_bot.methods().count("send_message") == 1
+    assert len(bot.db.get_join_messages(2, -5)) == 1
+    assert [r[:2] for r in bot.db.get_due_rechecks(int(bot.time.time()) + 10**6, 10)] == [(2, -5)]
+
+
+def test_resolved_member_is_not_warned(fake_bot):
+    bot.db.set_required_channels(-5, ["-1001"])
+    fake_bot.members[(-1001, 2)] = "member"
+    msg = make_msg(fake_bot, -5, 2, "salom")
+    bot.load_monitor.defer_membership(msg.from_user, msg.chat)
+    run(bot.load_monitor.resolve_deferred(fake_bot))
+    assert "send_message" not in fake_bot.methods()
+    assert bot.db.get_join_messages(2, -5) == []
+
+
+def test_degraded_unknown_membership_follows_fail_policy(fake_bot):
+    bot.db.set_required_channels(-5, ["-1001"])
+    bot.db.set_membership_fail_open(-5, False)
+    bot.admin_cache.set(-5, frozenset())
+    bot.load_monitor.instance().degraded = True
+    msg = make_msg(fake_bot, -5, 2, "salom")
+    assert moderate(fake_bot, [msg]) == [("delete_message", -5, msg.message_id)]
+    assert list(bot.load_monitor._deferred) == [(2, -5)]
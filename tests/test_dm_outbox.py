@@ -0,0 +1,89 @@
+import pytest
+from telegram import Chat
+from telegram.error import Forbidden, NetworkError
+
+import bot
+from storage import SharedCache
+from conftest import run
+
+BUTTONS = [("Kanalga qo‘shilish", "https://t.me/kanal1")]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bot.time, "monotonic", lambda: now[0])
+    return now
+
+
+def deliver(outbox, fake_bot):
+    for user_id, groups in outbox.take_due():
+        run(outbox.send(fake_bot, user_id, groups))
+
+
+def test_groups_are_merged_into_one_dm(fake_bot, clock):
+    outbox = bot.DMOutbox()
+    outbox.enqueue(2, Chat(-5, "supergroup", title="Birinchi"), BUTTONS)
+    outbox.enqueue(2, Chat(-6, "supergroup", title="Ikkinchi"), BUTTONS)
+    assert outbox.take_due() == []
+
+    clock[0] += bot.DM_OUTBOX_DELAY
+    deliver(outbox, fake_bot)
+    sent = [c for c in fake_bot.calls if c[0] == "send_message"]
+    assert len(sent) == 1 and sent[0][1] == 2
+    assert "Birinchi" in sent[0][2] and "Ikkinchi" in sent[0][2]
+    assert sorted(bot.db.get_pending_groups_for_user(2)) == [-6, -5]
+
+
+def test_one_dm_per_window(fake_bot, clock):
+    outbox = bot.DMOutbox()
+    outbox.enqueue(2, Chat(-5, "supergroup", title="G"), BUTTONS)
+    clock[0] += bot.DM_OUTBOX_DELAY
+    deliver(outbox, fake_bot)
+
+    outbox.enqueue(2, Chat(-6, "supergroup", title="G2"), BUTTONS)
+    clock[0] += bot.DM_OUTBOX_WINDOW / 2
+    assert outbox.take_due() == []
+    clock[0] += bot.DM_OUTBOX_WINDOW / 2
+    deliver(outbox, fake_bot)
+    assert fake_bot.methods().count("send_message") == 2
+
+
+def test_unreachable_user_is_skipped(fake_bot, clock):
+    fake_bot.send_errors[2] = Forbidden("bot was blocked by the user")
+    outbox = bot.DMOutbox()
+    outbox.enqueue(2, Chat(-5, "supergroup", title="G"), BUTTONS)
+    clock[0] += bot.DM_OUTBOX_DELAY
+    deliver(outbox, fake_bot)
+
+    outbox.enqueue(2, Chat(-6, "supergroup", title="G2"), BUTTONS)
+    assert len(outbox) == 0 and outbox.skipped == 1
+
+
+def test_workers_share_claim_and_unreachable_list(fake_bot, clock, tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "shared_cache", SharedCache(str(tmp_path / "shared.db")))
+    first, second = bot.DMOutbox(), bot.DMOutbox()
+    first.enqueue(2, Chat(-5, "supergroup", title="G"), BUTTONS)
+    second.enqueue(2, Chat(-6, "supergroup", title="G2"), BUTTONS)
+    clock[0] += bot.DM_OUTBOX_DELAY
+
+    deliver(first, fake_bot)
+    assert second.take_due() == []
+    assert len(second) == 1
+    assert fake_bot.methods().count("send_message") == 1
+
+    second.unreachable.set(3, True)
+    first.enqueue(3, Chat(-5, "supergroup", title="G"), BUTTONS)
+    assert first.skipped == 1
+
+
+def test_retryable_failure_releases_claim(fake_bot, clock, tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "shared_cache", SharedCache(str(tmp_path / "shared.db")))
+    fake_bot.send_errors[2] = NetworkError("timeout")
+    first, second = bot.DMOutbox(), bot.DMOutbox()
+    first.enqueue(2, Chat(-5, "supergroup", title="G"), BUTTONS)
+    second.enqueue(2, Chat(-6, "supergroup", title="G2"), BUTTONS)
+    clock[0] += bot.DM_OUTBOX_DELAY
+
+    deliver(first, fake_bot)
+    assert [uid for uid, _ in second.take_due()] == [2]
@@ -0,0 +1,41 @@
+import bot
+import moderation
+
+
+def test_flood_after_max_messages_in_window():
+    d = moderation.FloodDetector()
+    now = 1000.0
+    for i in range(moderation.FLOOD_MAX_MESSAGES):
+        assert not d.hit(-5, 1, now + i * 0.1)
+    assert d.hit(-5, 1, now + 1.0)
+    # Boshqa foydalanuvchi va boshqa guruh alohida hisoblanadi
+    assert not d.hit(-5, 2, now + 1.0)
+    assert not d.hit(-6, 1, now + 1.0)
+
+
+def test_slow_sender_is_never_flagged():
+    d = moderation.FloodDetector()
+    step = moderation.FLOOD_WINDOW / (moderation.FLOOD_MAX_MESSAGES - 1) + 0.01
+    assert not any(d.hit(-5, 1, 1000.0 + i * step) for i in range(50))
+
+
+def test_penalty_lasts_and_warns_once():
+    d = moderation.FloodDetector()
+    now = 1000.0
+    for i in range(moderation.FLOOD_MAX_MESSAGES + 1):
+        d.hit(-5, 1, now)
+    assert d.take_warning(-5, 1)
+    assert not d.take_warning(-5, 1)
+
+    # Jarima davomida sekin yozsa ham o‘chiriladi
+    assert d.hit(-5, 1, now + moderation.FLOOD_PENALTY - 1)
+    assert not d.hit(-5, 1, now + moderation.FLOOD_PENALTY + moderation.FLOOD_WINDOW * 10)
+
+
+def test_sweep_evicts_idle_users_only():
+    d = moderation.FloodDetector()
+    d.hit(-5, 1, 1000.0)
+    d.hit(-5, 2, 1000.0 + moderation.FLOOD_IDLE_EVICT)
+    assert d.sweep(1000.0 + moderation.FLOOD_IDLE_EVICT + 1) == 1
+    assert len(d) == 1
+    assert not d.take_warning(-5, 1)
@@ -0,0 +1,79 @@
+import bot
+from storage import MemoryStorage
+from conftest import run
+from fakes import make_context, make_msg, make_update
+
+
+class BrokenStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.fail = True
+
+    def add_group_stats(self, rows):
+        if self.fail:
+            raise OSError("disk to‘la")
+        super().add_group_stats(rows)
+
+
+def test_moderation_updates_counters(fake_bot):
+    fake_bot.admins[-5] = []
+    msgs = [make_msg(fake_bot, -5, 2, "t.me/reklama"), make_msg(fake_bot, -5, 3, "salom")]
+    run(bot.moderate_chat_batch(fake_bot, msgs[0].chat, msgs))
+
+    c = bot.group_stats.recent(-5)
+    assert c["messages"] == 2
+    assert c["deleted:link"] == 1
+    assert c["warnings"] == 1
+    assert c["cache_misses"] == 1
+
+
+def test_flush_persists_hourly_rows(storage):
+    stats = bot.GroupStats()
+    stats.incr("messages", 3, chat_id=-5)
+    stats.incr("api_calls", 5, chat_id=-5)
+    stats.incr("api_calls", 9, chat_id=-6)
+    stats.flush()
+    stats.incr("messages", 1, chat_id=-5)
+
+    hour = int(bot.time.time() // 3600)
+    assert storage.get_group_stats(-5, hour) == {"messages": 3, "api_calls": 5}
+    # Hali yozilmaganlari ham 24 soatlik jami ichida
+    assert stats.hours(-5, 24) == {"messages": 4, "api_calls": 5}
+    assert storage.get_top_groups("api_calls", hour, 1) == [(-6, 9)]
+
+
+def test_failed_flush_keeps_counters(monkeypatch):
+    broken = BrokenStorage()
+    monkeypatch.setattr(bot, "db", broken)
+    stats = bot.GroupStats()
+    stats.incr("messages", 2, chat_id=-5)
+    stats.flush()
+    assert stats._pending
+
+    broken.fail = False
+    stats.flush()
+    assert stats._pending == {}
+    assert broken.get_group_stats(-5, 0) == {"messages": 2}
+
+
+def test_stats_command_labels_classifier(app, fake_bot):
+    fake_bot.members[(-5, 7)] = "administrator"
+    bot.group_stats.incr("messages", 4, chat_id=-5)
+    bot.group_stats.incr("deleted:classifier", 1, chat_id=-5)
+
+    msg = make_msg(fake_bot, -5, 7, "/stats")
+    run(bot.stats_cmd(make_update(msg), make_context(app)))
+    text = fake_bot.calls[-1][2]
+    assert "Xabarlar: 4" in text
+    assert "reklama klassifikatori: 1" in text
+
+
+def test_top_groups_only_for_global_admins(app, fake_bot, monkeypatch):
+    bot.group_stats.incr("api_calls", 7, chat_id=-5)
+    msg = make_msg(fake_bot, 7, 7, "/stats", chat_type="private")
+    run(bot.stats_cmd(make_update(msg), make_context(app)))
+    assert "global" in fake_bot.calls[-1][2]
+
+    monkeypatch.setattr(bot, "GLOBAL_ADMINS", [7])
+    run(bot.stats_cmd(make_update(msg), make_context(app)))
+    assert "1. -5: 7" in fake_bot.calls[-1][2]
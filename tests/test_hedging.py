@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+import bot
+from conftest import run
+
+
+class Calls:
+    """Har bir chaqiruv uchun navbatdagi (kechikish, natija) juftligi."""
+
+    def __init__(self, *plan):
+        self.plan = list(plan)
+        self.started = []
+        self.cancelled = []
+
+    async def __call__(self):
+        n = len(self.started)
+        delay, result = self.plan[n]
+        self.started.append(n)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(n)
+            raise
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@pytest.fixture(autouse=True)
+def fresh_latency(monkeypatch):
+    monkeypatch.setattr(bot, "membership_latency", bot.LatencyTracker())
+
+
+def test_fast_answer_is_not_hedged():
+    calls = Calls((0.01, "a"), (0.0, "b"))
+    assert run(bot._hedged(calls, 0.1)) == "a"
+    assert calls.started == [0]
+
+
+def test_slow_answer_is_hedged_and_loser_cancelled():
+    calls = Calls((1.0, "slow"), (0.01, "fast"))
+    assert run(bot._hedged(calls, 0.05)) == "fast"
+    assert calls.started == [0, 1]
+    assert calls.cancelled == [0]
+    assert bot.membership_latency.hedged == 1
+
+
+def test_failed_request_falls_back_to_other():
+    calls = Calls((0.1, RuntimeError("x")), (0.2, "ok"))
+    assert run(bot._hedged(calls, 0.05)) == "ok"
+
+
+def test_both_failing_raises():
+    calls = Calls((0.1, RuntimeError("first")), (0.1, RuntimeError("second")))
+    with pytest.raises(RuntimeError, match="first"):
+        run(bot._hedged(calls, 0.05))
+
+
+def test_deadline_before_hedge_cancels_first_request():
+    calls = Calls((1.0, "a"), (1.0, "b"))
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(bot._hedged(calls, 0.5), timeout=0.05)
+        await asyncio.sleep(0)
+        # Muddat tugagan zahoti — run() qolgan vazifalarni bekor qilishidan oldin
+        assert calls.cancelled == [0]
+
+    run(main())
+    assert calls.started == [0]
+
+
+def test_deadline_after_hedge_cancels_every_request():
+    calls = Calls((1.0, "a"), (1.0, "b"))
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(bot._hedged(calls, 0.05), timeout=0.1)
+        await asyncio.sleep(0)
+        assert sorted(calls.cancelled) == [0, 1]
+
+    run(main())
+
+
+def test_membership_deadline_respects_fail_policy(fake_bot, monkeypatch):
+    monkeypatch.setattr(bot, "MEMBERSHIP_DEADLINE", 0.05)
+    fake_bot.member_delay = 0.5
+    fake_bot.members[(-1001, 2)] = "member"
+
+    assert run(bot.user_is_member_of_channel(fake_bot, 2, -1001)) is None
+    assert bot.membership_latency.timeouts == 1
+    assert run(bot.get_not_member_channels(fake_bot, 2, [-1001], fail_open=True)) == []
+    assert run(bot.get_not_member_channels(fake_bot, 2, [-1001], fail_open=False)) == [-1001]
+    # Noma’lum natija keshlanmaydi
+    assert bot.membership_cache.get((-1001, 2)) is None
+
+
+def test_p95_tracks_recent_samples():
+    tracker = bot.LatencyTracker()
+    for _ in range(19):
+        tracker.add(0.01)
+    assert tracker.p95 is None
+    tracker.add(1.0)
+    assert tracker.p95 == 0.01
+    for _ in range(32):
+        tracker.add(1.0)
+    assert tracker.p95 == 1.0
@@ -0,0 +1,55 @@
+from telegram.request import HTTPXRequest
+
+import bot
+from conftest import run
+
+
+def capture_timeouts(monkeypatch):
+    seen = []
+
+    async def fake_do_request(self, url, method, request_data=None, read_timeout=None, **kwargs):
+        seen.append((url.rsplit("/", 1)[-1], read_timeout))
+        return 200, b'{"ok": true, "result": true}'
+
+    monkeypatch.setattr(HTTPXRequest, "do_request", fake_do_request)
+    return seen
+
+
+def test_pool_limits_follow_settings():
+    limits = bot.build_api_request()._client_kwargs["limits"]
+    assert limits.max_connections == bot.API_POOL_SIZE
+    assert limits.max_keepalive_connections == bot.API_KEEPALIVE
+    assert limits.keepalive_expiry == bot.API_KEEPALIVE_EXPIRY
+
+    updates = bot.build_get_updates_request()._client_kwargs["limits"]
+    assert updates.max_connections == bot.GET_UPDATES_POOL_SIZE
+
+
+def test_method_timeout_applies_only_when_not_given(monkeypatch):
+    seen = capture_timeouts(monkeypatch)
+    request = bot.build_api_request()
+    base = "https://api.telegram.org/bot1:a/"
+
+    async def main():
+        await request.do_request(base + "getChatMember", "POST")
+        await request.do_request(base + "getChatMember", "POST", read_timeout=1.5)
+        await request.do_request(base + "getMe", "POST")
+
+    run(main())
+    assert seen[0] == ("getChatMember", bot.API_METHOD_TIMEOUTS["getChatMember"])
+    assert seen[1] == ("getChatMember", 1.5)
+    # Ro‘yxatda yo‘q metod — umumiy timeout (DEFAULT_NONE)
+    assert seen[2][1] is HTTPXRequest.DEFAULT_NONE
+
+
+def test_api_calls_are_counted(monkeypatch):
+    capture_timeouts(monkeypatch)
+    request = bot.build_api_request()
+
+    async def main():
+        bot.current_group.set(-5)
+        await request.do_request("https://api.telegram.org/bot1:a/sendMessage", "POST")
+        await request.do_request("https://api.telegram.org/bot1:a/deleteMessage", "POST")
+
+    run(main())
+    assert bot.group_stats.recent(-5) == {"api_calls": 2}
@@ -0,0 +1,117 @@
+import argparse
+import gzip
+import os
+import re
+import tempfile
+
+import pytest
+
+import bot
+import sharding
+import tracing
+from conftest import run
+from fakes import FakeBot, make_msg, make_update
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return tracing.UpdateJournal(str(tmp_path / "journal"), tracing.JOURNAL_MAX_BYTES, 3, 100)
+
+
+def test_updates_and_api_calls_round_trip(journal):
+    fake = FakeBot()
+    update = make_update(make_msg(fake, -5, 2, "salom"))
+    journal.record_update(update)
+    journal.record_api("deleteMessage", 0.0412, 200)
+    journal.record_api("getUpdates", 10.0, 200)
+    journal.record_api("sendMessage", 1.0, None)
+    run(journal.flush())
+
+    entries = list(tracing.read_journal(journal._files()))
+    assert len(entries) == 3
+    assert entries[0]["u"]["message"]["text"] == "salom"
+    assert "b" not in entries[0]
+    assert entries[1] == {"t": entries[1]["t"], "api": "deleteMessage", "ms": 41.2, "code": 200}
+    assert entries[2]["code"] is None
+
+
+def test_extra_bot_updates_are_tagged(journal):
+    fake = FakeBot()
+
+    async def main():
+        sharding.current_bot.set(777)
+        journal.record_update(make_update(make_msg(fake, -5, 2, "salom")))
+        await journal.flush()
+
+    run(main())
+    assert [e["b"] for e in tracing.read_journal(journal._files())] == [777]
+
+
+def test_broken_lines_and_truncated_tail_are_skipped(journal):
+    journal.record_api("deleteMessage", 0.01, 200)
+    run(journal.flush())
+    path = journal._files()[0]
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        f.write("{buzilgan\n")
+    with open(path, "ab") as f:
+        f.write(gzip.compress(b'{"api": "x"}\n')[:-8])
+
+    assert [e["api"] for e in tracing.read_journal([path])] == ["deleteMessage", "x"]
+
+
+def test_rotation_keeps_newest_files(journal, monkeypatch):
+    journal.max_bytes = 1
+    for i in range(5):
+        monkeypatch.setattr(bot.time, "time", lambda i=i: 1_700_000_000 + i)
+        journal.record_api(f"m{i}", 0.01, 200)
+        run(journal.flush())
+    files = journal._files()
+    assert len(files) == 3
+    assert [e["api"] for e in tracing.read_journal(files)] == ["m2", "m3", "m4"]
+
+
+def test_rotation_within_one_millisecond_opens_new_file(journal, monkeypatch):
+    journal.max_bytes = 1
+    monkeypatch.setattr(bot.time, "time", lambda: 1_700_000_000.0)
+    for i in range(3):
+        journal.record_api(f"m{i}", 0.01, 200)
+        run(journal.flush())
+    files = journal._files()
+    assert len(files) == 3
+    assert [e["api"] for e in tracing.read_journal(files)] == ["m0", "m1", "m2"]
+
+
+def test_buffer_overflow_is_counted(journal):
+    journal.buffer_max = 2
+    for _ in range(5):
+        journal.record_api("deleteMessage", 0.01, 200)
+    assert len(journal._buf) == 2 and journal.dropped == 3
+
+
+def test_replay_moderates_recorded_updates(tmp_path, monkeypatch, capsys):
+    tempdir = tmp_path / "tmp"
+    tempdir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(tempdir))
+    replay = pytest.importorskip("replay")
+    # replay moderate_batch ni almashtiradi va db ni ochadi — test oxirida tiklanadi
+    monkeypatch.setattr(bot, "moderate_batch", bot.moderate_batch)
+    monkeypatch.setattr(bot, "db", bot.db)
+
+    journal = tracing.UpdateJournal(str(tmp_path / "journal"), tracing.JOURNAL_MAX_BYTES, 3, 100)
+    fake = FakeBot()
+    for text in ("salom", "t.me/reklama", "qalaysiz"):
+        journal.record_update(make_update(make_msg(fake, -5, 2, text)))
+    journal.record_api("deleteMessage", 0.001, 200)
+    run(journal.flush())
+
+    args = argparse.Namespace(
+        journal=[journal.directory], db=str(tmp_path / "settings.db"), speed=0.0,
+        latency=None, member_status="member", drain_timeout=5.0,
+    )
+    run(replay.replay(args))
+    out = capsys.readouterr().out
+
+    assert re.search(r"Yangilanishlar:\s+3 ta \(xabarlar 3\), tugallanmagan 0", out)
+    assert re.search(r"deleteMessage\s+1\s+jurnalda\s+1", out)
+    # Sozlamalar nusxasi (-wal/-shm bilan) o‘chirilgan
+    assert os.listdir(tempdir) == []
@@ -0,0 +1,110 @@
+"""Bir jarayonda bir nechta bot: saqlash bo‘limlari va PerBot nusxalari."""
+
+import contextvars
+
+import pytest
+
+import bot
+import moderation
+import sharding
+from storage import DEFAULT_BANNED_KEYWORDS, LazyStorage, MemoryStorage
+
+EXTRA = 777
+
+
+def as_bot(bot_id, fn, *args):
+    """fn ni current_bot = bot_id kontekstida bajaradi (handler/job kabi).
+
+    Atributlar (bot.db.x, moderation.flood_detector.x) shu kontekstda olinishi
+    kerak — shuning uchun murakkab chaqiruvlar lambda bilan beriladi.
+    """
+    def call():
+        sharding.current_bot.set(bot_id)
+        return fn(*args)
+    return contextvars.copy_context().run(call)
+
+
+def test_token_bot_id():
+    assert sharding.token_bot_id("123456:abc:def") == 123456
+
+
+def test_partitions_are_isolated(storage):
+    part = storage.partition(EXTRA)
+    storage.set_required_channels(-5, ["@asosiy"])
+    part.set_required_channels(-5, ["@qoshimcha"])
+    part.ensure_group(-6)
+
+    assert storage.get_required_channels(-5) == ["@asosiy"]
+    assert part.get_required_channels(-5) == ["@qoshimcha"]
+    assert storage.get_group_ids() == [-5]
+    assert sorted(part.get_group_ids()) == [-6, -5]
+
+    storage.save_join_message(2, -5, -5, 100)
+    assert part.get_join_messages(2, -5) == []
+    assert part.get_pending_user_ids() == []
+    part.save_join_message(3, -5, -5, 200)
+    assert storage.get_pending_user_ids() == [2]
+    assert part.get_pending_user_ids() == [3]
+
+    storage.add_group_stats([(-5, 10, "deleted", 4)])
+    part.add_group_stats([(-5, 10, "deleted", 1)])
+    assert storage.get_group_stats(-5, 0) == {"deleted": 4}
+    assert part.get_group_stats(-5, 0) == {"deleted": 1}
+
+
+def test_blocked_media_is_shared(storage):
+    part = storage.partition(EXTRA)
+    part.add_blocked_media(["sticker:abc"], 7)
+    assert storage.get_blocked_media_since(0, 10) == ["sticker:abc"]
+    storage.remove_blocked_media(["sticker:abc"])
+    assert part.get_blocked_media_since(0, 10) == []
+
+
+def test_lazy_storage_routes_by_current_bot(monkeypatch):
+    opened = []
+
+    def factory():
+        opened.append(1)
+        return MemoryStorage()
+
+    lazy = LazyStorage(factory)
+    assert opened == []  # import/yaratishda ochilmaydi
+    monkeypatch.setattr(bot, "db", lazy)
+
+    bot.db.set_banned_keywords(-5, ["asosiy"])
+    as_bot(EXTRA, lambda: bot.db.set_banned_keywords(-5, ["qoshimcha"]))
+
+    assert bot.load_group_settings(-5)["banned_keywords_list"] == ["asosiy"]
+    assert as_bot(EXTRA, bot.load_group_settings, -5)["banned_keywords_list"] == ["qoshimcha"]
+    assert as_bot(EXTRA + 1, bot.load_group_settings, -5)["banned_keywords_list"] == DEFAULT_BANNED_KEYWORDS
+    assert opened == [1]  # bitta dvigatel, bo‘limlar uning ko‘rinishlari
+
+
+@pytest.mark.parametrize("singleton", ["flood_detector", "moderation_batcher", "dm_outbox",
+                                       "load_monitor", "group_stats", "recheck_scheduler"])
+def test_per_bot_instances(singleton):
+    per_bot = getattr(bot, singleton)
+    main = per_bot.instance()
+    extra = as_bot(EXTRA, per_bot.instance)
+    assert main is not extra
+    assert per_bot.instance() is main
+    assert as_bot(EXTRA, per_bot.instance) is extra
+
+
+def test_flood_counters_do_not_mix():
+    now = bot.time.monotonic()
+    for _ in range(moderation.FLOOD_MAX_MESSAGES):
+        assert not moderation.flood_detector.hit(-5, 2, now)
+    assert moderation.flood_detector.hit(-5, 2, now)
+    assert not as_bot(EXTRA, lambda: moderation.flood_detector.hit(-5, 2, now))
+
+
+def test_group_stats_flush_into_own_partition(monkeypatch):
+    monkeypatch.setattr(bot, "db", LazyStorage(MemoryStorage))
+    bot.group_stats.incr("deleted", 3, chat_id=-5)
+    as_bot(EXTRA, lambda: bot.group_stats.incr("deleted", 1, chat_id=-5))
+    bot.group_stats.flush()
+    as_bot(EXTRA, lambda: bot.group_stats.flush())
+
+    assert bot.db.get_group_stats(-5, 0) == {"deleted": 3}
+    assert as_bot(EXTRA, lambda: bot.db.get_group_stats(-5, 0)) == {"deleted": 1}
@@ -0,0 +1,68 @@
+import pytest
+
+import bot
+import moderation
+
+# Oddiy suhbat — havola emas
+FALSE_POSITIVES = [
+    "Kecha keldim. Online dars bo‘ladimi?",
+    "Zo‘r. Pro darajada",
+    "Salom. Info kerak",
+    "Men bugun keldim. Uz tilida yozing",
+    "Привет.Как дела",
+    "Ура.Ок",
+    "Narxi 12.50 so‘m",
+    "Soat 9.30 da (taxminan) boramiz",
+]
+
+OBFUSCATED_LINKS = [
+    ("t . me / kanal", "t.me/kanal"),
+    ("t[.]me/kanal", "t.me/kanal"),
+    ("t dot me/kanal", "t.me/kanal"),
+    ("ｔ.ｍｅ/kanal", "t.me/kanal"),
+    ("t​.me/kanal", "t.me/kanal"),
+    ("kazino [.] com ga kiring", "kazino.com"),
+    ("kazino dot com ga kiring", "kazino.com"),
+    ("kazino nuqta uz", "kazino.uz"),
+    ("Batafsil: https://example.com/x?a=1", "https://example.com/x?a=1"),
+    ("www.example.org", "www.example.org"),
+]
+
+
+@pytest.mark.parametrize("text", FALSE_POSITIVES)
+def test_plain_sentences_are_not_links(text):
+    assert not moderation.contains_url(text)
+    assert not moderation.contains_tme_link(text)
+    assert moderation.find_link(text) is None
+
+
+@pytest.mark.parametrize("text,link", OBFUSCATED_LINKS)
+def test_obfuscated_links_are_found(text, link):
+    assert moderation.contains_url(text)
+    assert moderation.find_link(text) == link
+
+
+def test_homoglyphs_and_invisible_characters():
+    assert moderation.normalize_text("саsіno") == "casino"
+    assert moderation.normalize_text("ka​zi­no") == "kazino"
+    assert moderation.normalize_text("𝐤𝐚𝐳𝐢𝐧𝐨") == "kazino"
+    assert moderation.normalize_text("  Ko‘p   bo‘shliq\n\tbor ") == "ko‘p bo‘shliq bor"
+    # Havola matnida kirill harflari o‘zgarmaydi
+    assert moderation.normalize_link_text("Ура.Ок") == "ура.ок"
+
+
+def test_keywords_match_after_normalization():
+    assert moderation.contains_banned_keyword("Bu yerda CАSІNO bor", ["casino"]) == "casino"  # А, І — kirill
+    assert moderation.contains_banned_keyword("ka​zino", ["kazino"]) == "kazino"
+    assert moderation.contains_banned_keyword("реклама беру", ["реклама"]) == "реклама"
+    assert moderation.contains_banned_keyword("salom", ["kazino"]) is None
+
+
+def test_link_detail_is_bounded():
+    text = "https://example.com/" + "a" * 1000
+    assert len(moderation.find_link(text)) <= moderation.LINK_DETAIL_MAX
+
+
+def test_bench_false_positive_list_is_covered():
+    bench = pytest.importorskip("bench_normalize")
+    assert set(bench.FALSE_POSITIVES) <= set(FALSE_POSITIVES)
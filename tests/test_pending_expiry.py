@@ -0,0 +1,57 @@
+import types
+
+from telegram import ChatMember
+
+import bot
+from storage import DB
+from conftest import run
+
+
+def deleted(fake_bot):
+    return sorted((c[1], c[2]) for c in fake_bot.calls if c[0] == "delete_message")
+
+
+def test_expired_warnings_are_deleted(storage, fake_bot):
+    storage.save_join_message(2, -5, -5, 100, ttl=-1)
+    storage.save_join_message(3, -5, -5, 101, ttl=1000)
+    # Birlashtirilgan DM: -5 uchun muddati o‘tdi, -6 uchun hali kutilmoqda
+    storage.save_join_message(4, -5, 4, 900, ttl=-1)
+    storage.save_join_message(4, -6, 4, 900, ttl=1000)
+
+    assert run(bot.expire_join_messages(fake_bot)) == 2
+    assert deleted(fake_bot) == [(-5, 100)]
+    assert sorted(storage.get_pending_user_ids()) == [3, 4]
+    assert storage.get_pending_groups_for_user(4) == [-6]
+    assert run(bot.expire_join_messages(fake_bot)) == 0
+
+
+def test_job_drains_in_batches(storage, fake_bot, monkeypatch):
+    monkeypatch.setattr(bot, "PENDING_SWEEP_BATCH", 3)
+    for i in range(7):
+        storage.save_join_message(i, -5, -5, 100 + i, ttl=-1)
+
+    run(bot.expire_join_messages_job(types.SimpleNamespace(bot=fake_bot)))
+    assert len(deleted(fake_bot)) == 7
+    assert storage.get_pending_user_ids() == []
+
+
+def test_bot_removed_from_group_drops_its_records(storage):
+    storage.save_join_message(2, -5, -5, 100)
+    storage.save_join_message(2, -6, -6, 200)
+    update = types.SimpleNamespace(my_chat_member=types.SimpleNamespace(
+        chat=types.SimpleNamespace(id=-5),
+        new_chat_member=types.SimpleNamespace(status=ChatMember.LEFT),
+    ))
+    run(bot.my_chat_member_handler(update, None))
+    assert storage.get_pending_groups_for_user(2) == [-6]
+
+
+def test_sqlite_file_pages_are_reclaimed(tmp_path):
+    db = DB(str(tmp_path / "t.db"))
+    for i in range(3000):
+        db.save_join_message(i, -5, -5, i, ttl=-1)
+    db.pop_expired_join_messages(int(bot.time.time()), 5000)
+    assert db.conn.execute("PRAGMA freelist_count").fetchone()[0] > 0
+    db.compact()
+    assert db.conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    db.close()
@@ -0,0 +1,83 @@
+import bot
+import moderation
+from conftest import run
+from fakes import make_context, make_msg, make_update
+
+
+def new_pipeline():
+    return moderation.FilterPipeline([
+        bot.MembershipFilter(),
+        moderation.KeywordFilter(),
+        moderation.LinkFilter(),
+        moderation.FloodFilter(),
+        moderation.SpamFingerprintFilter(),
+        moderation.BlockedMediaFilter(),
+        moderation.ClassifierFilter(),
+    ], bot.pipeline_admin_ids)
+
+
+def reasons(verdicts):
+    return [(m.from_user.id, v.reason) for m, v in verdicts]
+
+
+def test_filters_run_local_first_by_cost():
+    names = [f.name for f in new_pipeline().filters]
+    assert names == ["flood", "media", "links", "keywords", "classifier", "spam", "membership"]
+    assert [f.name for f in bot.moderation_pipeline.filters] == names
+
+
+def test_first_violation_short_circuits(fake_bot):
+    pipeline = new_pipeline()
+    g = bot.load_group_settings(-5)
+    msgs = [make_msg(fake_bot, -5, 2, "casino t.me/reklama"), make_msg(fake_bot, -5, 3, "salom")]
+    verdicts = run(pipeline.run(fake_bot, msgs[0].chat, g, msgs))
+
+    assert reasons(verdicts) == [(2, "link")]
+    # Havola topilgan xabar keyingi filtrga o‘tmaydi
+    assert pipeline.by_name["keywords"].calls == 1
+
+
+def test_clean_batch_skips_admin_lookup(fake_bot):
+    g = bot.load_group_settings(-5)
+    msgs = [make_msg(fake_bot, -5, 2, "salom"), make_msg(fake_bot, -5, 3, "qalaysiz")]
+    assert run(new_pipeline().run(fake_bot, msgs[0].chat, g, msgs)) == []
+    assert fake_bot.calls == []
+
+
+def test_membership_checked_after_admins_removed(fake_bot):
+    bot.db.set_required_channels(-5, ["-1001"])
+    fake_bot.admins[-5] = [1]
+    fake_bot.members[(-1001, 3)] = "member"
+    g = bot.load_group_settings(-5)
+    msgs = [make_msg(fake_bot, -5, u, "salom") for u in (1, 2, 3)]
+    verdicts = run(new_pipeline().run(fake_bot, msgs[0].chat, g, msgs))
+
+    assert reasons(verdicts) == [(2, "membership")]
+    assert verdicts[0][1].detail == [-1001]
+    checked = {c[2] for c in fake_bot.calls if c[0] == "get_chat_member"}
+    assert checked == {2, 3}
+
+
+def test_disable_filter_command(app, fake_bot):
+    fake_bot.members[(-5, 7)] = "administrator"
+    msg = make_msg(fake_bot, -5, 7, "/disable_filter links")
+    run(bot.disable_filter_cmd(make_update(msg), make_context(app, ["links"])))
+
+    g = bot.load_group_settings(-5)
+    assert g["disabled_filters"] == frozenset({"links"})
+    msgs = [make_msg(fake_bot, -5, 2, "t.me/reklama"), make_msg(fake_bot, -5, 3, "casino")]
+    fake_bot.admins[-5] = []
+    assert reasons(run(new_pipeline().run(fake_bot, msgs[0].chat, g, msgs))) == [(3, "keyword")]
+
+    msg = make_msg(fake_bot, -5, 7, "/enable_filter links")
+    run(bot.enable_filter_cmd(make_update(msg), make_context(app, ["links"])))
+    assert bot.load_group_settings(-5)["disabled_filters"] == frozenset()
+
+
+def test_unknown_filter_name_is_rejected(app, fake_bot):
+    fake_bot.members[(-5, 7)] = "administrator"
+    msg = make_msg(fake_bot, -5, 7, "/disable_filter yoq")
+    run(bot.disable_filter_cmd(make_update(msg), make_context(app, ["yoq"])))
+
+    assert bot.load_group_settings(-5)["disabled_filters"] == frozenset()
+    assert "links" in fake_bot.calls[-1][2]
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import bot
+from conftest import run
+from fakes import FakeBot
+
+
+class SlowAdminsBot(FakeBot):
+    def __init__(self):
+        super().__init__()
+        self.active = 0
+        self.peak = 0
+
+    async def get_chat_administrators(self, chat_id, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            return await super().get_chat_administrators(chat_id, **kwargs)
+        finally:
+            self.active -= 1
+
+
+def test_rate_limiter_spaces_requests():
+    async def main():
+        limiter = bot.RateLimiter(50)
+        t0 = time.monotonic()
+        for _ in range(6):
+            await limiter.wait()
+        return time.monotonic() - t0
+
+    assert run(main()) >= 5 / 50 * 0.9
+
+
+def test_prewarm_fills_missing_admins_with_bounded_concurrency(monkeypatch):
+    monkeypatch.setattr(bot, "PREWARM_RATE", 1000)
+    fake = SlowAdminsBot()
+    for gid in range(-20, -10):
+        bot.db.ensure_group(gid)
+        fake.admins[gid] = [1]
+    bot.admin_cache.set(-20, frozenset({1}))
+
+    run(bot.prewarm_caches(fake))
+
+    fetched = sorted(c[1] for c in fake.calls if c[0] == "get_chat_administrators")
+    assert fetched == list(range(-19, -10))
+    assert fake.peak <= bot.PREWARM_CONCURRENCY
+    assert all(bot.admin_cache.get(gid) == frozenset({1}) for gid in range(-20, -10))
+
+
+def test_prewarm_resolves_legacy_channels():
+    fake = FakeBot()
+    bot.db.set_required_channels(-5, ["@kanal1"])
+    bot.admin_cache.set(-5, frozenset())
+    run(bot.prewarm_caches(fake))
+    assert bot.db.get_required_channels(-5) == ["-1001"]
+    assert "get_chat_administrators" not in fake.methods()
+
+
+def test_prewarm_pauses_while_degraded(monkeypatch):
+    monkeypatch.setattr(bot, "LOAD_CHECK_INTERVAL", 0.01)
+    fake = FakeBot()
+    bot.db.ensure_group(-5)
+
+    async def main():
+        bot.load_monitor.instance().degraded = True
+        task = asyncio.ensure_future(bot.prewarm_caches(fake))
+        await asyncio.sleep(0.05)
+        assert "get_chat_administrators" not in fake.methods()
+        bot.load_monitor.instance().degraded = False
+        await task
+
+    run(main())
+    assert fake.methods() == ["get_chat_administrators"]
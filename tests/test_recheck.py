@@ -0,0 +1,81 @@
+import types
+
+import pytest
+
+import bot
+from storage import RECHECK_SCHEDULE
+from conftest import run
+from fakes import FakeApp
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000]
+    monkeypatch.setattr(bot.time, "time", lambda: now[0])
+    return now
+
+
+def check(fake_bot):
+    run(bot.background_membership_checker(FakeApp(fake_bot)))
+
+
+def member_checks(fake_bot):
+    return sum(1 for c in fake_bot.calls if c[0] == "get_chat_member")
+
+
+def test_interval_grows_while_not_joined(storage, fake_bot, clock):
+    storage.set_required_channels(-5, ["-1001"])
+    storage.save_join_message(2, -5, -5, 100)
+
+    expected = []
+    for step in range(len(RECHECK_SCHEDULE) + 1):
+        wait = RECHECK_SCHEDULE[min(step, len(RECHECK_SCHEDULE) - 1)]
+        clock[0] += wait - 1
+        check(fake_bot)
+        expected.append(member_checks(fake_bot))
+        clock[0] += 1
+        bot.membership_cache._data.clear()
+        check(fake_bot)
+        expected.append(member_checks(fake_bot))
+    # Har bosqichda: muddatdan oldin — so‘rov yo‘q, muddatida — bitta
+    assert expected == [0, 1, 1, 2, 2, 3, 3, 4, 4, 5]
+    assert storage.get_due_rechecks(clock[0] + RECHECK_SCHEDULE[-1], 10) == [(2, -5, 3)]
+
+
+def test_activity_restarts_schedule(storage, fake_bot, clock):
+    storage.set_required_channels(-5, ["-1001"])
+    storage.save_join_message(2, -5, -5, 100)
+    clock[0] += RECHECK_SCHEDULE[0]
+    check(fake_bot)
+    assert storage.get_due_rechecks(clock[0] + RECHECK_SCHEDULE[1], 10) == [(2, -5, 1)]
+
+    update = types.SimpleNamespace(effective_user=types.SimpleNamespace(id=2, is_bot=False), chat_member=None)
+    run(bot.recheck_activity_handler(update, None))
+    bot.recheck_scheduler.flush(clock[0])
+    assert storage.get_due_rechecks(clock[0], 10) == [(2, -5, 0)]
+
+
+def test_joined_user_warnings_are_removed(storage, fake_bot, clock):
+    storage.set_required_channels(-5, ["-1001"])
+    storage.set_required_channels(-6, ["-1002"])
+    storage.save_join_message(2, -5, -5, 100)
+    storage.save_join_message(2, -5, 2, 900)   # DM ikkala guruh uchun
+    storage.save_join_message(2, -6, 2, 900)
+    fake_bot.members[(-1001, 2)] = "member"
+
+    clock[0] += RECHECK_SCHEDULE[0]
+    check(fake_bot)
+
+    assert [c[1:] for c in fake_bot.calls if c[0] == "delete_message"] == [(-5, 100)]
+    assert storage.get_pending_groups_for_user(2) == [-6]
+
+
+def test_cached_membership_skips_request(storage, fake_bot, clock):
+    storage.set_required_channels(-5, ["-1001"])
+    storage.save_join_message(2, -5, -5, 100)
+    bot.membership_cache.set((-1001, 2), True)
+
+    clock[0] += RECHECK_SCHEDULE[0]
+    check(fake_bot)
+    assert member_checks(fake_bot) == 0
+    assert storage.get_pending_user_ids() == []
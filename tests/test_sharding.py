@@ -0,0 +1,185 @@
+import asyncio
+import json
+import socket
+
+import pytest
+
+import bot
+import sharding
+from conftest import run
+
+
+def test_ring_is_deterministic_and_balanced():
+    ring = sharding.ShardRing(4)
+    chats = range(-100_000, -90_000)
+    shards = [ring.shard_for(c) for c in chats]
+    again = sharding.ShardRing(4)
+    assert shards == [again.shard_for(c) for c in chats]
+    for s in range(4):
+        assert 0.15 < shards.count(s) / len(shards) < 0.35
+
+
+def test_adding_a_shard_moves_few_chats():
+    old, new = sharding.ShardRing(3), sharding.ShardRing(4)
+    chats = range(-100_000, -90_000)
+    moved = sum(1 for c in chats if old.shard_for(c) != new.shard_for(c))
+    # Ideal — 1/4; oddiy modul bo‘lsa ~3/4 ko‘chadi
+    assert moved / len(chats) < 0.4
+    assert all(new.shard_for(c) == 3 for c in chats if old.shard_for(c) != new.shard_for(c))
+
+
+def test_update_chat_id():
+    assert sharding.update_chat_id({"message": {"chat": {"id": -5}}}) == -5
+    assert sharding.update_chat_id({"my_chat_member": {"chat": {"id": -6}}}) == -6
+    assert sharding.update_chat_id({"callback_query": {"from": {"id": 7}, "message": {"chat": {"id": -8}}}}) == -8
+    assert sharding.update_chat_id({"callback_query": {"from": {"id": 7}}}) == 7
+    assert sharding.update_chat_id({"poll": {}}) == 0
+
+
+def test_owns_chat_follows_ring(monkeypatch):
+    assert sharding.owns_chat(-5)
+    monkeypatch.setattr(sharding, "SHARD_COUNT", 2)
+    monkeypatch.setattr(sharding, "_shard_ring", sharding.ShardRing(2))
+    owners = set()
+    for index in (0, 1):
+        monkeypatch.setattr(sharding, "SHARD_INDEX", index)
+        owners.add(sharding.owns_chat(-5))
+    assert owners == {True, False}
+
+
+def test_rechecks_page_past_foreign_groups(storage, monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_COUNT", 2)
+    monkeypatch.setattr(sharding, "SHARD_INDEX", 0)
+    monkeypatch.setattr(sharding, "_shard_ring", sharding.ShardRing(2))
+    monkeypatch.setattr(bot, "RECHECK_BATCH", 3)
+    groups = range(-100, -1)
+    foreign = [g for g in groups if not sharding.owns_chat(g)][:4]
+    owned = [g for g in groups if sharding.owns_chat(g)][:2]
+
+    # Boshqa ishchining guruhlari navbat boshida — birinchi sahifani to‘liq egallaydi
+    now = int(bot.time.time())
+    for i, group_id in enumerate(foreign + owned):
+        storage.save_join_message(2, group_id, group_id, 100)
+        storage.set_recheck(2, group_id, 0, now - 100 + i)
+    assert [r[1] for r in bot.due_owned_rechecks(now)] == owned
+
+
+async def fake_worker(path, received):
+    async def on_connection(reader, writer):
+        try:
+            while True:
+                received.append(json.loads(await sharding._read_frame(reader)))
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    return await asyncio.start_unix_server(on_connection, path=path)
+
+
+def test_router_forwards_to_owning_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_SOCKET_DIR", str(tmp_path))
+    received = {0: [], 1: []}
+
+    async def main():
+        servers = [await fake_worker(sharding.shard_socket_path(i), received[i]) for i in (0, 1)]
+        router = sharding.ShardRouter(2)
+        for chat_id in (-5, -6, -7, -8):
+            body = json.dumps({"update_id": 1, "message": {"chat": {"id": chat_id}}}).encode()
+            assert await router.forward(body)
+        await asyncio.sleep(0.05)
+        for s in servers:
+            s.close()
+        return router
+
+    router = run(main())
+    for shard, updates in received.items():
+        assert updates
+        assert all(router.ring.shard_for(u["message"]["chat"]["id"]) == shard for u in updates)
+
+
+def test_router_reports_missing_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_SOCKET_DIR", str(tmp_path))
+    router = sharding.ShardRouter(1)
+    assert not run(router.forward(b'{"message": {"chat": {"id": -5}}}'))
+
+
+class FakeTelegram:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def set_webhook(self, *args, **kwargs):
+        return True
+
+
+class RecordingRouter:
+    def __init__(self):
+        self.bodies = []
+
+    async def forward(self, body):
+        self.bodies.append(body)
+        return True
+
+
+@pytest.fixture
+def webhook_port(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    monkeypatch.setattr(sharding, "WEBHOOK_LISTEN", "127.0.0.1")
+    monkeypatch.setattr(sharding, "WEBHOOK_PORT", port)
+    monkeypatch.setattr(sharding, "WEBHOOK_SECRET", "")
+    return port
+
+
+def post_raw(port, router, request: bytes) -> bytes:
+    async def main():
+        server = asyncio.ensure_future(sharding._serve_webhook(router, FakeTelegram()))
+        await asyncio.sleep(0.05)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 1)
+        writer.close()
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+        return response
+
+    return run(main())
+
+
+def test_webhook_forwards_body(webhook_port):
+    router = RecordingRouter()
+    body = b'{"update_id": 1}'
+    response = post_raw(webhook_port, router, b"POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+    assert response.startswith(b"HTTP/1.1 200")
+    assert router.bodies == [body]
+
+
+def test_webhook_rejects_chunked_body(webhook_port):
+    router = RecordingRouter()
+    request = b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n10\r\n{\"update_id\": 1}\r\n0\r\n\r\n"
+    response = post_raw(webhook_port, router, request)
+    assert response.startswith(b"HTTP/1.1 411")
+    assert router.bodies == []
+
+
+def test_webhook_checks_secret_before_reading_body(webhook_port, monkeypatch):
+    monkeypatch.setattr(sharding, "WEBHOOK_SECRET", "s3cret")
+    router = RecordingRouter()
+    # Tana yuborilmaydi — javob baribir darhol keladi
+    response = post_raw(webhook_port, router, b"POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\n")
+    assert response.startswith(b"HTTP/1.1 403")
+    assert router.bodies == []
+
+
+@pytest.mark.parametrize("length,code", [(b"abc", b"400"), (b"-1", b"400"), (b"%d" % (2 << 20), b"413")])
+def test_webhook_rejects_bad_length_without_reading(webhook_port, length, code):
+    router = RecordingRouter()
+    response = post_raw(webhook_port, router, b"POST / HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n")
+    assert response.startswith(b"HTTP/1.1 " + code)
+    assert router.bodies == []
@@ -0,0 +1,91 @@
+import pytest
+
+import bot
+from storage import LazySharedCache, SharedCache, SharedTTLCache
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "shared.db")
+
+
+def admin_caches(path):
+    """Ikki ishchi jarayonning adminlar keshi (bitta umumiy fayl)."""
+    return [
+        SharedTTLCache(bot.ADMIN_CACHE_TTL, "admins", SharedCache(path), encode=sorted, decode=frozenset)
+        for _ in range(2)
+    ]
+
+
+def test_value_written_by_one_worker_is_read_by_another(path):
+    first, second = admin_caches(path)
+    first.set(-5, frozenset({1, 2}))
+
+    assert second.get(-5) == frozenset({1, 2})
+    assert second.shared.hits == 1
+    # Endi lokal keshdan — umumiy keshga murojaat yo‘q
+    assert second.get(-5) == frozenset({1, 2})
+    assert second.shared.hits == 1
+
+
+def test_remaining_ttl_is_kept(path):
+    first, second = admin_caches(path)
+    first.set(-5, frozenset({1}), ttl=30)
+    second.get(-5)
+    ttl = {k: t for k, _, t in second.items_with_ttl()}[-5]
+    assert 25 < ttl <= 30
+
+
+def test_pop_removes_for_everyone(path):
+    first, second = admin_caches(path)
+    first.set(-5, frozenset({1}))
+    second.pop(-5)
+    first._data.clear()
+    assert first.get(-5) is None
+
+
+def test_expired_entries_are_misses_and_purged(path, monkeypatch):
+    cache = SharedCache(path)
+    cache.set("a", 1, 10)
+    cache.set("b", 2, 100)
+    now = bot.time.time()
+    monkeypatch.setattr(bot.time, "time", lambda: now + 50)
+
+    assert cache.get("a") is None
+    assert cache.get("b")[0] == 2
+    assert cache.purge() == 1
+
+
+def test_claim_is_exclusive_until_expiry(path, monkeypatch):
+    first, second = SharedCache(path), SharedCache(path)
+    assert first.claim("dm:0:2", 60)
+    assert not second.claim("dm:0:2", 60)
+
+    now = bot.time.time()
+    monkeypatch.setattr(bot.time, "time", lambda: now + 61)
+    assert second.claim("dm:0:2", 60)
+
+
+def test_count_prefix_counts_live_keys(path):
+    cache = SharedCache(path)
+    for chat_id in (-1, -2, -3):
+        cache.set(f"spam:ab:{chat_id}", 1, 60)
+    cache.set("spam:ac:-1", 1, 60)
+    cache.set("spam:ab:-4", 1, -1)
+    assert cache.count_prefix("spam:ab:") == 3
+
+
+def test_unreadable_file_is_a_miss(tmp_path):
+    cache = SharedCache(str(tmp_path / "shared.db"))
+    cache.conn.close()
+    assert cache.get("a") is None
+    cache.set("a", 1, 60)
+    assert cache.count_prefix("a") == 0
+
+
+def test_lazy_cache_creates_file_on_first_use(path):
+    cache = LazySharedCache(path)
+    assert not bot.os.path.exists(path)
+    cache.set("a", 1, 60)
+    assert bot.os.path.exists(path)
+    assert cache.get("a")[0] == 1
@@ -0,0 +1,64 @@
+import gzip
+import json
+
+import bot
+from conftest import run
+
+
+def forget_caches():
+    bot.admin_cache._data.clear()
+    bot.membership_cache._data.clear()
+    bot.dm_outbox._instances.clear()
+
+
+def test_round_trip_restores_caches(tmp_path):
+    path = str(tmp_path / "cache.snapshot.gz")
+    bot.admin_cache.set(-5, frozenset({1, 2}))
+    bot.membership_cache.set((-1001, 3), True)
+    bot.membership_cache.set(("@kanal1", 4), False, ttl=bot.NOT_MEMBER_CACHE_TTL)
+    bot.dm_outbox.unreachable.set(9, True)
+
+    run(bot.save_snapshot(path))
+    forget_caches()
+    bot.load_snapshot(path)
+
+    assert bot.admin_cache.get(-5) == frozenset({1, 2})
+    assert bot.membership_cache.get((-1001, 3)) is True
+    assert bot.membership_cache.get(("@kanal1", 4)) is False
+    assert bot.dm_outbox.unreachable.get(9) is True
+    remaining = {k: ttl for k, _, ttl in bot.membership_cache.items_with_ttl()}
+    assert remaining[("@kanal1", 4)] <= bot.NOT_MEMBER_CACHE_TTL
+
+
+def test_age_is_subtracted_from_ttl():
+    data = {
+        "v": bot.SNAPSHOT_VERSION,
+        "saved_at": bot.time.time() - 100,
+        "admins": [[-5, 50.0, [1]], [-6, 300.0, [2]]],
+        "membership": [[-1001, 3, 60.0, 1]],
+        "dm_unreachable": [],
+    }
+    assert bot.restore_snapshot(data) == (1, 0)
+    assert bot.admin_cache.get(-5) is None
+    ttl = dict((k, t) for k, _, t in bot.admin_cache.items_with_ttl())[-6]
+    assert 190 < ttl <= 200
+
+
+def test_unknown_version_and_broken_file_are_ignored(tmp_path):
+    assert bot.restore_snapshot({"v": bot.SNAPSHOT_VERSION + 1, "admins": [[-5, 60, [1]]]}) == (0, 0)
+
+    path = tmp_path / "broken.snapshot.gz"
+    path.write_bytes(b"not gzip")
+    bot.load_snapshot(str(path))
+    bot.load_snapshot(str(tmp_path / "missing.snapshot.gz"))
+    assert len(bot.admin_cache) == 0
+
+
+def test_snapshot_file_is_gzip_json(tmp_path):
+    path = str(tmp_path / "cache.snapshot.gz")
+    bot.admin_cache.set(-5, frozenset({2, 1}))
+    run(bot.save_snapshot(path))
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["v"] == bot.SNAPSHOT_VERSION
+    assert data["admins"][0][0] == -5 and data["admins"][0][2] == [1, 2]
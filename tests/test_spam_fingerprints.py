@@ -0,0 +1,106 @@
+import bot
+import moderation
+from storage import SharedCache
+from conftest import run
+from fakes import FakeBot, make_msg
+
+SPAM = "Arzon kredit!!! Hoziroq yozing, 24 soatda pul beramiz 🔥"
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_fingerprint_ignores_case_punctuation_and_emoji():
+    fp = moderation.text_fingerprint(SPAM)
+    assert fp is not None
+    assert moderation.text_fingerprint("ARZON KREDIT hoziroq yozing 24 soatda pul beramiz") == fp
+    assert moderation.text_fingerprint("salom") is None
+
+
+def test_spam_detected_in_third_distinct_chat():
+    fps = moderation.SpamFingerprints()
+    fp = moderation.text_fingerprint(SPAM)
+    # Bitta guruhdagi takror sanalmaydi
+    assert not fps.observe(fp, -1, 5)
+    assert not fps.observe(fp, -1, 5)
+    assert not fps.observe(fp, -2, 6)
+    assert fps.observe(fp, -3, 6)
+    # Aniqlangandan keyin birinchi guruhda ham o‘chiriladi
+    assert fps.observe(fp, -1, 5)
+
+
+def test_one_user_cross_posting_is_not_spam():
+    fps = moderation.SpamFingerprints()
+    fp = moderation.text_fingerprint(SPAM)
+    for chat_id in (-1, -2, -3, -4):
+        assert not fps.observe(fp, chat_id, 5)
+    # Ikkinchi foydalanuvchi ham yuborsa — endi spam
+    assert fps.observe(fp, -4, 6)
+
+
+def test_many_users_in_one_chat_is_not_spam():
+    fps = moderation.SpamFingerprints()
+    fp = moderation.text_fingerprint(SPAM)
+    for user_id in range(5):
+        assert not fps.observe(fp, -1, user_id)
+
+
+def test_sketch_forgets_counts_after_window(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bot.time, "monotonic", clock)
+    sketch = moderation.SlidingCountMinSketch(width=64, depth=2, window=60, buckets=6)
+
+    assert sketch.add(7) == 1
+    clock.now += 30
+    assert sketch.add(7) == 2
+    clock.now += 40   # birinchi qo‘shilgan bo‘lak oynadan chiqdi
+    assert sketch.estimate(7) == 1
+    clock.now += 60
+    assert sketch.estimate(7) == 0
+    assert sketch.estimate(8) == 0
+
+
+def test_spam_filter_flags_third_chat():
+    fake = FakeBot()
+    g = bot.load_group_settings(-3)
+    f = moderation.SpamFingerprintFilter()
+    for chat_id, user_id in ((-1, 5), (-2, 6)):
+        assert f.check(make_msg(fake, chat_id, user_id, SPAM), g) is None
+    v = f.check(make_msg(fake, -3, 6, SPAM), g)
+    assert v.reason == "spam"
+
+
+def test_admin_cross_posts_are_not_counted():
+    fake = FakeBot()
+    for chat_id in (-1, -2, -3):
+        fake.admins[chat_id] = [1]
+    pipeline = moderation.FilterPipeline([moderation.SpamFingerprintFilter()], bot.pipeline_admin_ids)
+    # Admin e’lonini uch guruhga yuboradi, keyin oddiy a’zolar uni tarqatadi
+    for chat_id in (-1, -2, -3):
+        msg = make_msg(fake, chat_id, 1, SPAM)
+        assert run(pipeline.run(fake, msg.chat, bot.load_group_settings(chat_id), [msg])) == []
+    for chat_id, user_id in ((-1, 5), (-2, 6)):
+        msg = make_msg(fake, chat_id, user_id, SPAM)
+        assert run(pipeline.run(fake, msg.chat, bot.load_group_settings(chat_id), [msg])) == []
+    msg = make_msg(fake, -3, 7, SPAM)
+    verdicts = run(pipeline.run(fake, msg.chat, bot.load_group_settings(-3), [msg]))
+    assert [v.reason for _, v in verdicts] == ["spam"]
+
+
+def test_shared_cache_correlates_across_workers(tmp_path):
+    path = str(tmp_path / "shared.db")
+    first = moderation.SpamFingerprints(SharedCache(path))
+    second = moderation.SpamFingerprints(SharedCache(path))
+    fp = moderation.text_fingerprint(SPAM)
+
+    assert not first.observe(fp, -1, 5)
+    assert not second.observe(fp, -2, 5)
+    assert not first.observe(fp, -3, 5)  # bitta foydalanuvchi — hali spam emas
+    assert second.observe(fp, -3, 6)
+    # Boshqa ishchi aniqlagan blok ham ko‘rinadi
+    assert first.observe(fp, -4, 7)
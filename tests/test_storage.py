@@ -0,0 +1,191 @@
+"""Dvigatellar mosligi: har bir test sqlite, memory va lmdb da bir xil natija kutadi."""
+
+import sqlite3
+
+import pytest
+
+import bot
+from storage import DB, DEFAULT_BANNED_KEYWORDS, DEFAULT_MEMBERSHIP_FAIL_OPEN, PENDING_JOIN_TTL, RECHECK_SCHEDULE, Storage, new_group_row
+
+CHANNEL = {"chat_id": -1001, "ident": "@kanal1", "title": "Kanal 1", "username": "kanal1",
+           "invite_link": "https://t.me/kanal1"}
+
+
+def test_new_group_has_defaults(storage):
+    assert storage.get_group(-5) is None
+    storage.ensure_group(-5)
+    storage.ensure_group(-5)
+    assert storage.get_group(-5) == new_group_row()
+    assert storage.get_group_ids() == [-5]
+    assert storage.get_banned_keywords(-5) == DEFAULT_BANNED_KEYWORDS
+
+
+def test_group_settings_round_trip(storage):
+    storage.set_required_channels(-5, ["-1001", "@kanal2"])
+    storage.set_banned_keywords(-5, ["kazino", "kredit"])
+    storage.set_enforce_membership(-5, False)
+    storage.set_enforce_adblock(-5, False)
+    storage.set_membership_fail_open(-5, False)
+    storage.set_disabled_filters(-5, ["links", "spam"])
+    storage.set_classifier_threshold(-5, 0.75)
+
+    g = storage.get_group(-5)
+    assert g["required_channels"] == "-1001,@kanal2"
+    assert g["enforce_membership"] is False and g["enforce_adblock"] is False
+    assert g["membership_fail_open"] is False
+    assert g["disabled_filters"] == "links,spam"
+    assert g["classifier_threshold"] == 0.75
+    assert storage.get_required_channels(-5) == ["-1001", "@kanal2"]
+    assert storage.get_banned_keywords(-5) == ["kazino", "kredit"]
+
+    storage.set_required_channels(-6, [])
+    assert storage.get_all_required_channels() == {-5: ["-1001", "@kanal2"]}
+
+
+def test_channels_and_staleness(storage, monkeypatch):
+    now = bot.time.time()
+    monkeypatch.setattr(bot.time, "time", lambda: now - 100)
+    storage.save_channels([CHANNEL])
+    monkeypatch.setattr(bot.time, "time", lambda: now)
+    storage.save_channels([dict(CHANNEL, chat_id=-1002, ident="-1002", username="", invite_link="")])
+
+    assert storage.get_channels([-1001, -1003]) == {-1001: CHANNEL}
+    assert storage.get_channels([-1002])[-1002]["username"] == ""
+    assert storage.get_stale_channels(50) == [-1001]
+
+    storage.save_channels([dict(CHANNEL, title="Yangi nom")])
+    assert storage.get_channels([-1001])[-1001]["title"] == "Yangi nom"
+    assert storage.get_stale_channels(50) == []
+
+
+def test_join_messages_and_refs(storage):
+    storage.save_join_message(2, -5, -5, 100)
+    storage.save_join_message(2, -6, 2, 900)   # DM — ikkala guruh uchun bitta xabar
+    storage.save_join_message(2, -5, 2, 900)
+    storage.save_join_message(3, -5, -5, 101)
+
+    assert sorted(storage.get_join_messages(2, -5)) == [(-5, 100), (2, 900)]
+    assert sorted(storage.get_pending_groups_for_user(2)) == [-6, -5]
+    assert sorted(storage.get_pending_user_ids()) == [2, 3]
+    assert storage.count_join_message_refs(2, 900) == 2
+
+    storage.delete_join_messages(2, -5)
+    assert storage.get_join_messages(2, -5) == []
+    assert storage.count_join_message_refs(2, 900) == 1
+    assert storage.get_pending_groups_for_user(2) == [-6]
+
+    assert storage.delete_group_join_messages(-5) == 1
+    assert storage.get_pending_user_ids() == [2]
+
+
+def test_duplicate_join_message_is_stored_once(storage):
+    storage.save_join_message(2, -5, -5, 100)
+    storage.save_join_message(2, -5, -5, 100)
+    assert storage.get_join_messages(2, -5) == [(-5, 100)]
+    assert storage.count_join_message_refs(-5, 100) == 1
+
+
+def test_expired_join_messages_are_popped_oldest_first(storage):
+    now = int(bot.time.time())
+    storage.save_join_message(2, -5, -5, 100, ttl=10)
+    storage.save_join_message(3, -5, -5, 101, ttl=5)
+    storage.save_join_message(4, -5, -5, 102, ttl=1000)
+
+    assert storage.pop_expired_join_messages(now + 20, 1) == [(3, -5, -5, 101)]
+    assert storage.pop_expired_join_messages(now + 20, 10) == [(2, -5, -5, 100)]
+    assert storage.pop_expired_join_messages(now + 20, 10) == []
+    assert storage.get_pending_user_ids() == [4]
+    # Yozuv bilan birga qayta tekshirish ham o‘chadi
+    assert [r[0] for r in storage.get_due_rechecks(now + 10_000, 10)] == [4]
+
+
+def test_recheck_schedule(storage):
+    now = int(bot.time.time())
+    storage.save_join_message(2, -5, -5, 100)
+    storage.save_join_message(3, -5, -5, 101)
+    first = now + RECHECK_SCHEDULE[0]
+
+    assert storage.get_due_rechecks(now, 10) == []
+    assert sorted(storage.get_due_rechecks(first, 10)) == [(2, -5, 0), (3, -5, 0)]
+
+    storage.set_recheck(2, -5, 2, first + 300)
+    storage.set_recheck(9, -5, 1, first)  # kutilmayotgan juftlik — e’tiborsiz
+    assert storage.get_due_rechecks(first, 10) == [(3, -5, 0)]
+    assert storage.get_due_rechecks(first + 300, 10) == [(3, -5, 0), (2, -5, 2)]
+    assert storage.get_due_rechecks(first + 300, 10, 1) == [(2, -5, 2)]
+
+    assert storage.reset_rechecks([2, 9], first) == 1
+    assert sorted(storage.get_due_rechecks(first, 10)) == [(2, -5, 0), (3, -5, 0)]
+
+
+def test_blocked_media(storage, monkeypatch):
+    now = int(bot.time.time())
+    monkeypatch.setattr(bot.time, "time", lambda: now - 100)
+    storage.add_blocked_media(["file:a"], 7)
+    monkeypatch.setattr(bot.time, "time", lambda: now)
+    storage.add_blocked_media(["file:b", "chat:-1009"], 7)
+
+    # Qo‘shilgan vaqti bo‘yicha — eng eskisi birinchi
+    keys = storage.get_blocked_media_since(0, 10)
+    assert keys[0] == "file:a" and sorted(keys) == ["chat:-1009", "file:a", "file:b"]
+    assert sorted(storage.get_blocked_media_since(now - 50, 10)) == ["chat:-1009", "file:b"]
+
+    storage.remove_blocked_media(["file:a", "file:yoq"])
+    assert sorted(storage.get_blocked_media_since(0, 10)) == ["chat:-1009", "file:b"]
+
+
+def test_group_stats(storage):
+    storage.add_group_stats([(-5, 100, "messages", 3), (-5, 101, "messages", 2), (-6, 101, "api_calls", 9)])
+    storage.add_group_stats([(-5, 101, "messages", 1), (-5, 101, "api_calls", 4)])
+
+    assert storage.get_group_stats(-5, 100) == {"messages": 6, "api_calls": 4}
+    assert storage.get_group_stats(-5, 101) == {"messages": 3, "api_calls": 4}
+    assert storage.get_top_groups("api_calls", 0, 10) == [(-6, 9), (-5, 4)]
+    assert storage.get_top_groups("api_calls", 0, 1) == [(-6, 9)]
+
+    assert storage.delete_group_stats_before(101) == 1
+    assert storage.get_group_stats(-5, 0) == {"messages": 3, "api_calls": 4}
+    storage.compact()
+
+
+def test_sqlite_migrates_original_schema(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE groups (
+            group_id INTEGER PRIMARY KEY,
+            required_channels TEXT,
+            banned_keywords TEXT,
+            enforce_membership INTEGER DEFAULT 1,
+            enforce_adblock INTEGER DEFAULT 1,
+            join_button_text TEXT DEFAULT 'Kanalga a’zo bo‘ling',
+            override_message TEXT DEFAULT 'Iltimos, majburiy kanalga a’zo bo‘ling.'
+        );
+        CREATE TABLE pending_join_msgs (user_id INTEGER, group_id INTEGER, chat_id INTEGER, message_id INTEGER);
+        INSERT INTO groups (group_id, required_channels, banned_keywords, enforce_membership, enforce_adblock)
+            VALUES (-5, '@kanal1', 'kazino', 1, 0);
+        INSERT INTO pending_join_msgs VALUES (2, -5, -5, 100);
+    """)
+    conn.close()
+
+    db = DB(path)
+    g = db.get_group(-5)
+    assert g["required_channels"] == "@kanal1" and g["banned_keywords"] == "kazino"
+    assert g["enforce_adblock"] is False
+    assert g["disabled_filters"] == "" and g["classifier_threshold"] == 0.0
+    assert g["membership_fail_open"] is DEFAULT_MEMBERSHIP_FAIL_OPEN
+    assert db.get_join_messages(2, -5) == [(-5, 100)]
+    # Eski yozuv darhol tekshiriladi va bitta TTL oladi
+    assert db.get_due_rechecks(int(bot.time.time()), 10) == [(2, -5, 0)]
+    assert db.pop_expired_join_messages(int(bot.time.time()) + PENDING_JOIN_TTL, 10) == [(2, -5, -5, 100)]
+    db.close()
+
+    # Qayta ochish — migratsiya takrorlanmaydi
+    db = DB(path)
+    assert db.get_group_ids() == [-5]
+    db.close()
+
+
+def test_storage_base_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        Storage()
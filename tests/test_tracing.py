@@ -0,0 +1,171 @@
+import json
+import os
+
+import pytest
+from telegram.ext import TypeHandler
+
+import bot
+import tracing
+from storage import LazyStorage, MemoryStorage
+from conftest import run
+from fakes import make_context, make_msg, make_update
+
+
+def make_tracer(directory, sample_rate=0.0, slow_ms=1000.0):
+    exporter = tracing.TraceExporter(str(directory), tracing.TRACE_MAX_BYTES, 5, 1000)
+    return tracing.Tracer(exporter, sample_rate, slow_ms)
+
+
+def exported(tracer):
+    run(tracer.exporter.flush())
+    result = []
+    if not os.path.isdir(tracer.exporter.directory):  # katalog birinchi yozuvda yaratiladi
+        return result
+    for path in tracer.exporter._files():
+        with open(path, encoding="utf-8") as f:
+            result += [json.loads(line) for line in f]
+    return result
+
+
+def spans(request):
+    return request["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+
+def attrs(span):
+    return {a["key"]: a["value"] for a in span["attributes"]}
+
+
+@pytest.fixture
+def traces():
+    """Qo‘lda ochilgan trace — handler kontekstisiz spanlarni yig‘ish uchun."""
+    trace = tracing.Trace({})
+    token = tracing.current_traces.set((trace,))
+    yield trace
+    tracing.current_traces.reset(token)
+
+
+def test_spans_are_noop_without_trace():
+    assert tracing.current_traces.get() is None
+    with tracing.trace_span("filter.links") as span:
+        span.set("x", 1)
+    assert span is tracing.NO_SPAN
+
+
+def test_spans_nest_and_record_errors(traces):
+    with tracing.trace_span("moderate", **{"batch.size": 2}) as outer:
+        with tracing.trace_span("filter.links") as inner:
+            inner.set("hit", True)
+        with pytest.raises(ValueError):
+            with tracing.trace_span("db.save_join_message"):
+                raise ValueError("x")
+
+    names = [s.name for s in traces.spans]
+    assert names == ["filter.links", "db.save_join_message", "moderate"]
+    assert traces.spans[0].parent is outer and outer.parent is None
+    assert traces.spans[1].error == "ValueError"
+    assert traces.spans[0].attrs == {"hit": True}
+    assert all(s.end >= s.start for s in traces.spans)
+    assert tracing.current_span.get() is None
+
+
+def test_span_count_is_bounded(traces):
+    for _ in range(tracing.TRACE_MAX_SPANS + 10):
+        with tracing.trace_span("x"):
+            pass
+    assert len(traces.spans) == tracing.TRACE_MAX_SPANS
+
+
+def test_storage_writes_are_traced(traces, monkeypatch):
+    monkeypatch.setattr(bot, "db", LazyStorage(MemoryStorage))
+    bot.db.set_banned_keywords(-5, ["kazino"])
+    bot.db.get_group(-5)
+    assert [s.name for s in traces.spans] == ["db.set_banned_keywords"]
+
+
+def test_otlp_request_shape(traces):
+    traces.root.attrs.update({"update.id": 5, "chat.id": -5, "sampling": "slow"})
+    with tracing.trace_span("moderate", ratio=0.5):
+        with tracing.trace_span("bot_api.deleteMessage"):
+            pass
+    traces.root.end = bot.time.time_ns()
+
+    req = tracing.otlp_request([traces])
+    resource = req["resourceSpans"][0]["resource"]
+    assert attrs(resource) == {"service.name": {"stringValue": tracing.TRACE_SERVICE_NAME}}
+    root, api, moderate = spans(req)
+    assert root["name"] == "update" and root["kind"] == 2 and "parentSpanId" not in root
+    assert attrs(root) == {"update.id": {"intValue": "5"}, "chat.id": {"intValue": "-5"},
+                           "sampling": {"stringValue": "slow"}}
+    assert api["kind"] == 3 and api["parentSpanId"] == moderate["spanId"]
+    assert moderate["kind"] == 1 and moderate["parentSpanId"] == root["spanId"]
+    assert attrs(moderate) == {"ratio": {"doubleValue": 0.5}}
+    assert {s["traceId"] for s in (root, api, moderate)} == {traces.trace_id}
+    assert len(traces.trace_id) == 32 and len(root["spanId"]) == 16
+    assert int(root["endTimeUnixNano"]) >= int(root["startTimeUnixNano"])
+    assert root["status"] == {}
+
+
+def test_sampling_decision(tmp_path, fake_bot):
+    update = make_update(make_msg(fake_bot, -5, 2, "salom"))
+
+    def finish(tracer):
+        trace = tracer.start(update)
+        tracer.finish(trace)
+        tracing.current_traces.set(None)
+        return trace
+
+    quiet = make_tracer(tmp_path / "a", sample_rate=0.0)
+    finish(quiet)
+    assert (quiet.started, quiet.exported) == (1, 0)
+    assert exported(quiet) == []
+
+    sampled = make_tracer(tmp_path / "b", sample_rate=1.0)
+    trace = finish(sampled)
+    assert trace.root.attrs["sampling"] == "sampled"
+    assert trace.root.attrs["update.type"] == "message"
+    assert trace.root.attrs["chat.id"] == -5
+
+    slow = make_tracer(tmp_path / "c", slow_ms=0.0)
+    finish(slow)
+    assert (slow.exported, slow.slow) == (1, 1)
+    (req,) = exported(slow)
+    assert attrs(spans(req)[0])["sampling"] == {"stringValue": "slow"}
+
+
+def test_moderated_update_exports_one_trace(tmp_path, app, fake_bot, monkeypatch):
+    tracer = make_tracer(tmp_path, slow_ms=0.0)
+    monkeypatch.setattr(tracing, "tracer", tracer)
+    fake_bot.admins[-5] = []
+    msg = make_msg(fake_bot, -5, 2, "t.me/reklama")
+
+    async def main():
+        update, context = make_update(msg), make_context(app)
+        await tracing.trace_start_handler(update, context)
+        await bot.membership_and_adblock_handler(update, context)
+        await tracing.trace_finish_handler(update, context)  # partiya hali tugamagan
+        assert tracer.exported == 0
+        await app.drain()
+
+    run(main())
+    assert tracer.exported == 1
+    (req,) = exported(tracer)
+    by_name = {s["name"]: s for s in spans(req)}
+    assert {"update", "moderate", "settings.load", "filter.links"} <= set(by_name)
+    assert by_name["settings.load"]["parentSpanId"] == by_name["moderate"]["spanId"]
+    assert attrs(by_name["moderate"])["batch.size"] == {"intValue": "1"}
+    assert attrs(by_name["update"])["message.id"] == {"intValue": str(msg.message_id)}
+
+
+def test_handlers_wrap_all_groups(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "tracer", make_tracer(tmp_path))
+    application = bot.build_application()
+    first = [h.callback for h in application.handlers[-3] if isinstance(h, TypeHandler)]
+    last = [h.callback for h in application.handlers[1001] if isinstance(h, TypeHandler)]
+    assert first == [tracing.trace_start_handler] and last == [tracing.trace_finish_handler]
+    assert min(application.handlers) == -3 and max(application.handlers) == 1001
+
+
+def test_handlers_absent_when_disabled(monkeypatch):
+    monkeypatch.setattr(tracing, "tracer", make_tracer(""))
+    application = bot.build_application()
+    assert -3 not in application.handlers and 1001 not in application.handlers
@@ -0,0 +1,75 @@
+import datetime
+
+import bot
+import moderation
+from conftest import run
+from fakes import make_msg
+
+
+def new_pipeline():
+    return moderation.FilterPipeline([moderation.FloodFilter(), moderation.LinkFilter(), moderation.KeywordFilter()], bot.pipeline_admin_ids)
+
+
+def test_repeated_text_uses_cached_verdict(fake_bot):
+    pipeline = new_pipeline()
+    g = bot.load_group_settings(-5)
+    first = [make_msg(fake_bot, -5, 2, "t.me/reklama"), make_msg(fake_bot, -5, 3, "salom")]
+    run(pipeline.run(fake_bot, first[0].chat, g, first))
+    calls = pipeline.by_name["links"].calls
+
+    again = [make_msg(fake_bot, -5, 4, "t.me/reklama"), make_msg(fake_bot, -5, 5, "salom")]
+    verdicts = run(pipeline.run(fake_bot, again[0].chat, g, again))
+
+    assert [(m.from_user.id, v.reason) for m, v in verdicts] == [(4, "link")]
+    assert pipeline.by_name["links"].calls == calls
+    assert moderation.verdict_cache.hits == 2
+
+
+def test_unchanged_edit_skips_flood_and_content_filters(fake_bot):
+    pipeline = new_pipeline()
+    g = bot.load_group_settings(-5)
+    msg = make_msg(fake_bot, -5, 2, "salom", message_id=10)
+    run(pipeline.run(fake_bot, msg.chat, g, [msg]))
+
+    edited = make_msg(fake_bot, -5, 2, "salom", message_id=10,
+                      edit_date=datetime.datetime.now(datetime.timezone.utc))
+    assert run(pipeline.run(fake_bot, edited.chat, g, [edited])) == []
+    assert pipeline.by_name["flood"].calls == 1
+    assert pipeline.by_name["links"].calls == 1
+
+
+def test_edit_adding_link_is_caught(fake_bot):
+    pipeline = new_pipeline()
+    g = bot.load_group_settings(-5)
+    msg = make_msg(fake_bot, -5, 2, "salom", message_id=10)
+    run(pipeline.run(fake_bot, msg.chat, g, [msg]))
+
+    edited = make_msg(fake_bot, -5, 2, "salom t.me/reklama", message_id=10,
+                      edit_date=datetime.datetime.now(datetime.timezone.utc))
+    verdicts = run(pipeline.run(fake_bot, edited.chat, g, [edited]))
+    assert [v.reason for _, v in verdicts] == ["link"]
+
+
+def test_settings_change_invalidates_cache(fake_bot):
+    pipeline = new_pipeline()
+    msg = make_msg(fake_bot, -5, 2, "arzon kredit")
+    assert run(pipeline.run(fake_bot, msg.chat, bot.load_group_settings(-5), [msg])) == []
+
+    bot.db.set_banned_keywords(-5, ["kredit"])
+    fake_bot.admins[-5] = []
+    msg = make_msg(fake_bot, -5, 3, "arzon kredit")
+    verdicts = run(pipeline.run(fake_bot, msg.chat, bot.load_group_settings(-5), [msg]))
+    assert [(v.reason, v.detail) for _, v in verdicts] == [("keyword", "kredit")]
+
+
+def test_cache_is_bounded_per_chat_and_in_chats():
+    cache = moderation.VerdictCache(per_chat=2, max_chats=2)
+    for key in ("a", "b", "c"):
+        cache.set(-5, key, None)
+    assert cache.get(-5, "a") is moderation.VERDICT_MISS
+    assert cache.get(-5, "c") is None
+
+    cache.set(-6, "x", None)
+    cache.set(-7, "x", None)
+    assert cache.get(-5, "c") is moderation.VERDICT_MISS
+    assert cache.get(-7, "x") is None
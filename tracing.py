@@ -0,0 +1,597 @@
+"""
+Kuzatuv: yangilanishlar jurnali (record / replay), moderatsiya audit
+jurnali va yangilanishlar trace’i (OpenTelemetry JSON).
+
+Hammasi xotirada buferlanadi va bot.py dagi job’lar orqali diskka yoki
+collector’ga yoziladi. Yoqilmagan bo‘lsa (muhit o‘zgaruvchilari bo‘sh) —
+hech narsa yozilmaydi.
+"""
+
+import asyncio
+import contextvars
+import gzip
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from telegram import Message, Update
+from telegram.ext import ContextTypes
+
+import sharding
+from sharding import current_bot
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Sozlamalar
+# ---------------------------
+
+# Yangilanishlar jurnali (ishlab chiqarish trafigini qayta o‘ynatish uchun)
+JOURNAL_DIR = os.environ.get("BOT_JOURNAL_DIR", "")  # bo‘sh — jurnal yozilmaydi
+JOURNAL_MAX_BYTES = 64 * 1024 * 1024  # bitta fayl hajmi (siqilgan), undan keyin yangi fayl
+JOURNAL_KEEP_FILES = 20        # eng eski fayllar o‘chiriladi
+JOURNAL_BUFFER_MAX = 100_000   # disk ulgurmasa, ortig‘i tashlab yuboriladi
+
+# Moderatsiya audit jurnali (o‘chirishlar, ogohlantirishlar, a’zolik tasdig‘i)
+AUDIT_DIR = os.environ.get("BOT_AUDIT_DIR", "")  # masalan, "audit"; bo‘sh — yozilmaydi
+AUDIT_MAX_BYTES = 16 * 1024 * 1024
+AUDIT_KEEP_FILES = 30
+AUDIT_BUFFER_MAX = 50_000
+
+# Yangilanishlar trace’i (OTLP/JSON): katalog yoki http://127.0.0.1:4318/v1/traces
+TRACE_EXPORT = os.environ.get("BOT_TRACE", "")  # bo‘sh — trace yig‘ilmaydi
+TRACE_SAMPLE_RATE = float(os.environ.get("BOT_TRACE_SAMPLE", "0.01"))  # oddiy yangilanishlar ulushi
+TRACE_SLOW_MS = float(os.environ.get("BOT_TRACE_SLOW_MS", "1000"))     # bundan sekinlari doim yoziladi
+TRACE_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "telegram-bot")
+TRACE_MAX_SPANS = 256          # bitta trace’dagi spanlar, ortig‘i tashlanadi
+TRACE_MAX_BYTES = 32 * 1024 * 1024
+TRACE_KEEP_FILES = 10
+TRACE_BUFFER_MAX = 10_000      # eksport ulgurmasa, ortig‘i tashlab yuboriladi
+TRACE_POST_TIMEOUT = 5.0
+
+
+# -----------------------------------------
+# Yangilanishlar jurnali (record / replay)
+# -----------------------------------------
+# BOT_JOURNAL_DIR o‘rnatilsa, har bir kiruvchi Update JSON’i va har bir
+# Bot API chaqiruvining davomiyligi gzip JSONL fayllarga yoziladi:
+#   {"t": 1700000000.123, "u": {...update...}}
+#   {"t": 1700000000.456, "api": "deleteMessage", "ms": 41.2, "code": 200}
+# ("code": null — tarmoq xatosi yoki timeout; "b" — qo‘shimcha bot ID si,
+# asosiy bot yangilanishlarida yo‘q). Fayl JOURNAL_MAX_BYTES ga
+# yetganda yangisi ochiladi, eng eskilari o‘chiriladi. replay.py jurnalni
+# soxta Bot API’ga qarshi qayta o‘ynatadi.
+
+class RotatingJsonl:
+    """Buferlangan JSONL fayllar.
+
+    Yozuvlar xotirada yig‘iladi va flush() da alohida oqimda faylga
+    qo‘shiladi (event loop disk kutmaydi). Fayl max_bytes ga yetganda
+    yangisi ochiladi, eng eskilari o‘chiriladi. Sharding rejimida har bir
+    ishchi o‘z fayllariga yozadi.
+    """
+
+    prefix = "log-"
+    ext = ".jsonl"
+
+    def __init__(self, directory: str, max_bytes: int, keep_files: int, buffer_max: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep_files = keep_files
+        self.buffer_max = buffer_max
+        self.dropped = 0
+        self._buf: List[dict] = []
+        self._path: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _append(self, entry: dict):
+        if len(self._buf) >= self.buffer_max:
+            self.dropped += 1
+            return
+        self._buf.append(entry)
+
+    def _suffix(self) -> str:
+        return (f".shard{sharding.SHARD_INDEX}" if sharding.SHARD_COUNT > 1 else "") + self.ext
+
+    def _files(self, own: bool = True) -> List[str]:
+        suffix = self._suffix() if own else self.ext
+        names = sorted(
+            n for n in os.listdir(self.directory)
+            if n.startswith(self.prefix) and n.endswith(suffix)
+            and (not own or sharding.SHARD_COUNT > 1 or ".shard" not in n)
+        )
+        return [os.path.join(self.directory, n) for n in names]
+
+    def _open(self, path: str):
+        return open(path, "a", encoding="utf-8")
+
+    def _rotated(self, path: str):
+        """Fayl yopildi (alohida oqimda chaqiriladi)."""
+
+    def _written(self, path: str, entries: List[dict]):
+        """Yozuvlar faylga tushdi (alohida oqimda chaqiriladi)."""
+
+    def _remove(self, path: str):
+        os.remove(path)
+
+    def _write(self, entries: List[dict]):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._path is None or not os.path.exists(self._path) or os.path.getsize(self._path) >= self.max_bytes:
+            if self._path is not None and os.path.exists(self._path):
+                self._rotated(self._path)
+            now = time.time()
+            while True:
+                stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+                path = os.path.join(self.directory, self.prefix + stamp + self._suffix())
+                if not os.path.exists(path):
+                    break
+                # Shu millisekundda fayl ochilgan (yopilgani qayta ochilmasin) —
+                # keyingisi; nomlar tartibi vaqt tartibi bo‘lib qoladi
+                now += 0.001
+            self._path = path
+            # Yangi fayl bilan birga keep_files ta qoladi
+            old_files = self._files()
+            for old in old_files[:max(0, len(old_files) - self.keep_files + 1)]:
+                self._remove(old)
+        with self._open(self._path) as f:
+            f.write("".join(
+                json.dumps(e, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+                for e in entries
+            ))
+        self._written(self._path, entries)
+
+    async def flush(self):
+        if not self._buf:
+            return
+        entries, self._buf = self._buf, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, entries)
+        except OSError as e:
+            logger.error(f"{self.prefix}* fayliga yozilmadi: {e}")
+
+
+class UpdateJournal(RotatingJsonl):
+    prefix = "journal-"
+    ext = ".jsonl.gz"
+
+    def record_update(self, update: Update):
+        entry = {"t": round(time.time(), 3), "u": update.to_dict()}
+        if current_bot.get():
+            entry["b"] = current_bot.get()  # qo‘shimcha bot
+        self._append(entry)
+
+    def record_api(self, method: str, duration: float, code: Optional[int]):
+        if method == "getUpdates":
+            return  # long polling — o‘lchashga aloqasi yo‘q
+        self._append({"t": round(time.time(), 3), "api": method, "ms": round(duration * 1000, 1), "code": code})
+
+    def _open(self, path: str):
+        # gzip fayliga qo‘shimcha a’zo (member) sifatida qo‘shiladi — o‘qishda bitta oqim
+        return gzip.open(path, "at", encoding="utf-8", compresslevel=6)
+
+
+update_journal = UpdateJournal(JOURNAL_DIR, JOURNAL_MAX_BYTES, JOURNAL_KEEP_FILES, JOURNAL_BUFFER_MAX)
+
+
+async def journal_update_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    update_journal.record_update(update)
+
+
+async def journal_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    await update_journal.flush()
+
+
+def read_journal(paths: List[str]):
+    """Jurnal yozuvlarini fayllar tartibida qaytaradi (buzilgan qatorlar tashlanadi)."""
+    for path in paths:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (OSError, EOFError) as e:
+            # To‘satdan to‘xtaganda oxirgi gzip a’zosi chala qolishi mumkin
+            logger.warning(f"Jurnal {path} oxirigacha o‘qilmadi: {e}")
+
+
+# -----------------------------------------
+# Moderatsiya audit jurnali
+# -----------------------------------------
+# Har bir o‘chirish, ogohlantirish va a’zolik tasdig‘i bitta JSON qator:
+#   {"t": ..., "action": "delete", "chat": -100..., "user": 42,
+#    "reason": "keyword", "detail": "kazino", "ms": 830.0, "ok": true}
+# ("ms" — xabar yuborilganidan o‘chirilgunicha). Fayllar yopilganda yonida
+# .idx fayli yoziladi: guruh -> soat -> "action:reason" -> [soni, ms].
+# /auditlog shu indekslar va joriy fayl xulosasidan javob beradi — jurnal
+# qayta o‘qilmaydi.
+
+class AuditLog(RotatingJsonl):
+    prefix = "audit-"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._summary: Dict[str, dict] = {}  # joriy fayl xulosasi
+        self._indexed = False
+
+    def record(self, action: str, chat_id: int, user_id: Optional[int], reason: Optional[str] = None,
+               detail=None, ms: Optional[float] = None, **extra):
+        if not self.enabled:
+            return
+        entry = {"t": round(time.time(), 3), "action": action, "chat": chat_id, "user": user_id}
+        if reason:
+            entry["reason"] = reason
+        if detail is not None:
+            entry["detail"] = detail
+        if ms is not None:
+            entry["ms"] = round(ms, 1)
+        entry.update(extra)
+        self._append(entry)
+
+    @staticmethod
+    def _summarize(summary: dict, entry: dict):
+        key = entry["action"] + (":" + entry["reason"] if "reason" in entry else "")
+        hours = summary.setdefault(str(entry["chat"]), {})
+        counter = hours.setdefault(str(int(entry["t"] // 3600)), {}).setdefault(key, [0, 0.0])
+        counter[0] += 1
+        counter[1] += entry.get("ms") or 0.0
+
+    @staticmethod
+    def _index_path(path: str) -> str:
+        return path + ".idx"
+
+    def _write_index(self, path: str, summary: dict):
+        with open(self._index_path(path), "w", encoding="utf-8") as f:
+            json.dump(summary, f, separators=(",", ":"))
+
+    def _index_orphans(self):
+        # Oldingi jarayon to‘satdan to‘xtagan bo‘lsa, oxirgi fayl indekssiz qoladi
+        for path in self._files():
+            if os.path.exists(self._index_path(path)):
+                continue
+            summary: dict = {}
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._summarize(summary, json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+            self._write_index(path, summary)
+
+    def _write(self, entries: List[dict]):
+        if not self._indexed:
+            os.makedirs(self.directory, exist_ok=True)
+            self._index_orphans()
+            self._indexed = True
+        super()._write(entries)
+
+    def _written(self, path: str, entries: List[dict]):
+        with self._lock:
+            for e in entries:
+                self._summarize(self._summary, e)
+
+    def _rotated(self, path: str):
+        with self._lock:
+            summary, self._summary = self._summary, {}
+        self._write_index(path, summary)
+
+    def _remove(self, path: str):
+        super()._remove(path)
+        if os.path.exists(self._index_path(path)):
+            os.remove(self._index_path(path))
+
+    def _chat_summary(self, chat_id: int, since: float) -> Dict[str, list]:
+        chat, since_hour = str(chat_id), int(since // 3600)
+        total: Dict[str, list] = {}
+
+        def merge(hours: dict):
+            for hour, counters in hours.items():
+                if int(hour) < since_hour:
+                    continue
+                for key, (n, ms) in counters.items():
+                    t = total.setdefault(key, [0, 0.0])
+                    t[0] += n
+                    t[1] += ms
+
+        if os.path.isdir(self.directory):
+            for path in self._files(own=False):
+                idx = self._index_path(path)
+                # Oxirgi yozuvi oraliqdan oldin bo‘lgan fayllar ochilmaydi
+                if not os.path.exists(idx) or os.path.getmtime(path) < since:
+                    continue
+                try:
+                    with open(idx, encoding="utf-8") as f:
+                        merge(json.load(f).get(chat, {}))
+                except (OSError, ValueError):
+                    continue
+        with self._lock:
+            merge(self._summary.get(chat, {}))
+        return total
+
+    async def chat_summary(self, chat_id: int, hours: float) -> Dict[str, list]:
+        """"action:reason" -> [soni, ms yig‘indisi] — oxirgi `hours` soat (soat aniqligida)."""
+        since = time.time() - hours * 3600
+        return await asyncio.get_running_loop().run_in_executor(None, self._chat_summary, chat_id, since)
+
+
+audit_log = AuditLog(AUDIT_DIR, AUDIT_MAX_BYTES, AUDIT_KEEP_FILES, AUDIT_BUFFER_MAX)
+
+
+async def audit_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    await audit_log.flush()
+
+
+# -----------------------------------------
+# Tracing (OpenTelemetry JSON)
+# -----------------------------------------
+# Metrikalar p99 oshganini ko‘rsatadi, lekin aynan shu xabar nega 4 soniya
+# kutganini emas. BOT_TRACE o‘rnatilsa, har bir yangilanish uchun trace
+# yig‘iladi: ildiz span "update" — handler qabul qilganidan moderatsiya
+# tugagunicha, ichida "moderate" (partiya), "settings.load", "admin.check",
+# har bir filtr ("filter.<nomi>"), har bir Bot API chaqiruvi
+# ("bot_api.<metod>") va bazaga yozishlar ("db.<metod>").
+#
+# Qaror trace tugagach qabul qilinadi: TRACE_SLOW_MS dan sekinlari doim,
+# qolganlari TRACE_SAMPLE_RATE ulushida yoziladi ("sampling" atributi —
+# "slow" yoki "sampled"). Format — OTLP/JSON (ExportTraceServiceRequest):
+#  - katalog — traces-*.jsonl, har qatorda bitta so‘rov (collector’ning
+#    otlpjsonfile receiver’i yoki jq bilan o‘qiladi);
+#  - http(s) manzil — collector’ga POST (masalan http://127.0.0.1:4318/v1/traces).
+#
+# Partiyadagi xabarlar bitta moderate_chat_batch da tekshiriladi, shuning
+# uchun partiya spanlari undagi har bir xabar trace’iga qo‘shiladi.
+# Yoqilmagan bo‘lsa trace_span() hech narsa qilmaydigan obyekt qaytaradi.
+
+current_traces = contextvars.ContextVar("current_traces", default=None)
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attrs", "parent", "start", "end", "span_id", "error", "_token")
+
+    def __init__(self, name: str, attrs: dict, parent: Optional["Span"]):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent  # None — trace ildizi
+        self.span_id = os.urandom(8).hex()
+        self.start = time.time_ns()
+        self.end = 0
+        self.error: Optional[str] = None
+        self._token = None
+
+    def set(self, key: str, value):
+        self.attrs[key] = value
+
+    def __enter__(self):
+        self._token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.time_ns()
+        current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        for trace in current_traces.get() or ():
+            trace.add(self)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def set(self, key: str, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def trace_span(name: str, **attrs):
+    if current_traces.get() is None:
+        return NO_SPAN
+    return Span(name, attrs, current_span.get())
+
+
+def traced(name: str, fn):
+    def call(*args, **kwargs):
+        with trace_span(name):
+            return fn(*args, **kwargs)
+    return call
+
+
+class Trace:
+    __slots__ = ("trace_id", "root", "spans", "deferred")
+
+    def __init__(self, attrs: dict):
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span("update", attrs, None)
+        self.spans: List[Span] = []
+        self.deferred = False  # moderatsiya partiyasi tugatadi
+
+    def add(self, span: Span):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+
+
+def _otlp_value(v) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def _otlp_attrs(attrs: dict) -> list:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items()]
+
+
+def _otlp_span(trace: Trace, span: Span) -> dict:
+    d = {
+        "traceId": trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        # 3 — CLIENT (tashqi so‘rov), 2 — SERVER (yangilanish), 1 — INTERNAL
+        "kind": 3 if span.name.startswith("bot_api.") else 2 if span is trace.root else 1,
+        "startTimeUnixNano": str(span.start),
+        "endTimeUnixNano": str(span.end),
+        "attributes": _otlp_attrs(span.attrs),
+        "status": {"code": 2, "message": span.error} if span.error else {},
+    }
+    parent = span.parent or (trace.root if span is not trace.root else None)
+    if parent is not None:
+        d["parentSpanId"] = parent.span_id
+    return d
+
+
+def otlp_request(traces: List[Trace]) -> dict:
+    """ExportTraceServiceRequest (OTLP/JSON)."""
+    resource = {"service.name": TRACE_SERVICE_NAME}
+    if sharding.SHARD_COUNT > 1:
+        resource["bot.shard"] = sharding.SHARD_INDEX
+    return {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attrs(resource)},
+        "scopeSpans": [{
+            "scope": {"name": "bot"},
+            "spans": [_otlp_span(t, s) for t in traces for s in (t.root, *t.spans)],
+        }],
+    }]}
+
+
+class TraceExporter(RotatingJsonl):
+    prefix = "traces-"
+
+    def __init__(self, target: str, *args):
+        self.url = target if target.startswith(("http://", "https://")) else ""
+        super().__init__("" if self.url else target, *args)
+        self.post_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory or self.url)
+
+    def export(self, trace: Trace):
+        self._append(otlp_request([trace]))
+
+    async def flush(self):
+        if not self.url:
+            return await super().flush()
+        if not self._buf:
+            return
+        entries, self._buf = self._buf, []
+        body = {"resourceSpans": [rs for e in entries for rs in e["resourceSpans"]]}
+        try:
+            async with httpx.AsyncClient(timeout=TRACE_POST_TIMEOUT) as client:
+                r = await client.post(self.url, json=body)
+            if r.status_code >= 300:
+                self.post_errors += 1
+                logger.warning(f"Trace collector {r.status_code} qaytardi")
+        except httpx.HTTPError as e:
+            self.post_errors += 1
+            logger.warning(f"Trace’lar collector’ga yuborilmadi: {e}")
+
+
+class Tracer:
+    """Yangilanish trace’lari: boshlash, partiyaga uzatish, tugatish va tanlash."""
+
+    def __init__(self, exporter: TraceExporter, sample_rate: float, slow_ms: float):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_ns = int(slow_ms * 1_000_000)
+        self.started = 0
+        self.exported = 0
+        self.slow = 0
+        self._deferred: Dict[int, Trace] = {}  # id(Message) -> Trace
+        self._random = random.Random()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter.enabled
+
+    def start(self, update: Update) -> Trace:
+        attrs = {"update.id": update.update_id}
+        for kind in ("message", "edited_message", "callback_query", "chat_member", "my_chat_member"):
+            if getattr(update, kind) is not None:
+                attrs["update.type"] = kind
+                break
+        chat = update.effective_chat
+        if chat is not None:
+            attrs["chat.id"] = chat.id
+        msg = update.message or update.edited_message
+        if msg is not None:
+            attrs["message.id"] = msg.message_id
+            # Telegram vaqti soniya aniqligida — navbatda kutish taxminan
+            sent = (msg.edit_date or msg.date).timestamp()
+            attrs["update.age_ms"] = max(0, round((time.time() - sent) * 1000))
+        if current_bot.get():
+            attrs["bot.id"] = current_bot.get()
+        trace = Trace(attrs)
+        self.started += 1
+        current_traces.set((trace,))
+        current_span.set(None)
+        return trace
+
+    def defer(self, msg: Message):
+        """Trace xabar bilan moderatsiya partiyasiga o‘tadi."""
+        traces = current_traces.get()
+        if traces:
+            traces[0].deferred = True
+            self._deferred[id(msg)] = traces[0]
+
+    def take(self, msgs: List[Message]) -> Tuple[Trace, ...]:
+        if not self._deferred:
+            return ()
+        return tuple(t for t in (self._deferred.pop(id(m), None) for m in msgs) if t is not None)
+
+    def finish(self, trace: Trace):
+        root = trace.root
+        root.end = time.time_ns()
+        if root.end - root.start >= self.slow_ns:
+            root.attrs["sampling"] = "slow"
+            self.slow += 1
+        elif self._random.random() < self.sample_rate:
+            root.attrs["sampling"] = "sampled"
+        else:
+            return
+        self.exporter.export(trace)
+        self.exported += 1
+
+
+tracer = Tracer(
+    TraceExporter(TRACE_EXPORT, TRACE_MAX_BYTES, TRACE_KEEP_FILES, TRACE_BUFFER_MAX),
+    TRACE_SAMPLE_RATE,
+    TRACE_SLOW_MS,
+)
+
+
+async def trace_start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    tracer.start(update)
+
+
+async def trace_finish_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    traces = current_traces.get()
+    if traces and not traces[0].deferred:
+        tracer.finish(traces[0])
+    current_traces.set(None)
+
+
+async def trace_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    await tracer.exporter.flush()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Reklama klassifikatorini oflayn o‘rgatish (NumPy kerak).
+
+Ma’lumot manbalari (birgalikda ishlatish mumkin):
+ - --journal + --audit: yangilanishlar jurnalidagi guruh xabarlari va audit
+   jurnalidagi o‘chirishlar (chat, msg) bo‘yicha birlashtiriladi. Havola,
+   kalit so‘z, spam yoki klassifikator sababli o‘chirilgan xabar — reklama;
+   umuman o‘chirilmagan xabar — oddiy. A’zolik, flood va media sababli
+   o‘chirilganlar mazmunga bog‘liq emas — tashlab yuboriladi;
+ - --positive / --negative: har qatorda bitta matn (qo‘lda yig‘ilgan misollar).
+
+Model — multinomial naive Bayes: moderation.ngram_indices() bilan xeshlangan belgi
+n-grammalari bo‘yicha log-nisbat og‘irliklari va oxirida bias. Natija
+.npy fayl (float32, shakli 2**bits + 1), bot uni mmap bilan ochadi
+(BOT_CLASSIFIER). --holdout qismi bo‘yicha aniqlik va to‘liqlik chiqariladi,
+yakuniy model esa barcha ma’lumotda o‘rgatiladi.
+
+Ishga tushirish:
+    python train_classifier.py --journal journal/ --audit audit/
+    python train_classifier.py --positive ads.txt --negative chat.txt --out ad_classifier.npy
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+
+import moderation
+import tracing
+
+if moderation.np is None:
+    raise SystemExit("NumPy kerak. O‘rnatish: pip install numpy")
+np = moderation.np
+
+AD_REASONS = {"link", "keyword", "spam", "classifier"}
+
+
+# ---------------------------
+# Ma’lumotlarni yig‘ish
+# ---------------------------
+
+def journal_paths(paths):
+    result = []
+    for p in paths:
+        if os.path.isdir(p):
+            result += sorted(glob.glob(os.path.join(p, "journal-*.jsonl.gz")))
+        else:
+            result.append(p)
+    return result
+
+
+def load_audit(directory: str):
+    """(chat, msg) -> o‘chirish sababi."""
+    deleted = {}
+    for path in sorted(glob.glob(os.path.join(directory, "audit-*.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    continue
+                if e.get("action") == "delete" and "msg" in e:
+                    deleted[(e["chat"], e["msg"])] = e.get("reason", "")
+    return deleted
+
+
+def load_journal_examples(paths, deleted):
+    examples = {}
+    for entry in tracing.read_journal(journal_paths(paths)):
+        u = entry.get("u")
+        msg = u and (u.get("message") or u.get("edited_message"))
+        if not msg or msg.get("chat", {}).get("type") not in ("group", "supergroup"):
+            continue
+        text = msg.get("text") or msg.get("caption")
+        if not text:
+            continue
+        key = (msg["chat"]["id"], msg["message_id"])
+        reason = deleted.get(key)
+        if reason is None:
+            examples[key] = (text, 0)
+        elif reason in AD_REASONS:
+            examples[key] = (text, 1)
+        else:
+            examples.pop(key, None)
+    return list(examples.values())
+
+
+def load_lines(path: str, label: int):
+    with open(path, encoding="utf-8") as f:
+        return [(line.strip(), label) for line in f if line.strip()]
+
+
+# ---------------------------
+# O‘rgatish va baholash
+# ---------------------------
+
+def train(examples, bits: int, alpha: float):
+    dim = 1 << bits
+    counts = [np.zeros(dim), np.zeros(dim)]
+    docs = [0, 0]
+    for text, label in examples:
+        counts[label] += np.bincount(moderation.ngram_indices(text, bits), minlength=dim)
+        docs[label] += 1
+    if not docs[0] or not docs[1]:
+        raise SystemExit("Ikkala sinfdan ham misollar kerak (reklama va oddiy)")
+    neg, pos = counts
+    w = np.log((pos + alpha) / (pos.sum() + alpha * dim)) - np.log((neg + alpha) / (neg.sum() + alpha * dim))
+    bias = np.log(docs[1] / docs[0])
+    return np.append(w, bias).astype(np.float32), docs
+
+
+def evaluate(weights, bits: int, examples):
+    clf = moderation.AdClassifier()
+    clf.weights, clf.bits = weights, bits
+    scores = clf.score_many([t for t, _ in examples])
+    labels = [y for _, y in examples]
+    print(f"Tekshiruv to‘plami: {len(examples)} ta (reklama {sum(labels)})")
+    for threshold in (0.5, 0.8, 0.9, 0.95):
+        tp = sum(1 for p, y in zip(scores, labels) if p >= threshold and y)
+        fp = sum(1 for p, y in zip(scores, labels) if p >= threshold and not y)
+        fn = sum(1 for p, y in zip(scores, labels) if p < threshold and y)
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        print(f"  chegara {threshold:.2f}: aniqlik {precision:6.1%}  to‘liqlik {recall:6.1%}  "
+              f"noto‘g‘ri o‘chirish {fp}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--journal", nargs="*", default=[], help="jurnal fayllari yoki katalog")
+    parser.add_argument("--audit", default=tracing.AUDIT_DIR or "audit", help="audit jurnali katalogi")
+    parser.add_argument("--positive", action="append", default=[], help="reklama matnlari fayli")
+    parser.add_argument("--negative", action="append", default=[], help="oddiy matnlar fayli")
+    parser.add_argument("--out", default=moderation.CLASSIFIER_PATH)
+    parser.add_argument("--bits", type=int, default=moderation.CLASSIFIER_BITS)
+    parser.add_argument("--alpha", type=float, default=1.0, help="Laplace silliqlash")
+    parser.add_argument("--holdout", type=float, default=0.1)
+    args = parser.parse_args()
+
+    examples = []
+    if args.journal:
+        examples += load_journal_examples(args.journal, load_audit(args.audit))
+    for path in args.positive:
+        examples += load_lines(path, 1)
+    for path in args.negative:
+        examples += load_lines(path, 0)
+    if not examples:
+        raise SystemExit("Misollar topilmadi (--journal yoki --positive/--negative)")
+
+    random.Random(1).shuffle(examples)
+    n_test = int(len(examples) * args.holdout)
+    if n_test:
+        weights, _ = train(examples[n_test:], args.bits, args.alpha)
+        evaluate(weights, args.bits, examples[:n_test])
+
+    weights, docs = train(examples, args.bits, args.alpha)
+    np.save(args.out, weights)
+    print(f"Saqlandi: {args.out} (reklama {docs[1]}, oddiy {docs[0]}, {weights.nbytes // 1024} KB)")
+
+
+if __name__ == "__main__":
+    main()